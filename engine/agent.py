@@ -1,12 +1,16 @@
 import ast
 import asyncio
-import hashlib
 import json
 import random
+import threading
+import time
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from functools import wraps
 from os import getenv
-from typing import Any, AsyncIterable, Iterator, List
+from typing import TYPE_CHECKING, Any, AsyncIterable, Iterator, List
 
 from langchain_core.load.dump import dumpd
 from langchain_core.messages import (
@@ -14,31 +18,58 @@ from langchain_core.messages import (
     HumanMessage,
     SystemMessage,
     ToolMessage,
-    trim_messages,
 )
 from langchain_core.tools import BaseTool
-from langchain_google_vertexai import ChatVertexAI
-from langgraph.checkpoint.postgres import PostgresSaver
-from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
-from psycopg_pool import AsyncConnectionPool, ConnectionPool
-from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-from opentelemetry.instrumentation.langchain import LangchainInstrumentor
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.sdk.trace.sampling import ALWAYS_ON
-from vertexai.agent_engines import (
-    AsyncQueryable,
-    AsyncStreamQueryable,
-    Queryable,
-    StreamQueryable,
-)
 
-# from langgraph.prebuilt import create_react_agent
-# use custom graph without _validate_chat_history
-from engine.custom_react_agent import create_react_agent
+from engine.context_budget import MEMORY_PREFIX, ContextBudget, tool_schema_tokens
+from engine.history_scan import (
+    HistoryScan,
+    HistoryScans,
+    ToolCallIndex,
+    leading_system_messages,
+)
 from engine.log import logger
+from engine.message_store import HistoryWindow
+from engine.thread_summary import (
+    SummaryOptions,
+    ThreadSummaries,
+    aload_summary,
+    asave_summary,
+    asummarize,
+    dropped_count,
+    load_summary,
+    pending_batch,
+    summary_message,
+    with_summary,
+)
+from engine.token_count import default_counter
+from engine.utils.latency import LatencyStats
+
+# Heavy dependencies (Vertex AI client, OpenTelemetry SDK/exporter, Postgres savers
+# and pools, the graph) are imported where they are first used, so that unpickling
+# the agent and importing this module stay cheap. Measure with
+# `uv run python -m scripts.bench_startup`.
+if TYPE_CHECKING:
+    from langchain_google_vertexai import ChatVertexAI
+    from langgraph.checkpoint.postgres import PostgresSaver
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+# Savers moved to engine/checkpointer.py; still importable from here, loaded on access
+_CHECKPOINTER_NAMES = {
+    "COUNT_LEGACY_THREADS_SQL",
+    "IntVersionSaverMixin",
+    "IntVersionPostgresSaver",
+    "IntVersionSyncPostgresSaver",
+}
+
+
+def __getattr__(name):
+    if name in _CHECKPOINTER_NAMES:
+        from engine import checkpointer
+
+        return getattr(checkpointer, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Error monitoring utilities (safe fallback if not available)
 from engine.utils import (
@@ -66,132 +97,60 @@ from engine.utils import (
 )
 
 
-class IntVersionPostgresSaver(AsyncPostgresSaver):
-    """
-    Fixes compatibility issues for threads with pre-migration checkpoint history.
-
-    Two problems fixed on load via aget_tuple():
-
-    1. TypeError: '>' not supported between instances of 'str' and 'int'
-       LangGraph's get_next_version() returns strings, but pre-migration checkpoints stored
-       integer versions. Fix: override get_next_version() to always return integers, and
-       normalize any remaining string versions on load.
+@dataclass
+class _LoopResources:
+    """Async resources of one event loop (see Agent._loop_resources).
 
-    2. ValueError: Message dict must contain 'role' and 'content' keys
-       Pre-migration checkpoints stored messages using LangChain's dumpd() serialization
-       format ({"lc": 1, "type": "constructor", "kwargs": {...}}). The new langchain_core
-       no longer handles this format in convert_to_messages. Fix: deserialize those dicts
-       back into proper message objects using langchain_core.load.load() on load.
+    psycopg's AsyncConnectionPool, the saver's locks/futures and the Vertex AI gRPC
+    aio client can only be used from the loop that created them, so every loop
+    driving async_query / async_stream_query gets its own set.
     """
 
-    @staticmethod
-    def _safe_ns(ns: str) -> str:
-        """Return ns unchanged if short enough; otherwise return a stable 37-byte hash."""
-        max_bytes = int(getenv("NS_MAX_BYTES", "2500"))
-        prefix = getenv("NS_HASH_PREFIX", "hash:")
-        if len(ns.encode()) > max_bytes:
-            return prefix + hashlib.md5(ns.encode()).hexdigest()
-        return ns
-
-    @staticmethod
-    def _safe_version(v) -> str:
-        """Return version unchanged if short enough; otherwise return a stable 37-byte hash."""
-        max_bytes = int(getenv("NS_VERSION_MAX_BYTES", "2000"))
-        s = str(v)
-        if len(s.encode()) > max_bytes:
-            return "hash:" + hashlib.md5(s.encode()).hexdigest()
-        return s
-
-    def get_next_version(self, current, channel):
-        if current is None:
-            current_v = 0
-        elif isinstance(current, int):
-            # Strip the 16-digit random suffix that was appended on the previous write
-            # to recover the logical counter. Without this, every call appends 16 more
-            # digits to an already-giant integer, growing versions without bound.
-            s = str(current)
-            current_v = int(s[:-16]) if len(s) > 16 else current
-        else:
-            current_v = int(current.split(".")[0])
-        return int(f"{current_v + 1}{int(random.random() * 10**16):016}")
-
-    async def aput(self, config, checkpoint, metadata, new_versions):
-        safe_config = {
-            **config,
-            "configurable": {
-                **config["configurable"],
-                "checkpoint_ns": self._safe_ns(config["configurable"].get("checkpoint_ns", "")),
-            },
-        }
-        safe_new_versions = {k: self._safe_version(v) for k, v in new_versions.items()}
-        return await super().aput(safe_config, checkpoint, metadata, safe_new_versions)
-
-    async def aput_writes(self, config, writes, task_id, task_path=""):
-        safe_config = {
-            **config,
-            "configurable": {
-                **config["configurable"],
-                "checkpoint_ns": self._safe_ns(config["configurable"].get("checkpoint_ns", "")),
-            },
-        }
-        return await super().aput_writes(safe_config, writes, task_id, task_path)
-
-    async def aget_tuple(self, config):
-        from langchain_core.load import load as lc_load
-
-        safe_config = {
-            **config,
-            "configurable": {
-                **config["configurable"],
-                "checkpoint_ns": self._safe_ns(config["configurable"].get("checkpoint_ns", "")),
-            },
-        }
-        result = await super().aget_tuple(safe_config)
-        if result and result.checkpoint:
-            thread_id = config.get("configurable", {}).get("thread_id")
-
-            # Fix 1: normalize legacy string channel versions
-            cv = result.checkpoint.get("channel_versions", {})
-            if any(isinstance(v, str) for v in cv.values()):
-                result.checkpoint["channel_versions"] = {
-                    k: int(v.replace(".", "")) if isinstance(v, str) else v
-                    for k, v in cv.items()
-                }
-                vs = result.checkpoint.get("versions_seen", {})
-                result.checkpoint["versions_seen"] = {
-                    node: {
-                        c: int(ver.replace(".", "")) if isinstance(ver, str) else ver
-                        for c, ver in chans.items()
-                    }
-                    for node, chans in vs.items()
-                }
-                logger.info(f"[Checkpoint] Normalized legacy string versions for thread '{thread_id}'")
-
-            # Fix 2: deserialize legacy LangChain-serialized messages
-            # Pre-migration messages are stored as dumpd() dicts: {"lc": 1, "type": "constructor", ...}
-            # The new langchain_core no longer handles these in convert_to_messages.
-            channel_values = result.checkpoint.get("channel_values", {})
-            messages = channel_values.get("messages", [])
-            legacy_msgs = [m for m in messages if isinstance(m, dict) and m.get("lc") == 1]
-            if legacy_msgs:
-                try:
-                    channel_values["messages"] = [
-                        lc_load(m) if isinstance(m, dict) and m.get("lc") == 1 else m
-                        for m in messages
-                    ]
-                    logger.info(f"[Checkpoint] Deserialized {len(legacy_msgs)} legacy messages for thread '{thread_id}'")
-                except Exception as e:
-                    logger.error(f"[Checkpoint] Failed to deserialize legacy messages for thread '{thread_id}': {e}")
-
-        return result
+    pool: Any = None
+    checkpointer: Any = None
+    llm: Any = None
+    summary_llm: Any = None  # conversation summary model (see _update_thread_summary)
+    graph: Any = None
+    flight: Any = None  # in-flight setup shared by concurrent callers on this loop
+    ready: bool = False
+    # In-flight long-term memory fetches by thread_id (see Agent._long_term_memory_fetch)
+    memory_fetches: dict = field(default_factory=dict)
+
+
+# Checkpoint DDL runs once per process even when several loops set up concurrently
+_SCHEMA_LOCK = threading.Lock()
+
+# Long-term memory is fetched again when the cached copy is older than this
+MEMORY_CACHE_TTL_SECONDS = 300  # 5 minutes
+
+# Id of the long-term memory SystemMessage: every refresh replaces the same message,
+# also in the thread_messages store (upsert by message id)
+MEMORY_MESSAGE_ID = "long-term-memory"
+
+# psycopg_pool stats added to the conversation span (see connection_pool_report)
+POOL_SPAN_STATS = (
+    "pool_size",
+    "pool_available",
+    "requests_waiting",
+    "requests_queued",
+    "requests_wait_ms",
+    "usage_ms",
+    "connections_errors",
+    "connections_lost",
+    "requests_errors",
+)
 
 
-class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
+class Agent:
     """
     An agent for sync/async/streaming queries with state persisted in PostgreSQL.
 
     Components are initialized lazily on the first query.
 
+    Implements vertexai.agent_engines' Queryable, StreamQueryable, AsyncQueryable and
+    AsyncStreamQueryable. They are runtime-checkable protocols, matched by method
+    names, so they are not inherited (importing vertexai.agent_engines takes seconds).
+
     Database tables are automatically created when needed via checkpointer.setup()
     """
 
@@ -205,9 +164,24 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         include_thoughts: bool = True,
         thinking_budget: int = -1,
         otpl_service: str = "langgraph-eai-vX",
+        tool_snapshot: dict | None = None,
     ):
         self._model = model
         self._tools = tools or []
+        # MCP tools/list snapshot used instead of a live call when tools is empty
+        # (see engine/mcp_tools.py); kept in sync in the background after setup
+        self._tool_snapshot = tool_snapshot
+        self._tools_from_snapshot = False
+        self._tools_from_mcp = False
+        self._tool_refresh = None  # background task (see _refresh_tools_periodically)
+        self._tool_refresh_stats = {
+            "refreshes": 0,
+            "changes": 0,
+            "errors": 0,
+            "last_refresh_at": None,
+            "last_refresh_ms": None,
+            "last_error": None,
+        }
         self._system_prompt = system_prompt
         self._temperature = temperature
         self._include_thoughts = include_thoughts
@@ -222,12 +196,30 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         self._otlp_endpoint = getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT", "")
         self._otlp_header = getenv("OTEL_EXPORTER_OTLP_TRACES_HEADERS", "")
 
-        self._graph = None
-        self._checkpointer = None  # Store checkpointer instance
-        self._conn_pool = None  # Store async connection pool
-        self._setup_complete_async = False
+        # Async pool, checkpointer and graph per event loop: {loop: _LoopResources}
+        self._loops = {}
+        self._checkpoint_cache = None  # CheckpointCache shared by the loops (not picklable)
+        # Pre-model hook watermarks per thread (HistoryScans, not picklable)
+        self._history_scans = None
+        # Rolling conversation summaries (engine/thread_summary.py): options read on
+        # first use, ThreadSummaries (not picklable) and the running updates by thread
+        self._summary_options = None
+        self._thread_summaries = None
+        self._summary_tasks = {}
+        # query / stream_query
+        self._sync_graph = None
+        self._sync_checkpointer = None
+        self._sync_conn_pool = None
         self._setup_complete_sync = False
         self._opentelemetry_setup_complete = False
+        self._llm = None
+        self._checkpoint_schema_ready = False  # DDL already applied by the warm-up
+
+        # Startup breakdown (see startup_report): step -> ms, step -> error
+        self._startup_timings = {}
+        self._startup_errors = {}
+
+        self._setup_wait = None  # LatencyStats, created on first use (not picklable)
 
         # OpenTelemetry tracer e processor para shutdown
         self._tracer = None
@@ -237,6 +229,13 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         # Short-term memory limits - lazy loaded from env vars
         self._short_memory_time_limit = None
         self._short_memory_token_limit = None
+        # Model input budget (engine/context_budget.py) - lazy loaded from env vars;
+        # tokens of the system prompt and tool schemas, by tool catalogue; last
+        # allocation per thread for the conversation span
+        self._context_budget = None
+        self._context_counter = None
+        self._fixed_context_tokens = None
+        self._context_allocations = {}
 
         # Get user memory tool - lazy loaded
         self._user_memory_tool = None
@@ -249,6 +248,14 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
     def _set_up_opentelemetry(self):
         if self._opentelemetry_setup_complete:
             return
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.instrumentation.langchain import LangchainInstrumentor
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ALWAYS_ON
+
         provider = TracerProvider(
             resource=Resource.create({"service.name": self._otpl_service}),
             sampler=ALWAYS_ON,  # Garantir 100% de sampling
@@ -309,11 +316,284 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
                     "model.temperature": self._temperature,
                 }
             )
+            # Model input of the last call of the turn, by section (context.*)
+            allocation = self._context_allocations.pop(thread_id, None)
+            if allocation:
+                span.set_attributes(
+                    {f"context.{key}": value for key, value in allocation.items()}
+                )
+            # Pool pressure at the end of the turn, as span attributes (db.pool.async.*)
+            for pool, stats in self.connection_pool_report().items():
+                span.set_attributes(
+                    {
+                        f"db.pool.{pool}.{key}": stats.get(key, 0)
+                        for key in POOL_SPAN_STATS
+                    }
+                )
 
     def set_up(self):
-        """Mark that setup is needed - actual setup happens lazily."""
-        self._setup_complete_async = False
+        """Mark that setup is needed - actual setup happens lazily.
+
+        With AGENT_WARMUP=true the loop-independent part of it runs here instead of
+        on the first request (see _warm_up).
+        """
         self._setup_complete_sync = False
+        if getenv("AGENT_WARMUP", "false").lower() == "true":
+            self._warm_up()
+
+    def _warm_up(self) -> None:
+        """Initialize ahead of the first request: telemetry, MCP tools, checkpoint DDL,
+        plus one LLM and one database round trip.
+
+        Each step is bounded by AGENT_WARMUP_TIMEOUT_SECONDS and only logged on
+        failure, so a dependency that is down leaves that step to the lazy setup.
+        The connection pool, the async checkpointer and the graph are still created on
+        the first async call: AsyncPostgresSaver binds to the event loop serving it.
+        """
+        timeout = float(getenv("AGENT_WARMUP_TIMEOUT_SECONDS", "30"))
+        start = time.perf_counter()
+
+        self._warm_up_step("opentelemetry", self._set_up_opentelemetry, timeout)
+        if not self._tools:
+            tools = self._warm_up_step(
+                "mcp_tools", lambda: asyncio.run(self._load_mcp_tools()), timeout
+            )
+            if tools:
+                self._tools = tools
+        self._warm_up_step("checkpoint_schema", self._set_up_checkpoint_schema, timeout)
+        self._warm_up_step("llm", lambda: self._get_llm().invoke("ok"), timeout)
+
+        self._startup_timings["warmup"] = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"[Agent Setup] Warm-up finished: {self.startup_report()}")
+
+    def _warm_up_step(self, name: str, func, timeout: float):
+        """Run one warm-up step in a worker thread; returns its result or None on failure."""
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"warmup-{name}")
+        with self._startup_step(f"warmup.{name}"):
+            try:
+                return executor.submit(func).result(timeout=timeout)
+            except Exception as e:
+                self._startup_errors[name] = f"{type(e).__name__}: {e}"
+                logger.warning(f"[Agent Setup] Warm-up step '{name}' failed, left to lazy setup: {e!r}")
+                return None
+            finally:
+                # A step that timed out keeps running in the background; do not wait for it
+                executor.shutdown(wait=False)
+
+    @contextmanager
+    def _startup_step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._startup_timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def startup_report(self) -> dict:
+        """Duration (ms) of each warm-up / setup step done so far, warm-up failures and
+        how long callers waited for the async setup (see _ensure_async_setup)."""
+        return {
+            "timings_ms": dict(self._startup_timings),
+            "errors": dict(self._startup_errors),
+            "setup_wait_ms": self._setup_wait.summary() if self._setup_wait else {},
+        }
+
+    def _database_url(self) -> str:
+        return f"postgresql://{self._database_user}:{self._database_password}@{self._database_host}:{self._database_port}/{self._database_name}"
+
+    @staticmethod
+    def _pool_options(pool_class) -> dict:
+        """Connection pool settings shared by the async and sync checkpointer pools.
+
+        Sizes, wait timeout and connection lifetimes come from CHECKPOINT_POOL_*;
+        with CHECKPOINT_POOL_CHECK=true a connection is checked before it is handed
+        out, so one dropped by the PSC link or Cloud SQL is replaced instead of
+        failing the request.
+        """
+        from psycopg.rows import dict_row
+
+        options = {
+            "min_size": int(getenv("CHECKPOINT_POOL_MIN_SIZE", "1")),
+            "max_size": int(getenv("CHECKPOINT_POOL_MAX_SIZE", "10")),
+            "timeout": float(getenv("CHECKPOINT_POOL_TIMEOUT", "30")),
+            "max_lifetime": float(getenv("CHECKPOINT_POOL_MAX_LIFETIME", "3600")),
+            "max_idle": float(getenv("CHECKPOINT_POOL_MAX_IDLE", "600")),
+            "kwargs": {"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        }
+        if getenv("CHECKPOINT_POOL_CHECK", "true").lower() == "true":
+            options["check"] = pool_class.check_connection
+        return options
+
+    def connection_pool_report(self) -> dict:
+        """psycopg_pool statistics of the checkpointer pools (waiting clients, usage and
+        wait times, connection errors...), cumulative since the pool was opened.
+
+        Async pools are reported as "async", "async.1"... in event loop order.
+        """
+        pools = [resources.pool for resources in list(self._loops.values()) if resources.pool]
+        report = {
+            "async" if i == 0 else f"async.{i}": pool.get_stats() for i, pool in enumerate(pools)
+        }
+        if self._sync_conn_pool is not None:
+            report["sync"] = self._sync_conn_pool.get_stats()
+        return report
+
+    def _set_up_checkpoint_schema(self) -> None:
+        """Apply the checkpoint migrations over a short-lived sync connection (once,
+        whichever of the warm-up, the sync setup or an event loop gets here first).
+
+        The connection waits as long as a pooled one would (CHECKPOINT_POOL_TIMEOUT);
+        the warm-up bounds its own step separately.
+        """
+        import psycopg
+        from psycopg.rows import dict_row
+
+        from engine.checkpointer import IntVersionSyncPostgresSaver
+
+        timeout = max(1, round(float(getenv("CHECKPOINT_POOL_TIMEOUT", "30"))))
+        with _SCHEMA_LOCK:
+            if self._checkpoint_schema_ready:
+                return
+            with psycopg.connect(
+                self._database_url(),
+                autocommit=True,
+                prepare_threshold=0,
+                row_factory=dict_row,
+                connect_timeout=timeout,
+            ) as conn:
+                IntVersionSyncPostgresSaver(conn=conn).setup()
+            self._checkpoint_schema_ready = True
+
+    @staticmethod
+    def _excluded_tools() -> list:
+        excluded_tools = getenv("MCP_EXCLUDED_TOOLS", "")
+        return excluded_tools.split(",") if excluded_tools else []
+
+    async def _load_mcp_tools(self) -> list:
+        """Build the MCP tools from a tool snapshot if there is one, else from tools/list.
+
+        The runtime cache (MCP_TOOL_SNAPSHOT_PATH) is preferred over the snapshot taken
+        at deploy time, being at least as recent. MCP_TOOL_SNAPSHOT=false always asks
+        the server.
+        """
+        from engine.mcp_tools import (
+            build_tools,
+            fetch_tool_snapshot,
+            load_tool_snapshot,
+            save_tool_snapshot,
+        )
+
+        path = getenv("MCP_TOOL_SNAPSHOT_PATH", "")
+        if getenv("MCP_TOOL_SNAPSHOT", "true").lower() == "true":
+            snapshot = load_tool_snapshot(path) or self._tool_snapshot
+            if snapshot is not None:
+                self._tool_snapshot = snapshot
+                self._tools_from_snapshot = True
+                logger.info(
+                    f"[MCP Tools] Using tool snapshot {snapshot['version']} from "
+                    f"{snapshot['created_at']} ({len(snapshot['tools'])} tools)"
+                )
+                return build_tools(snapshot, exclude_tools=self._excluded_tools())
+
+        snapshot = await fetch_tool_snapshot()
+        save_tool_snapshot(snapshot, path)
+        self._tool_snapshot = snapshot
+        self._tools_from_snapshot = False
+        return build_tools(snapshot, exclude_tools=self._excluded_tools())
+
+    async def _refresh_tools(self) -> bool:
+        """List the MCP tools again and hot-swap the graph if the catalogue changed.
+
+        The new tools, bound model and graph of every event loop (and of the sync
+        path) are built first and each graph is replaced in one assignment: requests
+        already running keep the graph they started with. Failures keep the current
+        tools. Returns True if swapped.
+        """
+        from engine.mcp_tools import (
+            build_tools,
+            diff_tool_snapshots,
+            fetch_tool_snapshot,
+            save_tool_snapshot,
+        )
+
+        stats = self._tool_refresh_stats
+        start = time.perf_counter()
+        try:
+            live = await fetch_tool_snapshot()
+            save_tool_snapshot(live, getenv("MCP_TOOL_SNAPSHOT_PATH", ""))
+            self._tools_from_snapshot = False
+            current = self._tool_snapshot
+            changed = current is None or live["version"] != current["version"]
+            if changed:
+                diff = diff_tool_snapshots(current, live)
+                logger.warning(
+                    f"[MCP Tools] Catalogue changed "
+                    f"{current and current['version']} -> {live['version']} {diff}, "
+                    f"rebuilding the graph"
+                )
+                tools = build_tools(live, exclude_tools=self._excluded_tools())
+                for resources in list(self._loops.values()):
+                    if resources.graph is not None:
+                        resources.graph = self._create_react_agent(
+                            resources.checkpointer, tools=tools, llm=resources.llm
+                        )
+                if self._sync_graph is not None:
+                    self._sync_graph = self._create_react_agent(self._sync_checkpointer, tools=tools)
+                self._tools = tools
+                self._user_memory_tool = None  # resolved again from the new tools
+                self._tool_snapshot = live
+                stats["changes"] += 1
+        except Exception as e:
+            stats["errors"] += 1
+            stats["last_error"] = repr(e)
+            logger.warning(
+                f"[MCP Tools] Tool refresh failed, keeping catalogue "
+                f"{self._tool_snapshot and self._tool_snapshot['version']}: {e!r}"
+            )
+            return False
+        finally:
+            stats["refreshes"] += 1
+            stats["last_refresh_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            stats["last_refresh_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return changed
+
+    async def _refresh_tools_periodically(self, interval: float) -> None:
+        """Background refresher started by _set_up_async (MCP_TOOL_REFRESH_SECONDS).
+
+        Tools built from a snapshot are checked right away; with interval <= 0 that
+        is the only check.
+        """
+        if not self._tools_from_snapshot:
+            if interval <= 0:
+                return
+            await asyncio.sleep(interval)
+        while True:
+            await self._refresh_tools()
+            if interval <= 0:
+                return
+            await asyncio.sleep(interval * random.uniform(0.9, 1.1))
+
+    def tool_catalogue_report(self) -> dict:
+        """Version of the MCP tool catalogue in use and background refresh stats."""
+        snapshot = self._tool_snapshot
+        return {
+            "version": snapshot["version"] if snapshot else None,
+            "created_at": snapshot["created_at"] if snapshot else None,
+            "tools": len(self._tools),
+            "from_snapshot": self._tools_from_snapshot,
+            **self._tool_refresh_stats,
+        }
+
+    def _get_llm(self) -> "ChatVertexAI":
+        if self._llm is None:
+            from langchain_google_vertexai import ChatVertexAI
+
+            self._llm = ChatVertexAI(
+                model_name=self._model,
+                temperature=self._temperature,
+                include_thoughts=self._include_thoughts,
+                thinking_budget=self._thinking_budget,
+            )
+        return self._llm
 
     @interceptor(
         source=make_source(PRE_INVOKE, PRE_INVOKE_SANITIZE),
@@ -402,7 +682,9 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
                 if isinstance(message.content, list) and len(message.content) > 0:
                     message.content = message.content[0]
                     logger.debug(f"[Tool Execution] Normalized list response to single item for tool: {message.name if hasattr(message, 'name') else 'UNKNOWN'}")
-                
+                # Counted once, persisted with the message
+                default_counter().count(message)
+
                 updates.append(message)
                 
                 # Log tool execution result
@@ -437,6 +719,7 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
             and "timestamp" not in last_message.additional_kwargs
         ):
             last_message.additional_kwargs["timestamp"] = current_time
+            default_counter().count(last_message)  # from usage_metadata when available
             # Retorna apenas a mensagem modificada
             return {"messages": [last_message]}
 
@@ -462,6 +745,19 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
 
         return self._short_memory_time_limit, self._short_memory_token_limit
 
+    def _get_history_window(self) -> HistoryWindow:
+        """History window pushed down to the checkpointer's message store.
+
+        CHECKPOINT_HISTORY_* variables take precedence; when none is set the window
+        mirrors the short-term memory limits, so the database already returns (a
+        superset of) what _filter_short_term_memory keeps instead of the full thread.
+        """
+        window = HistoryWindow.from_env()
+        if window.is_unbounded:
+            time_limit, token_limit = self._get_short_memory_limits()
+            window = HistoryWindow(max_age_seconds=time_limit, max_tokens=token_limit)
+        return window
+
     def _get_user_memory_tool(self):
         """Lazy load the user memory tool from the tools list."""
         if self._user_memory_tool is None:
@@ -470,16 +766,21 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
             )
         return self._user_memory_tool
 
-    def _ensure_complete_tool_pairs(self, filtered_messages, full_messages, logger):
+    def _ensure_complete_tool_pairs(
+        self, filtered_messages, full_messages, logger, scan: HistoryScan | None = None
+    ):
         """Ensure that all tool calls have corresponding tool responses and vice versa.
 
         This prevents errors when token filtering breaks tool call/response pairs.
-        Instead of removing orphaned messages, we add missing pairs from the full history.
+        Instead of removing orphaned messages, we add missing pairs from the full history,
+        found through the ToolCallIndex of the thread's HistoryScan, and keep the
+        messages in history order.
 
         Args:
             filtered_messages: Messages after token filtering
             full_messages: All messages from the database (complete history)
             logger: Logger instance
+            scan: HistoryScan of the thread, up to date with full_messages
 
         Returns:
             List of messages with complete tool pairs
@@ -487,24 +788,10 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         if not filtered_messages:
             return filtered_messages
 
-        # Collect all tool call IDs that have calls in filtered messages
-        tool_calls_in_filtered = set()
-        for msg in filtered_messages:
-            if isinstance(msg, AIMessage) and hasattr(msg, "tool_calls"):
-                for tool_call in msg.tool_calls:
-                    tool_calls_in_filtered.add(tool_call.get("id"))
-
-        # Collect all tool call IDs that have responses in filtered messages
-        tool_responses_in_filtered = set()
-        for msg in filtered_messages:
-            if isinstance(msg, ToolMessage) and hasattr(msg, "tool_call_id"):
-                tool_responses_in_filtered.add(msg.tool_call_id)
-
-        # Find orphaned tool calls (call without response)
-        orphaned_calls = tool_calls_in_filtered - tool_responses_in_filtered
-
-        # Find orphaned responses (response without call)
-        orphaned_responses = tool_responses_in_filtered - tool_calls_in_filtered
+        # Tool call IDs with calls / with responses in filtered messages
+        filtered_index = ToolCallIndex.of(filtered_messages)
+        orphaned_calls = filtered_index.unanswered()  # call without response
+        orphaned_responses = filtered_index.orphaned()  # response without call
 
         if not orphaned_calls and not orphaned_responses:
             # All tool pairs are complete
@@ -516,72 +803,65 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
             f"orphaned responses (missing call): {len(orphaned_responses)}"
         )
 
-        # Build a complete message list by adding missing pairs
-        complete_messages = list(filtered_messages)
+        if scan is None:
+            scan = HistoryScan()
+            scan.advance(full_messages, default_counter())
+        index = scan.tool_calls
+        positions = set(scan.positions_of(full_messages, filtered_messages))
 
         # Add missing tool responses for orphaned calls
         if orphaned_calls:
-            added_count = 0
-            for msg in full_messages:
-                if isinstance(msg, ToolMessage) and hasattr(msg, "tool_call_id"):
-                    if (
-                        msg.tool_call_id in orphaned_calls
-                        and msg not in complete_messages
-                    ):
-                        complete_messages.append(msg)
-                        added_count += 1
+            added = {p for call_id in orphaned_calls for p in index.results.get(call_id, ())}
+            added -= positions
+            positions |= added
             logger.info(
-                f"[Short-Term Memory] Added {added_count} missing ToolMessage(s) to complete tool calls"
+                f"[Short-Term Memory] Added {len(added)} missing ToolMessage(s) to complete tool calls"
             )
 
         # Add missing tool calls for orphaned responses
         # Instead of removing orphaned responses, find and add the AIMessages that made those calls
         if orphaned_responses:
-            added_count = 0
-            for msg in full_messages:
-                if isinstance(msg, AIMessage) and hasattr(msg, "tool_calls"):
-                    for tool_call in msg.tool_calls:
-                        tool_call_id = tool_call.get("id")
-                        if (
-                            tool_call_id in orphaned_responses
-                            and msg not in complete_messages
-                        ):
-                            complete_messages.append(msg)
-                            added_count += 1
-                            break  # Only add the message once, even if it has multiple relevant tool calls
+            added = {p for call_id in orphaned_responses for p in index.calls.get(call_id, ())}
+            added -= positions
+            positions |= added
             logger.info(
-                f"[Short-Term Memory] Added {added_count} missing AIMessage(s) with tool calls to complete tool responses"
+                f"[Short-Term Memory] Added {len(added)} missing AIMessage(s) with tool calls to complete tool responses"
             )
 
-        # Sort by timestamp to maintain chronological order
-        complete_messages.sort(
-            key=lambda m: (
-                getattr(m, "additional_kwargs", {}).get("timestamp", "")
-                if hasattr(m, "additional_kwargs")
-                else ""
-            )
-        )
-
-        return complete_messages
+        # History order (positions), not timestamp strings
+        head = leading_system_messages(full_messages)
+        return [full_messages[head + p] for p in sorted(positions)]
 
     @interceptor(
         source=make_source(PRE_MODEL_HOOK, PRE_MODEL_FILTER_MEMORY),
         extract_user_id=extract_thread_id_from_config
     )
-    def _filter_short_term_memory(self, state):
+    def _filter_short_term_memory(
+        self, state, scan: HistoryScan | None = None, max_tokens: int | None = None
+    ):
         """Filter messages based on time and token limits for short-term memory.
 
         This method implements short-term memory by:
         1. Filtering out messages older than SHORT_MEMORY_TIME_LIMIT
-        2. Applying token limit using trimMessages
+        2. Applying token limit over cached per-message token counts
         3. Always preserving system messages
 
-        NOTE: PostgresCheckpointer loads ALL messages from the database for the thread.
+        Timestamps and token counts come from `scan`, the thread's HistoryScan already
+        advanced over these messages by the pre-model hook; without it every message
+        is scanned here. Tool results are counted at most CONTEXT_TOOL_RESULT_MAX_TOKENS,
+        the size they are sent with (see engine/context_budget.py).
+
+        NOTE: PostgresCheckpointer loads ALL messages from the database for the thread,
+        unless CHECKPOINT_MESSAGE_STORE is enabled, in which case the same limits are
+        applied in SQL and only the recent tail is loaded (see _get_history_window).
         This filter reduces what goes to the LLM (saves tokens/improves performance),
         but the full history remains in the database.
 
         Args:
             state: The current state containing messages (full history from database)
+            scan: HistoryScan of the thread, up to date with state["messages"]
+            max_tokens: Token budget of the window (the history budget of the
+                ContextBudget); SHORT_MEMORY_TOKEN_LIMIT by default
 
         Returns:
             dict: Updated state with filtered messages (only recent messages)
@@ -593,6 +873,8 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         SHORT_MEMORY_TIME_LIMIT, SHORT_MEMORY_TOKEN_LIMIT = (
             self._get_short_memory_limits()
         )
+        if max_tokens is not None:
+            SHORT_MEMORY_TOKEN_LIMIT = max_tokens
 
         if not messages:
             return {"messages": []}
@@ -602,11 +884,13 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
             f"[Short-Term Memory] Loaded {len(messages)} messages from database"
         )
 
+        if scan is None:
+            scan = HistoryScan()
+            scan.advance(messages, self._get_context_counter())
+
         # Separate system messages (always kept)
-        system_messages = [msg for msg in messages if isinstance(msg, SystemMessage)]
-        non_system_messages = [
-            msg for msg in messages if not isinstance(msg, SystemMessage)
-        ]
+        system_messages = scan.system_messages(messages)
+        non_system_messages = scan.conversation(messages)
 
         logger.info(
             f"[Short-Term Memory] System messages: {len(system_messages)}, Non-system messages: {len(non_system_messages)}"
@@ -616,34 +900,11 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
             return {"messages": system_messages}
 
         # Step 1: Time filtering - remove messages older than time limit
+        # (messages without a valid timestamp are kept; timestamps parsed by the scan)
         current_time = datetime.now(timezone.utc)
-        time_filtered_messages = []
-
-        for message in non_system_messages:
-            timestamp_str = (
-                message.additional_kwargs.get("timestamp")
-                if hasattr(message, "additional_kwargs")
-                else None
-            )
-
-            if timestamp_str:
-                try:
-                    message_time = datetime.fromisoformat(
-                        timestamp_str.replace("Z", "+00:00")
-                    )
-                    age_seconds = (current_time - message_time).total_seconds()
-
-                    if age_seconds <= SHORT_MEMORY_TIME_LIMIT:
-                        time_filtered_messages.append(message)
-                except (ValueError, AttributeError) as e:
-                    logger.warning(
-                        f"Invalid timestamp format in message: {timestamp_str}, error: {e}"
-                    )
-                    # Keep messages with invalid timestamps
-                    time_filtered_messages.append(message)
-            else:
-                # Keep messages without timestamps (e.g., new messages)
-                time_filtered_messages.append(message)
+        time_filtered_messages = scan.within_time(
+            messages, current_time.timestamp() - SHORT_MEMORY_TIME_LIMIT
+        )
 
         if not time_filtered_messages:
             # If all messages are filtered out, keep at least the last message
@@ -660,18 +921,12 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
                     f"[Short-Term Memory] Filtered out {messages_filtered_by_time} messages older than {SHORT_MEMORY_TIME_LIMIT / 86400:.1f} days"
                 )
 
-        # Step 2: Apply token limiting using trimMessages
+        # Step 2: Apply token limiting over cached per-message counts (engine/token_count.py)
         try:
-            # Use trimMessages to limit tokens
-            token_filtered_messages = trim_messages(
+            token_filtered_messages = scan.trim(
                 time_filtered_messages,
                 max_tokens=SHORT_MEMORY_TOKEN_LIMIT,
-                strategy="last",
-                token_counter=lambda msgs: sum(
-                    len(str(m.content)) // 4 for m in msgs
-                ),  # Rough token estimation
-                start_on="human",
-                end_on=["human", "tool"],
+                counter=self._get_context_counter(),
             )
 
             messages_filtered_by_tokens = len(time_filtered_messages) - len(
@@ -682,7 +937,7 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
                     f"[Short-Term Memory] Filtered out {messages_filtered_by_tokens} messages due to {SHORT_MEMORY_TOKEN_LIMIT} token limit"
                 )
 
-            # If trim_messages returns empty or if the most recent message alone exceeds the limit
+            # If trimming returns empty or if the most recent message alone exceeds the limit
             if not token_filtered_messages:
                 logger.error(
                     f"[Short-Term Memory] The most recent message exceeds token limit ({SHORT_MEMORY_TOKEN_LIMIT} tokens). "
@@ -694,7 +949,7 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
             logger.error(
                 f"[Short-Term Memory] Error applying token limit: {e}. Using time filtered messages."
             )
-            token_filtered_messages = time_filtered_messages
+            token_filtered_messages = list(time_filtered_messages)
 
         # Step 2.5: Check if we need to validate tool pairs (performance optimization)
         # Only check if we have any tool-related messages
@@ -713,7 +968,7 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
             # Check if we have incomplete tool call/response pairs and fix them
             # Pass full messages from database so we can find tool calls/responses that were filtered out
             token_filtered_messages = self._ensure_complete_tool_pairs(
-                token_filtered_messages, messages, logger
+                token_filtered_messages, messages, logger, scan=scan
             )
 
             # If tool pair validation removed all messages, ensure we have at least one message
@@ -772,11 +1027,97 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
 
         return result
 
+    def _cached_long_term_memory(self, thread_id: str):
+        """(cache entry or None, whether it is fresh) for the thread's long-term memory."""
+        cached_entry = self._memory_cache.get(thread_id)
+        cache_is_fresh = (
+            cached_entry is not None
+            and (datetime.now(timezone.utc) - cached_entry["timestamp"]).total_seconds()
+            < MEMORY_CACHE_TTL_SECONDS
+        )
+        return cached_entry, cache_is_fresh
+
+    def _store_long_term_memory(self, thread_id: str, memory_data, fetched_at: datetime) -> None:
+        # Update cache regardless of whether memory_data exists or not
+        # This prevents repeated calls when there's no memory
+        self._memory_cache[thread_id] = {
+            "data": memory_data if memory_data else {},
+            "timestamp": fetched_at,
+        }
+        self._memory_needs_refresh = False  # Clear refresh flag
+
+        if memory_data:
+            logger.info("[Long-Term Memory] Cache updated with memory data")
+        else:
+            logger.info(
+                "[Long-Term Memory] Cache updated with empty memory (no data available)"
+            )
+
+    async def _arefresh_long_term_memory(self, config) -> None:
+        """Async stage of the pre-model hook: bring the thread's cached long-term memory
+        up to date before _inject_long_term_memory reads it.
+
+        Waits at most LONG_TERM_MEMORY_TIMEOUT_SECONDS for the fetch. On timeout the
+        cached memory (if any) is used for this call, and the fetch keeps running in
+        the background so that later calls get its result; concurrent calls of a
+        thread share one fetch (see _long_term_memory_fetch).
+        """
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        if not thread_id:
+            return
+        _, cache_is_fresh = self._cached_long_term_memory(thread_id)
+        if cache_is_fresh and not self._memory_needs_refresh:
+            return
+        timeout = float(getenv("LONG_TERM_MEMORY_TIMEOUT_SECONDS", "3"))
+        try:
+            await asyncio.wait_for(asyncio.shield(self._long_term_memory_fetch(thread_id)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"[Long-Term Memory] Fetch took longer than {timeout}s, using cached memory"
+            )
+
+    def _prefetch_long_term_memory(self, thread_id: str | None) -> None:
+        """Start the thread's memory fetch, if the cache needs one, without waiting for
+        it: async_query / async_stream_query call this as soon as a request arrives,
+        so the fetch overlaps the setup and the checkpoint read, and the pre-model
+        hook awaits the same in-flight fetch (_arefresh_long_term_memory).
+
+        On a cold start the get_user_memory tool is only known after the setup, so
+        the request calls this again once it is done.
+        """
+        if not thread_id or self._get_user_memory_tool() is None:
+            return
+        _, cache_is_fresh = self._cached_long_term_memory(thread_id)
+        if cache_is_fresh and not self._memory_needs_refresh:
+            return
+        self._long_term_memory_fetch(thread_id)
+
+    def _long_term_memory_fetch(self, thread_id: str) -> asyncio.Future:
+        """The in-flight memory fetch of the thread on the running loop, started if needed."""
+        fetches = self._loop_resources().memory_fetches
+        fetch = fetches.get(thread_id)
+        if fetch is None:
+            fetch = fetches[thread_id] = asyncio.ensure_future(
+                self._fetch_and_store_long_term_memory(thread_id)
+            )
+            fetch.add_done_callback(lambda _: fetches.pop(thread_id, None))
+        return fetch
+
+    async def _fetch_and_store_long_term_memory(self, thread_id: str) -> None:
+        fetched_at = datetime.now(timezone.utc)
+        try:
+            memory_data = await self._fetch_long_term_memory(thread_id)
+        except Exception as e:
+            # Keep the cached memory; the next call tries again
+            logger.error(f"[Long-Term Memory] Error fetching memory: {e!r}")
+            return
+        self._store_long_term_memory(thread_id, memory_data, fetched_at)
+
     @interceptor(
         source=make_source(PRE_MODEL_HOOK, PRE_MODEL_INJECT_MEMORY),
         extract_user_id=extract_thread_id_from_config
     )
-    def _inject_long_term_memory(self, state, config=None):
+    def _inject_long_term_memory(self, state, config=None, fetch: bool = True):
         """Inject long-term memory as a SystemMessage.
 
         This hook:
@@ -786,6 +1127,10 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         4. Formats it as a SystemMessage
         5. Inserts it after the system prompt but before conversation messages
 
+        On the async graph the fetch is awaited before this runs (see
+        _arefresh_long_term_memory) and fetch=False: the cache is used as is. A
+        sync fetch is only made outside a running event loop (query / stream_query).
+
         The memory SystemMessage is positioned after the system prompt (position 1)
         and will NOT be filtered by short-term memory filters since SystemMessages
         are always preserved.
@@ -795,6 +1140,7 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         Args:
             state: Current state containing messages
             config: LangGraph configuration with thread_id
+            fetch: Whether a stale cache may be refreshed here
 
         Returns:
             dict: Updated state with memory SystemMessage injected
@@ -816,17 +1162,10 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         try:
             # Check if we need to fetch memory
             current_time = datetime.now(timezone.utc)
-            cache_ttl_seconds = 300  # 5 minutes cache TTL
-
-            cached_entry = self._memory_cache.get(thread_id)
-            cache_is_fresh = (
-                cached_entry is not None
-                and (current_time - cached_entry["timestamp"]).total_seconds()
-                < cache_ttl_seconds
-            )
+            cached_entry, cache_is_fresh = self._cached_long_term_memory(thread_id)
 
             # Only fetch if cache is stale, missing, or refresh flag is set
-            if not cache_is_fresh or self._memory_needs_refresh:
+            if fetch and (not cache_is_fresh or self._memory_needs_refresh):
                 logger.info(
                     f"[Long-Term Memory] Fetching memory (cache_fresh={cache_is_fresh}, needs_refresh={self._memory_needs_refresh})"
                 )
@@ -834,42 +1173,23 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
                 # Fetch memory data
                 # Note: We need to run async function in sync context
                 try:
-                    # Try to get the current event loop
-                    loop = asyncio.get_event_loop()
-                    if loop.is_running():
-                        # We're in an async context, create a task
-                        # This is a workaround - ideally the hook should be async
-                        logger.warning(
-                            "[Long-Term Memory] Cannot fetch memory in running event loop, skipping"
-                        )
-                        memory_data = None
-                    else:
-                        memory_data = loop.run_until_complete(
-                            self._fetch_long_term_memory(thread_id)
-                        )
+                    asyncio.get_running_loop()
                 except RuntimeError:
-                    # No event loop, create one
+                    # No running event loop (query / stream_query): run the fetch here
                     memory_data = asyncio.run(self._fetch_long_term_memory(thread_id))
-
-                # Update cache regardless of whether memory_data exists or not
-                # This prevents repeated calls when there's no memory
-                self._memory_cache[thread_id] = {
-                    "data": memory_data if memory_data else {},
-                    "timestamp": current_time,
-                }
-                self._memory_needs_refresh = False  # Clear refresh flag
-
-                if memory_data:
-                    logger.info("[Long-Term Memory] Cache updated with memory data")
+                    self._store_long_term_memory(thread_id, memory_data, current_time)
                 else:
-                    logger.info(
-                        "[Long-Term Memory] Cache updated with empty memory (no data available)"
+                    # Blocking the loop is not an option: the async graph awaits the
+                    # fetch before this hook (_arefresh_long_term_memory)
+                    logger.warning(
+                        "[Long-Term Memory] Cannot fetch memory in running event loop, using cached memory"
                     )
+                    memory_data = cached_entry["data"] if cached_entry else None
             else:
                 logger.info(
                     "[Long-Term Memory] Using cached memory (skipping HTTP call)"
                 )
-                memory_data = cached_entry["data"]
+                memory_data = cached_entry["data"] if cached_entry else None
 
             # If no memory data, skip injection
             if not memory_data:
@@ -879,34 +1199,27 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
                 return {"messages": messages}
 
             # Format memory as SystemMessage
-            memory_content = f"LONG-TERM MEMORY:\n{json.dumps(memory_data, indent=2, ensure_ascii=False)}"
-            memory_message = SystemMessage(content=memory_content)
-
-            # Find position to insert memory (after system prompt, before conversation)
-            # Position 0: System prompt (if exists)
-            # Position 1: Long-term memory (NEW)
-            # Position 2+: Conversation messages
-            insert_position = 0
-            for i, msg in enumerate(messages):
-                if isinstance(msg, SystemMessage):
-                    # Check if this is a long-term memory message (to avoid duplicates)
-                    if msg.content.startswith("LONG-TERM MEMORY:"):
-                        # Replace existing memory message
-                        messages[i] = memory_message
-                        logger.info(
-                            "[Long-Term Memory] Updated existing memory message"
-                        )
-                        return {"messages": messages}
-                    insert_position = i + 1
-                else:
-                    # First non-system message found, insert here
-                    break
+            # Within CONTEXT_MEMORY_MAX_TOKENS (compacted, then cut)
+            memory_content = self._get_context_budget().memory_content(
+                memory_data, default_counter()
+            )
+            memory_message = SystemMessage(content=memory_content, id=MEMORY_MESSAGE_ID)
 
-            # Insert new memory message
+            # Remove the previous memory message(s). The message store loads rows in
+            # seq order, so it may come after conversation messages
+            previous = [i for i, msg in enumerate(messages) if self._is_memory_message(msg)]
+            for i in reversed(previous):
+                del messages[i]
+
+            # Insert memory after the system prompt, before conversation messages
+            insert_position = leading_system_messages(messages)
             messages.insert(insert_position, memory_message)
-            logger.info(
-                f"[Long-Term Memory] Injected memory at position {insert_position}"
-            )
+            if previous:
+                logger.info("[Long-Term Memory] Updated existing memory message")
+            else:
+                logger.info(
+                    f"[Long-Term Memory] Injected memory at position {insert_position}"
+                )
 
         except Exception as e:
             logger.error(
@@ -917,6 +1230,13 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
 
         return {"messages": messages}
 
+    @staticmethod
+    def _is_memory_message(message) -> bool:
+        return isinstance(message, SystemMessage) and (
+            message.id == MEMORY_MESSAGE_ID
+            or (isinstance(message.content, str) and message.content.startswith(MEMORY_PREFIX))
+        )
+
     @interceptor(
         source=make_source(PRE_MODEL_HOOK, PRE_MODEL_INJECT_THREAD_ID),
         extract_user_id=extract_thread_id_from_config
@@ -973,18 +1293,51 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         source=make_source(PRE_MODEL_HOOK, PRE_MODEL_COMBINED),
         extract_user_id=extract_thread_id_from_config
     )
-    def _combined_pre_model_hook(self, state, config=None):
-        # Step 1: Add timestamps to new ToolMessages (safe update, modifies in-place)
-        # We invoke this for the side-effect on state['messages'], relying on
-        # _inject_long_term_memory or subsequent steps to return the messages list.
-        self._add_timestamp_to_tool_messages(state)
+    def _combined_pre_model_hook(self, state, config=None, fetch_memory: bool = True):
+        scan = self._history_scan(config)
+        counter = self._get_context_counter()
+        with scan.lock:
+            # Step 1: Add timestamps to new ToolMessages (safe update, modifies in-place)
+            # Only the messages appended since the previous call of this thread are
+            # examined; the scan then records their timestamps and token counts.
+            self._add_timestamp_to_tool_messages(
+                {"messages": scan.pending(state.get("messages", []))}
+            )
+            scan.advance(state.get("messages", []), counter)
+
+            # Step 2: Inject long-term memory as SystemMessage
+            state = self._inject_long_term_memory(state, config, fetch=fetch_memory)
+
+            # Step 3: Apply short-term memory filtering, within the history budget left
+            # by the other sections of the model input (engine/context_budget.py)
+            # This returns llm_input_messages which should NOT be overwritten
+            fixed = self._get_fixed_context_tokens()
+            history_budget = self._get_context_budget().history_tokens(
+                self._get_short_memory_limits()[1],
+                sum(fixed.values()) + self._reserved_context_tokens(state, scan, config),
+            )
+            filtered_state = self._filter_short_term_memory(
+                state, scan=scan, max_tokens=history_budget
+            )
 
-        # Step 2: Inject long-term memory as SystemMessage
-        state = self._inject_long_term_memory(state, config)
+            # Step 3.5: Add the conversation summary of what the window left out
+            if "llm_input_messages" in filtered_state and self._get_summary_options().enabled:
+                filtered_state["llm_input_messages"] = self._apply_thread_summary(
+                    state.get("messages", []), filtered_state["llm_input_messages"], scan, config
+                )
 
-        # Step 3: Apply short-term memory filtering
-        # This returns llm_input_messages which should NOT be overwritten
-        filtered_state = self._filter_short_term_memory(state)
+            # Step 3.6: Cut the summary and tool results to their caps, record the allocation
+            if "llm_input_messages" in filtered_state:
+                window = self._get_context_budget().fit(
+                    filtered_state["llm_input_messages"], default_counter()
+                )
+                self._record_allocation(
+                    config,
+                    self._get_context_budget().allocation(
+                        window, counter, fixed, history_budget, scan, state.get("messages", [])
+                    ),
+                )
+                filtered_state["llm_input_messages"] = window
 
         # Step 4: Inject thread_id into tool calls
         # Need to work on llm_input_messages if it exists
@@ -1005,6 +1358,202 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
             # No filtering applied, just inject thread_id normally
             return self._inject_thread_id_in_user_id_params(filtered_state, config)
 
+    def _get_context_budget(self) -> ContextBudget:
+        if self._context_budget is None:
+            self._context_budget = ContextBudget.from_env()
+            logger.info(f"Context budget set to {self._context_budget}")
+        return self._context_budget
+
+    def _get_context_counter(self):
+        """default_counter() with tool results counted at most their cap."""
+        if self._context_counter is None:
+            self._context_counter = self._get_context_budget().counter(default_counter())
+        return self._context_counter
+
+    def _get_fixed_context_tokens(self) -> dict:
+        """Tokens of the system prompt and of the tool schemas, counted again when the
+        tool catalogue changes."""
+        key = (self._system_prompt, tuple(tool.name for tool in self._tools))
+        if self._fixed_context_tokens is None or self._fixed_context_tokens[0] != key:
+            counter = default_counter()
+            self._fixed_context_tokens = (
+                key,
+                {
+                    "system": counter.estimate(SystemMessage(content=self._system_prompt)),
+                    "tools": tool_schema_tokens(self._tools, counter),
+                },
+            )
+        return self._fixed_context_tokens[1]
+
+    def _reserved_context_tokens(self, state, scan: HistoryScan, config) -> int:
+        """Tokens of the SystemMessages of the thread (long-term memory included) and of
+        its conversation summary, if any, as they will be sent."""
+        budget = self._get_context_budget()
+        counter = self._get_context_counter()
+        reserved = sum(counter.count(m) for m in scan.system_messages(state.get("messages", [])))
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        summary = (
+            self._get_thread_summaries().get(thread_id)
+            if thread_id and self._get_summary_options().enabled
+            else None
+        )
+        if summary is not None:
+            tokens = counter.estimate(summary_message(summary))
+            reserved += min(tokens, budget.summary_tokens) if budget.summary_tokens > 0 else tokens
+        return reserved
+
+    def _record_allocation(self, config, allocation: dict) -> None:
+        """Log the allocation of the model input and add it to the current span (the
+        pre-model hook's) and, at the end of the turn, to the conversation span."""
+        logger.info(f"[Context Budget] {allocation}")
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        if thread_id:
+            self._context_allocations.pop(thread_id, None)
+            self._context_allocations[thread_id] = allocation
+            if len(self._context_allocations) > 1024:
+                self._context_allocations.pop(next(iter(self._context_allocations)), None)
+        if self._tracer:
+            from opentelemetry import trace
+
+            trace.get_current_span().set_attributes(
+                {f"context.{key}": value for key, value in allocation.items()}
+            )
+
+    def _history_scan(self, config) -> HistoryScan:
+        """Watermarked HistoryScan of the thread in config (a fresh one without thread_id)."""
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        if not thread_id:
+            return HistoryScan()
+        if self._history_scans is None:
+            self._history_scans = HistoryScans.from_env()
+        return self._history_scans.get(thread_id)
+
+    async def _acombined_pre_model_hook(self, state, config=None):
+        """Pre-model hook of the async graph: awaits the long-term memory fetch (with a
+        deadline), then runs the sync hook, which only reads the memory cache, off the
+        event loop (its first call on a thread scans the whole history)."""
+        await self._arefresh_long_term_memory(config)
+        return await asyncio.to_thread(
+            self._combined_pre_model_hook, state, config, fetch_memory=False
+        )
+
+    def _get_summary_options(self) -> SummaryOptions:
+        if self._summary_options is None:
+            self._summary_options = SummaryOptions.from_env()
+        return self._summary_options
+
+    def _get_thread_summaries(self) -> ThreadSummaries:
+        if self._thread_summaries is None:
+            self._thread_summaries = ThreadSummaries()
+        return self._thread_summaries
+
+    def _apply_thread_summary(self, messages, window, scan: HistoryScan, config) -> list:
+        """Record the messages dropped before window that the thread summary does not
+        cover yet (updated after the turn, see _schedule_summary_update) and add the
+        current summary to window."""
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        if not thread_id:
+            return window
+        options = self._get_summary_options()
+        summaries = self._get_thread_summaries()
+        summary = summaries.get(thread_id)
+        dropped = dropped_count(scan, messages, window)
+        if not dropped:
+            summaries.set_pending(thread_id, None)
+            return window
+
+        batch = pending_batch(scan, messages, dropped, summary, options.max_input_tokens)
+        if batch is not None and len(batch.messages) < options.min_messages:
+            batch = None
+        summaries.set_pending(thread_id, batch)
+        if summary is None:
+            return window
+        logger.info(
+            f"[Conversation Summary] Added summary of {dropped} earlier messages "
+            f"(covered until {summary.covered_at.isoformat()})"
+        )
+        return with_summary(list(window), summary)
+
+    async def _load_thread_summary(self, thread_id: str | None, resources: _LoopResources) -> None:
+        """Read the thread summary for this turn (skipped while this replica updates it)."""
+        if not thread_id or not self._get_summary_options().enabled:
+            return
+        if thread_id in self._summary_tasks:
+            return
+        try:
+            async with resources.pool.connection() as conn:
+                summary = await aload_summary(conn, thread_id)
+            self._get_thread_summaries().put(thread_id, summary)
+        except Exception as e:
+            logger.warning(f"[Conversation Summary] Failed to load summary: {e!r}")
+
+    def _schedule_summary_update(self, thread_id: str | None, resources: _LoopResources) -> None:
+        """Start the summary update recorded by the turn's pre-model hook, if any, in the
+        background (one at a time per thread)."""
+        if not thread_id or not self._get_summary_options().enabled:
+            return
+        batch = self._get_thread_summaries().take_pending(thread_id)
+        if batch is None or thread_id in self._summary_tasks:
+            return
+        task = asyncio.ensure_future(self._update_thread_summary(thread_id, batch, resources))
+        self._summary_tasks[thread_id] = task
+        task.add_done_callback(
+            lambda t: self._summary_tasks.pop(thread_id, None)
+            if self._summary_tasks.get(thread_id) is t
+            else None
+        )
+
+    async def _update_thread_summary(self, thread_id: str, batch, resources: _LoopResources) -> None:
+        options = self._get_summary_options()
+        summaries = self._get_thread_summaries()
+        start = time.perf_counter()
+        try:
+            if resources.summary_llm is None:
+                from langchain_google_vertexai import ChatVertexAI
+
+                resources.summary_llm = ChatVertexAI(
+                    model_name=options.model,
+                    temperature=0,
+                    max_output_tokens=options.max_tokens * 2,
+                    thinking_budget=0,
+                )
+            summary = await asummarize(
+                resources.summary_llm, summaries.get(thread_id), batch, options.max_tokens
+            )
+            async with resources.pool.connection() as conn:
+                await asave_summary(conn, thread_id, summary)
+            summaries.put(thread_id, summary)
+            summaries.stats["updates"] += 1
+            summaries.stats["last_update_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            logger.info(
+                f"[Conversation Summary] Folded {len(batch.messages)} messages into the summary "
+                f"in {summaries.stats['last_update_ms']} ms"
+            )
+        except Exception as e:
+            summaries.stats["errors"] += 1
+            summaries.stats["last_error"] = repr(e)
+            logger.warning(f"[Conversation Summary] Summary update failed: {e!r}")
+
+    def _load_thread_summary_sync(self, thread_id: str | None) -> None:
+        """_load_thread_summary for query / stream_query. The sync path only reads and
+        adds the summary; updates are made by the async path."""
+        if not thread_id or not self._get_summary_options().enabled:
+            return
+        try:
+            with self._sync_conn_pool.connection() as conn:
+                summary = load_summary(conn, thread_id)
+            self._get_thread_summaries().put(thread_id, summary)
+        except Exception as e:
+            logger.warning(f"[Conversation Summary] Failed to load summary: {e!r}")
+
+    def thread_summary_report(self) -> dict:
+        """Conversation summary updates of this replica (count, errors, last duration)."""
+        return {
+            "enabled": self._get_summary_options().enabled,
+            "running": len(self._summary_tasks),
+            **self._get_thread_summaries().stats,
+        }
+
     @interceptor(
         source=make_source(POST_MODEL_HOOK, POST_MODEL_COMBINED),
         extract_user_id=extract_thread_id_from_config
@@ -1041,27 +1590,37 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
 
     def _create_react_agent(
         self,
-        checkpointer: AsyncPostgresSaver | PostgresSaver | None = None,
+        checkpointer: "AsyncPostgresSaver | PostgresSaver | None" = None,
+        tools: List[BaseTool] | None = None,
+        llm: "ChatVertexAI | None" = None,
     ):
-        """Create and configure the React Agent."""
-        llm = ChatVertexAI(
-            model_name=self._model,
-            temperature=self._temperature,
-            include_thoughts=self._include_thoughts,
-            thinking_budget=self._thinking_budget,
-        )
-        # llm_with_tools = llm.bind_tools(tools=self._tools, parallel_tool_calls=False)
-        llm_with_tools = llm.bind_tools(tools=self._tools)
+        """Create and configure the React Agent (with self._tools and the shared LLM
+        unless given)."""
+        # from langgraph.prebuilt import create_react_agent
+        # use custom graph without _validate_chat_history
+        from langgraph._internal._runnable import RunnableCallable
+
+        from engine.custom_react_agent import create_react_agent
+
+        tools = self._tools if tools is None else tools
+        llm = llm or self._get_llm()
+        # llm_with_tools = llm.bind_tools(tools=tools, parallel_tool_calls=False)
+        llm_with_tools = llm.bind_tools(tools=tools)
         
         # Wrap tools with logging
-        wrapped_tools = self._wrap_tools_with_logging(self._tools)
+        wrapped_tools = self._wrap_tools_with_logging(tools)
 
-        self._graph = create_react_agent(
+        return create_react_agent(
             model=llm_with_tools,
             tools=wrapped_tools,
             prompt=self._system_prompt,
             checkpointer=checkpointer,
-            pre_model_hook=self._combined_pre_model_hook,
+            # invoke / stream run the sync hook, ainvoke / astream the async one
+            pre_model_hook=RunnableCallable(
+                self._combined_pre_model_hook,
+                self._acombined_pre_model_hook,
+                name="pre_model_hook",
+            ),
             post_model_hook=self._combined_post_model_hook,
         )
     
@@ -1117,47 +1676,149 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         logger.info(f"[Tool Wrapping] Wrapped {len(wrapped_tools)} tools with logging")
         return wrapped_tools
 
-    async def _ensure_async_setup(self):
-        """Ensure async components are set up."""
+    def _loop_resources(self) -> _LoopResources:
+        """The async resources of the running event loop, registered on first use.
+
+        Loops that have been closed since are dropped (their pools cannot be closed
+        any more; the connections go away with the loop).
+        """
+        loop = asyncio.get_running_loop()
+        resources = self._loops.get(loop)
+        if resources is None:
+            for other in list(self._loops):
+                if other.is_closed():
+                    self._loops.pop(other, None)
+                    logger.info("[Agent Setup] Dropped the resources of a closed event loop")
+            resources = self._loops.setdefault(loop, _LoopResources())
+        return resources
+
+    async def _ensure_async_setup(self) -> _LoopResources:
+        """Ensure async components are set up for the running event loop.
+
+        Each loop gets its own pool, checkpointer and graph (see _LoopResources), so
+        callers on different loops or threads run in parallel; tools, LLM settings,
+        telemetry and the checkpoint schema are set up once and shared.
+
+        Single-flight: on a cold loop the first caller starts the setup and
+        concurrent callers await the same attempt instead of repeating it. A failed
+        setup is retried with exponential backoff (AGENT_SETUP_RETRIES,
+        AGENT_SETUP_BACKOFF_SECONDS); if it still fails every waiting caller gets the
+        error and the next call starts a new attempt. Time spent waiting is recorded
+        per caller in startup_report()["setup_wait_ms"].
+        """
 
         self._set_up_opentelemetry()
 
-        if self._setup_complete_async:
-            return
+        resources = self._loop_resources()
+        if resources.ready:
+            return resources
+
+        if self._setup_wait is None:
+            self._setup_wait = LatencyStats()
+        start = time.perf_counter()
+        flight = resources.flight
+        leader = flight is None
+        if leader:
+            flight = resources.flight = asyncio.ensure_future(self._set_up_async_with_retry())
+            flight.add_done_callback(lambda f: self._end_setup_flight(resources, f))
+        try:
+            # Shielded: a cancelled caller must not cancel the setup others wait for
+            await asyncio.shield(flight)
+        finally:
+            self._setup_wait.record(
+                "leader" if leader else "follower", (time.perf_counter() - start) * 1000
+            )
+        return resources
+
+    def _end_setup_flight(self, resources: _LoopResources, flight) -> None:
+        resources.flight = None
+        if not flight.cancelled() and flight.exception() is not None:
+            logger.error(f"[Agent Setup] Async setup failed: {flight.exception()!r}")
+
+    async def _set_up_async_with_retry(self):
+        retries = int(getenv("AGENT_SETUP_RETRIES", "3"))
+        backoff = float(getenv("AGENT_SETUP_BACKOFF_SECONDS", "0.5"))
+        for attempt in range(retries + 1):
+            try:
+                await self._set_up_async()
+                self._loop_resources().ready = True
+                return
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                # Exponential with jitter, so replicas started together do not retry in lockstep
+                delay = min(backoff * 2**attempt, 30.0) * random.uniform(0.5, 1.0)
+                logger.warning(
+                    f"[Agent Setup] Async setup attempt {attempt + 1}/{retries + 1} failed: {e!r}; "
+                    f"retrying in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+
+    async def _set_up_async(self):
+        """One setup attempt for the running loop: tools (shared), connection pool,
+        checkpointer and graph."""
+        from psycopg_pool import AsyncConnectionPool
+
+        from engine.checkpoint_cache import CheckpointCache
+        from engine.checkpoint_codec import CompressingSerializer
+        from engine.checkpointer import IntVersionPostgresSaver
+        from engine.content_blobs import ContentBlobStore
 
         # Load MCP tools at runtime if not already loaded
         if not self._tools:
-            from engine.mcp_tools import get_mcp_tools
+            with self._startup_step("mcp_tools"):
+                self._tools = await self._load_mcp_tools()
+            self._tools_from_mcp = True
 
-            excluded_tools = getenv("MCP_EXCLUDED_TOOLS", "")
-            excluded_tools_list = excluded_tools.split(",") if excluded_tools else []
-            self._tools = await get_mcp_tools(exclude_tools=excluded_tools_list)
+        resources = self._loop_resources()
 
-        # Create connection string for standard Postgres
-        conn_string = f"postgresql://{self._database_user}:{self._database_password}@{self._database_host}:{self._database_port}/{self._database_name}"
-
-        # Create persistent connection pool for the agent's lifetime
+        # Create persistent connection pool for the loop's lifetime
         # This prevents "connection closed" errors in deployed environments
-        if self._conn_pool is None:
-            self._conn_pool = AsyncConnectionPool(
-                conninfo=conn_string,
-                min_size=1,
-                max_size=10,
-                timeout=30.0,
-                open=True,  # Auto-open on creation
-            )
+        if resources.pool is None:
+            with self._startup_step("connection_pool"):
+                pool = AsyncConnectionPool(
+                    conninfo=self._database_url(),
+                    name=f"checkpointer-{len(self._loops)}",
+                    open=False,
+                    **self._pool_options(AsyncConnectionPool),
+                )
+                await pool.open()
+                resources.pool = pool
             logger.info("[Agent Setup] ✓ Connection pool created")
 
+        # Thread-safe, so one cache serves the savers of every loop
+        if self._checkpoint_cache is None:
+            self._checkpoint_cache = CheckpointCache.from_env()
+
         # Create checkpointer with persistent pool
-        checkpointer = IntVersionPostgresSaver(conn=self._conn_pool)
-        await checkpointer.setup()
+        checkpointer = IntVersionPostgresSaver(
+            conn=resources.pool,
+            message_store=getenv("CHECKPOINT_MESSAGE_STORE", "false").lower() == "true",
+            history_window=self._get_history_window(),
+            cache=self._checkpoint_cache,
+            serde=CompressingSerializer.from_env(),
+            legacy_write_back=getenv("CHECKPOINT_LEGACY_WRITE_BACK", "true").lower() == "true",
+            content_blobs=ContentBlobStore.from_env(),
+        )
+        if not self._checkpoint_schema_ready:
+            with self._startup_step("checkpoint_schema"):
+                await asyncio.to_thread(self._set_up_checkpoint_schema)
         logger.info("[Agent Setup] ✓ Checkpointer connected and setup complete")
 
-        self._create_react_agent(checkpointer=checkpointer)
+        # The gRPC aio client of the LLM is bound to the loop that first uses it
+        llm = self._get_llm()
+        if "async_client" in type(llm).model_fields:
+            llm = llm.model_copy(update={"async_client": None})
+        with self._startup_step("graph"):
+            graph = self._create_react_agent(checkpointer=checkpointer, llm=llm)
+        resources.checkpointer, resources.llm, resources.graph = checkpointer, llm, graph
         logger.info("[Agent Setup] ✓ React agent created successfully (async)")
-        logger.info("[Agent Setup] ========== Agent Setup Complete ==========")
-
-        self._setup_complete_async = True
+        # One refresher for all loops, restarted if the loop running it was closed
+        if self._tools_from_mcp and (self._tool_refresh is None or self._tool_refresh.done()):
+            self._tool_refresh = asyncio.ensure_future(
+                self._refresh_tools_periodically(float(getenv("MCP_TOOL_REFRESH_SECONDS", "300")))
+            )
+        logger.info(f"[Agent Setup] ========== Agent Setup Complete ========== {self.startup_report()}")
 
     def _ensure_sync_setup(self):
         """Ensure sync components are set up."""
@@ -1165,29 +1826,43 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         self._set_up_opentelemetry()
 
         if self._setup_complete_sync:
-            return self._graph
-
-        # Load MCP tools at runtime if not already loaded
-        if not self._tools:
-            import asyncio
+            return self._sync_graph
 
-            from engine.mcp_tools import get_mcp_tools
+        from psycopg_pool import ConnectionPool
 
-            excluded_tools = getenv("MCP_EXCLUDED_TOOLS", "")
-            excluded_tools_list = excluded_tools.split(",") if excluded_tools else []
-            self._tools = asyncio.run(get_mcp_tools(exclude_tools=excluded_tools_list))
+        from engine.checkpoint_codec import CompressingSerializer
+        from engine.checkpointer import IntVersionSyncPostgresSaver
+        from engine.content_blobs import ContentBlobStore
 
-        # Create connection string for standard Postgres
-        conn_string = f"postgresql://{self._database_user}:{self._database_password}@{self._database_host}:{self._database_port}/{self._database_name}"
-
-        # Pass the context manager generator directly to create_react_agent
-        checkpointer_ctx = PostgresSaver.from_conn_string(conn_string)
-        checkpointer = checkpointer_ctx.__enter__()
-        checkpointer.setup()
+        # Load MCP tools at runtime if not already loaded
+        if not self._tools:
+            self._tools = asyncio.run(self._load_mcp_tools())
+
+        # Pooled like the async path, so concurrent sync calls do not share one connection
+        if self._sync_conn_pool is None:
+            self._sync_conn_pool = ConnectionPool(
+                conninfo=self._database_url(),
+                name="checkpointer-sync",
+                open=True,
+                **self._pool_options(ConnectionPool),
+            )
+            logger.info("[Agent Setup] ✓ Sync connection pool created")
+
+        # Same options as the async saver, so both paths read and write the same format
+        checkpointer = IntVersionSyncPostgresSaver(
+            conn=self._sync_conn_pool,
+            message_store=getenv("CHECKPOINT_MESSAGE_STORE", "false").lower() == "true",
+            history_window=self._get_history_window(),
+            serde=CompressingSerializer.from_env(),
+            content_blobs=ContentBlobStore.from_env(),
+        )
+        if not self._checkpoint_schema_ready:
+            self._set_up_checkpoint_schema()
 
-        self._create_react_agent(checkpointer=checkpointer)
+        self._sync_checkpointer = checkpointer
+        self._sync_graph = self._create_react_agent(checkpointer=checkpointer)
         self._setup_complete_sync = True
-        return self._graph
+        return self._sync_graph
 
     @interceptor(
         source=make_source(GRAPH_INVOCATION, GRAPH_ASYNC_QUERY),
@@ -1196,8 +1871,13 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
     async def async_query(self, **kwargs) -> dict[str, Any] | Any:
         """Asynchronous query execution with filtered current interaction."""
         kwargs = self._combined_pre_invoke_hook(**kwargs)
-        await self._ensure_async_setup()
-        if self._graph is None:
+        thread_id = kwargs.get("config", {}).get("configurable", {}).get("thread_id")
+        if kwargs.get("type") != "history":
+            self._prefetch_long_term_memory(thread_id)
+        # One graph per request: a tool refresh may swap the loop's graph meanwhile
+        resources = await self._ensure_async_setup()
+        graph = resources.graph
+        if graph is None:
             raise ValueError(
                 "Graph is not initialized. Call _ensure_async_setup first."
             )
@@ -1205,7 +1885,7 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         if type == "history":
             # Bypass filtering for history requests
             try:
-                self._graph.update_state(
+                await graph.aupdate_state(
                     config=kwargs.get("config", {}), values=kwargs.get("input", {})
                 )
                 return {
@@ -1215,7 +1895,10 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
                 }
             except Exception as e:
                 return {"status_code": 500, "status": "error", "message": str(e)}
-        result = await self._graph.ainvoke(**kwargs)
+        self._prefetch_long_term_memory(thread_id)
+        await self._load_thread_summary(thread_id, resources)
+        result = await graph.ainvoke(**kwargs)
+        self._schedule_summary_update(thread_id, resources)
         filtered_result = self._filter_current_interaction(result)
 
         # Simple tracing
@@ -1231,15 +1914,22 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         """Asynchronous streaming query execution with filtered chunks."""
         kwargs = self._combined_pre_invoke_hook(**kwargs)
 
+        thread_id = kwargs.get("config", {}).get("configurable", {}).get("thread_id")
+        self._prefetch_long_term_memory(thread_id)
+
         async def async_generator() -> AsyncIterable[Any]:
-            await self._ensure_async_setup()
-            if self._graph is None:
+            resources = await self._ensure_async_setup()
+            graph = resources.graph
+            if graph is None:
                 raise ValueError(
                     "Graph is not initialized. Call _ensure_async_setup first."
                 )
-            async for chunk in self._graph.astream(**kwargs):
+            self._prefetch_long_term_memory(thread_id)
+            await self._load_thread_summary(thread_id, resources)
+            async for chunk in graph.astream(**kwargs):
                 filtered_chunk = self._filter_streaming_chunk(chunk)
                 yield dumpd(filtered_chunk)
+            self._schedule_summary_update(thread_id, resources)
 
         return async_generator()
 
@@ -1250,11 +1940,13 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
     def query(self, **kwargs) -> dict[str, Any] | Any:
         """Synchronous query execution with filtered current interaction."""
         kwargs = self._combined_pre_invoke_hook(**kwargs)
-        self._ensure_sync_setup()
-        if self._graph is None:
+        graph = self._ensure_sync_setup()
+        if graph is None:
             raise ValueError("Graph is not initialized. Call _ensure_sync_setup first.")
 
-        result = self._graph.invoke(**kwargs)
+        thread_id = kwargs.get("config", {}).get("configurable", {}).get("thread_id")
+        self._load_thread_summary_sync(thread_id)
+        result = graph.invoke(**kwargs)
         filtered_result = self._filter_current_interaction(result)
 
         # Simple tracing
@@ -1269,10 +1961,13 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
     def stream_query(self, **kwargs) -> Iterator[dict[str, Any] | Any]:
         """Synchronous streaming query execution with filtered chunks."""
         kwargs = self._combined_pre_invoke_hook(**kwargs)
-        self._ensure_sync_setup()
-        if self._graph is None:
+        graph = self._ensure_sync_setup()
+        if graph is None:
             raise ValueError("Graph is not initialized. Call _ensure_sync_setup first.")
-        for chunk in self._graph.stream(**kwargs):
+        self._load_thread_summary_sync(
+            kwargs.get("config", {}).get("configurable", {}).get("thread_id")
+        )
+        for chunk in graph.stream(**kwargs):
             filtered_chunk = self._filter_streaming_chunk(chunk)
             yield dumpd(filtered_chunk)
 
@@ -1308,15 +2003,47 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
 
     async def cleanup(self):
         """Cleanup resources, including connection pool and telemetry."""
-        # Close connection pool if it exists
-        if self._conn_pool is not None:
+        if self._tool_refresh is not None:
+            refresh_loop = self._tool_refresh.get_loop()
+            if not refresh_loop.is_closed():
+                refresh_loop.call_soon_threadsafe(self._tool_refresh.cancel)
+            self._tool_refresh = None
+        # Summary updates use the pools closed below
+        for task in list(self._summary_tasks.values()):
+            task_loop = task.get_loop()
+            if not task_loop.is_closed():
+                task_loop.call_soon_threadsafe(task.cancel)
+        self._summary_tasks = {}
+        # Close the connection pool of every loop; pools of other loops are closed on
+        # their own loop (those already closed took their connections with them)
+        current = asyncio.get_running_loop()
+        for loop, resources in list(self._loops.items()):
+            for fetch in list(resources.memory_fetches.values()):
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(fetch.cancel)
+            if resources.pool is None:
+                continue
             try:
-                await self._conn_pool.close()
+                if loop is current:
+                    await resources.pool.close()
+                elif loop.is_running():
+                    await asyncio.wrap_future(
+                        asyncio.run_coroutine_threadsafe(resources.pool.close(), loop)
+                    )
                 logger.info("[Agent Cleanup] Connection pool closed")
             except Exception as e:
                 logger.warning(f"[Agent Cleanup] Error closing connection pool: {e}")
             finally:
-                self._conn_pool = None
+                resources.pool = None
+        self._loops = {}
+        if self._sync_conn_pool is not None:
+            try:
+                self._sync_conn_pool.close()
+                logger.info("[Agent Cleanup] Sync connection pool closed")
+            except Exception as e:
+                logger.warning(f"[Agent Cleanup] Error closing sync connection pool: {e}")
+            finally:
+                self._sync_conn_pool = None
         
         # Force flush telemetry spans
         if self._batch_processor:
@@ -1328,5 +2055,5 @@ class Agent(AsyncQueryable, AsyncStreamQueryable, Queryable, StreamQueryable):
         """Ensure cleanup on object destruction."""
         # For async cleanup, we can't directly await in __del__
         # This is just a warning - users should call cleanup() explicitly
-        if self._conn_pool is not None:
+        if any(resources.pool is not None for resources in list(getattr(self, "_loops", {}).values())):
             logger.warning("[Agent Cleanup] Connection pool not closed. Call cleanup() explicitly.")
@@ -0,0 +1,251 @@
+"""
+Checkpoint Cache
+
+Per-process LRU cache of the latest CheckpointTuple of each (thread_id, checkpoint_ns),
+placed in front of IntVersionPostgresSaver so repeated aget_tuple calls during a turn
+do not re-read and re-deserialize the same blobs from Postgres.
+
+- aput replaces the cached tuple (write-through) and aput_writes appends to its
+  pending writes, so the cache always mirrors what was just written. LangGraph may
+  save the writes of a checkpoint before the checkpoint itself; those are held until
+  the matching aput arrives.
+- Entries are evicted by count and by approximate size in bytes.
+- Agent Engine runs several replicas, so a thread may be written by another process.
+  Entries are trusted for CHECKPOINT_CACHE_TRUST_SECONDS after they were written or
+  validated; after that the saver checks the latest checkpoint_id in the database
+  (index-only query) before serving them.
+- Tuples are deep-copied in and out: hooks mutate message objects in place.
+
+Opt-in (CHECKPOINT_CACHE_MAX_ENTRIES > 0). A hit serves the state this process
+wrote, not what Postgres returns: a thread written through a saver that does not
+load back everything it stores (the message store window, for instance) may look
+different to a replica reading it cold. The deep copies also cost CPU on every put
+and hit, in exchange for the read round trip.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from dataclasses import dataclass, field
+from os import getenv
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage
+from langgraph.checkpoint.base import WRITES_IDX_MAP, CheckpointTuple
+
+CacheKey = Tuple[str, str]
+# (task_path, task_id, idx) -> (task_id, channel, value), as ordered by the saver's SELECT
+Writes = Dict[Tuple[str, str, int], Tuple[str, str, Any]]
+
+
+def approx_size(value: Any) -> int:
+    """Rough size in bytes of a checkpoint value, dominated by message contents."""
+    if isinstance(value, BaseMessage):
+        return 200 + len(str(value.content)) + approx_size(value.additional_kwargs)
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return 64 + sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return 64 + sum(approx_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+@dataclass
+class _Entry:
+    value: CheckpointTuple
+    size: int
+    validated_at: float
+    writes: Writes = field(default_factory=dict)
+
+    @property
+    def checkpoint_id(self) -> str:
+        return self.value.config["configurable"]["checkpoint_id"]
+
+
+class CheckpointCache:
+    """Bounded LRU of the latest checkpoint tuple per thread. Thread-safe."""
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        max_bytes: int = 64 * 1024 * 1024,
+        trust_seconds: float = 5.0,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.trust_seconds = trust_seconds
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        # Writes received before the aput of their checkpoint: key -> (checkpoint_id, writes)
+        self._early_writes: Dict[CacheKey, Tuple[str, Writes]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["CheckpointCache"]:
+        """Build a cache from CHECKPOINT_CACHE_* environment variables (None if disabled)."""
+        max_entries = int(getenv("CHECKPOINT_CACHE_MAX_ENTRIES", "0"))
+        if max_entries <= 0:
+            return None
+        return cls(
+            max_entries=max_entries,
+            max_bytes=int(float(getenv("CHECKPOINT_CACHE_MAX_MB", "64")) * 1024 * 1024),
+            trust_seconds=float(getenv("CHECKPOINT_CACHE_TRUST_SECONDS", "5")),
+        )
+
+    def lookup(self, key: CacheKey) -> Tuple[Optional[str], bool]:
+        """Return (cached checkpoint_id, still trusted) without touching the counters."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            return (
+                entry.checkpoint_id,
+                time.monotonic() - entry.validated_at <= self.trust_seconds,
+            )
+
+    def get(
+        self, key: CacheKey, checkpoint_id: Optional[str] = None, validated: bool = False
+    ) -> Optional[CheckpointTuple]:
+        """Return a copy of the cached tuple, or None (counted as a miss).
+
+        If checkpoint_id is given, the cached tuple must be that checkpoint.
+        validated=True renews the trust window of the entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (checkpoint_id and entry.checkpoint_id != checkpoint_id):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if validated:
+                entry.validated_at = time.monotonic()
+            self.hits += 1
+            value = entry.value
+        return deepcopy(value)
+
+    def put(self, key: CacheKey, value: CheckpointTuple, written: bool = False) -> None:
+        """Cache a tuple unless a newer checkpoint of the same thread is already cached.
+
+        written=True marks a tuple built by aput (no pending writes yet); otherwise the
+        tuple was loaded from the database.
+        """
+        value = deepcopy(value)
+        entry = _Entry(value=value, size=0, validated_at=time.monotonic())
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current.checkpoint_id > entry.checkpoint_id:
+                return
+            early = self._early_writes.get(key)
+            if early is not None and early[0] <= entry.checkpoint_id:
+                del self._early_writes[key]
+                if early[0] == entry.checkpoint_id:
+                    if not written:
+                        # The load may or may not include these writes: don't cache it
+                        if current is not None:
+                            self._remove(key)
+                        return
+                    entry.writes = early[1]
+                    entry.value = value._replace(
+                        pending_writes=[early[1][k] for k in sorted(early[1])]
+                    )
+            entry.size = approx_size(entry.value.checkpoint) + approx_size(
+                entry.value.pending_writes
+            )
+            if current is not None:
+                self._remove(key)
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    def add_writes(
+        self,
+        key: CacheKey,
+        checkpoint_id: str,
+        task_id: str,
+        task_path: str,
+        writes: Sequence[Tuple[str, Any]],
+    ) -> None:
+        """Mirror aput_writes on the cached tuple (same upsert/insert rules as the saver)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.checkpoint_id < checkpoint_id:
+                # Checkpoint not saved yet: hold the writes until its aput
+                early = self._early_writes.get(key)
+                if early is None or early[0] < checkpoint_id:
+                    early = self._early_writes[key] = (checkpoint_id, {})
+                if early[0] == checkpoint_id:
+                    self._apply_writes(early[1], task_id, task_path, writes)
+                while len(self._early_writes) > self.max_entries:
+                    del self._early_writes[next(iter(self._early_writes))]
+                return
+            if entry.checkpoint_id != checkpoint_id:
+                return
+            if entry.value.pending_writes and not entry.writes:
+                # Loaded from the database: we don't know task_path/idx of the existing
+                # writes, so the merged order can't be reproduced. Drop the entry.
+                self._remove(key)
+                return
+            self._apply_writes(entry.writes, task_id, task_path, writes)
+            pending_writes = [entry.writes[k] for k in sorted(entry.writes)]
+            size = approx_size(entry.value.checkpoint) + approx_size(pending_writes)
+            entry.value = entry.value._replace(pending_writes=pending_writes)
+            self._bytes += size - entry.size
+            entry.size = size
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def invalidate(self, key: CacheKey) -> None:
+        with self._lock:
+            self._early_writes.pop(key, None)
+            if key in self._entries:
+                self._remove(key)
+                self.stale += 1
+
+    def invalidate_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == thread_id]:
+                self._remove(key)
+            for key in [k for k in self._early_writes if k[0] == thread_id]:
+                del self._early_writes[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale": self.stale,
+            }
+
+    @staticmethod
+    def _apply_writes(
+        target: Writes, task_id: str, task_path: str, writes: Sequence[Tuple[str, Any]]
+    ) -> None:
+        overwrite = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        for idx, (channel, value) in enumerate(writes):
+            write_key = (task_path, task_id, WRITES_IDX_MAP.get(channel, idx))
+            if overwrite or write_key not in target:
+                target[write_key] = (task_id, channel, deepcopy(value))
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
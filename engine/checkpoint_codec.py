@@ -0,0 +1,152 @@
+"""
+Checkpoint Codec
+
+Serializer wrapper that compresses checkpoint payloads (blobs, pending writes and
+thread_messages rows) above a size threshold. Modeled on langgraph's
+EncryptedSerializer: the codec name is appended to the serialized type
+("msgpack" -> "msgpack+zstd"), so untagged rows written before the codec was enabled
+are read as-is, and tagged rows stay readable after the codec is turned off.
+
+Codecs:
+- zlib: standard library, always available.
+- zstd: requires the optional `zstandard` package; falls back to zlib when missing.
+  An optional shared dictionary (CHECKPOINT_CODEC_ZSTD_DICT, trained with
+  `zstd --train` on sample payloads) improves the ratio on small payloads. Payloads
+  compressed with a dictionary can only be read while that same dictionary is
+  configured.
+"""
+
+import zlib
+from os import getenv
+from typing import Any, Dict, Optional
+
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from engine.log import logger
+
+
+class ZlibCodec:
+    name = "zlib"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZstdCodec:
+    name = "zstd"
+
+    def __init__(self, level: int = 3, dictionary: Optional[bytes] = None):
+        import zstandard
+
+        self._zstd = zstandard
+        self.level = level
+        self.dictionary = (
+            zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        )
+        self._dict_id = self.dictionary.dict_id() if self.dictionary else 0
+
+    def compress(self, data: bytes) -> bytes:
+        # Compressor objects are not thread-safe; serialization runs in executor threads
+        return self._zstd.ZstdCompressor(
+            level=self.level, dict_data=self.dictionary
+        ).compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        dict_id = self._zstd.get_frame_parameters(data).dict_id
+        if dict_id and dict_id != self._dict_id:
+            raise ValueError(
+                f"Checkpoint payload was compressed with zstd dictionary {dict_id}, "
+                f"but the configured dictionary is {self._dict_id or 'none'}"
+            )
+        return self._zstd.ZstdDecompressor(
+            dict_data=self.dictionary if dict_id else None
+        ).decompress(data)
+
+
+def _lazy_zstd() -> ZstdCodec:
+    """Decoder for zstd rows when another codec (or none) is configured for writing."""
+    return ZstdCodec(dictionary=_read_dictionary(getenv("CHECKPOINT_CODEC_ZSTD_DICT", "")))
+
+
+def _read_dictionary(path: str) -> Optional[bytes]:
+    if not path:
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class CompressingSerializer(SerializerProtocol):
+    """Compresses serialized payloads of at least `min_bytes` with `codec`.
+
+    With codec=None nothing is compressed, but tagged payloads are still decoded.
+    """
+
+    def __init__(
+        self,
+        serde: Optional[SerializerProtocol] = None,
+        codec: Optional[Any] = None,
+        min_bytes: int = 1024,
+    ):
+        self.serde = serde or JsonPlusSerializer()
+        self.codec = codec
+        self.min_bytes = min_bytes
+        self._decoders: Dict[str, Any] = {"zlib": ZlibCodec()}
+        if codec is not None:
+            self._decoders[codec.name] = codec
+
+    @classmethod
+    def from_env(cls, serde: Optional[SerializerProtocol] = None) -> "CompressingSerializer":
+        """Build from CHECKPOINT_CODEC (none|zlib|zstd), CHECKPOINT_CODEC_MIN_BYTES,
+        CHECKPOINT_CODEC_LEVEL and CHECKPOINT_CODEC_ZSTD_DICT."""
+        name = getenv("CHECKPOINT_CODEC", "none").lower()
+        level = getenv("CHECKPOINT_CODEC_LEVEL", "")
+        codec = None
+        if name == "zstd":
+            try:
+                codec = ZstdCodec(
+                    level=int(level) if level else 3,
+                    dictionary=_read_dictionary(getenv("CHECKPOINT_CODEC_ZSTD_DICT", "")),
+                )
+            except ImportError:
+                logger.warning(
+                    "[Checkpoint] CHECKPOINT_CODEC=zstd but zstandard is not installed, using zlib"
+                )
+                name = "zlib"
+        if name == "zlib":
+            codec = ZlibCodec(level=int(level) if level else 6)
+        elif codec is None and name not in ("", "none"):
+            logger.warning(f"[Checkpoint] Unknown CHECKPOINT_CODEC '{name}', compression disabled")
+        return cls(
+            serde=serde,
+            codec=codec,
+            min_bytes=int(getenv("CHECKPOINT_CODEC_MIN_BYTES", "1024")),
+        )
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        typ, data = self.serde.dumps_typed(obj)
+        if self.codec is None or len(data) < self.min_bytes:
+            return typ, data
+        compressed = self.codec.compress(data)
+        if len(compressed) >= len(data):
+            return typ, data
+        return f"{typ}+{self.codec.name}", compressed
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        typ, payload = data
+        base, _, codec_name = typ.rpartition("+")
+        if not base:
+            return self.serde.loads_typed(data)
+        decoder = self._decoders.get(codec_name)
+        if decoder is None and codec_name == "zstd":
+            decoder = self._decoders["zstd"] = _lazy_zstd()
+        if decoder is None:
+            # Not ours (e.g. an encrypted payload): let the wrapped serializer handle it
+            return self.serde.loads_typed(data)
+        return self.serde.loads_typed((base, decoder.decompress(payload)))
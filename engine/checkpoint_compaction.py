@@ -0,0 +1,286 @@
+"""
+Checkpoint Compaction
+
+Every superstep of the ReAct graph adds a checkpoint (plus blobs and writes), but the
+agent only ever resumes from the latest one. This module deletes superseded history:
+per thread and namespace it keeps the `keep_latest` newest checkpoints and removes older
+ones together with their pending writes and the blob versions no kept checkpoint
+references.
+
+Safe to run against live traffic:
+- only checkpoints older than `min_age_seconds` are removed, and never the latest
+  `keep_latest` (at least 1) of a namespace, so an in-flight run always keeps its parent;
+- blobs are only deleted if a *deleted* checkpoint referenced them. Blobs written by an
+  in-flight aput (committed before its checkpoint row) have new versions and are never
+  touched; unchanged channels of the new checkpoint share versions with its (kept)
+  parent;
+- pending writes are only deleted for deleted checkpoints, never as "orphans" (writes
+  can be committed before their checkpoint);
+- each batch runs in its own short transaction under a per-thread advisory lock, so
+  concurrent compactors skip each other's threads;
+- deleted content-addressed blob references release their refcount; the content itself
+  is only collected by acollect_blob_content once it has been unreferenced for longer
+  than the savers remember hashes (engine/content_blobs.py).
+
+thread_messages rows are never touched. Used by scripts/compact_checkpoints.py.
+"""
+
+import asyncio
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Optional
+
+from engine.content_blobs import CONTENT_BLOB_TYPE
+
+# Distinct thread_ids after a cursor, as a loose index scan over the checkpoints PK
+# (plain DISTINCT would read every checkpoint row).
+SELECT_THREADS_SQL = """
+    WITH RECURSIVE t AS (
+        (SELECT thread_id FROM checkpoints WHERE thread_id > %(after)s ORDER BY thread_id LIMIT 1)
+        UNION ALL
+        SELECT (
+            SELECT c.thread_id FROM checkpoints c
+             WHERE c.thread_id > t.thread_id
+             ORDER BY c.thread_id
+             LIMIT 1
+        )
+          FROM t
+         WHERE t.thread_id IS NOT NULL
+    )
+    SELECT thread_id FROM t WHERE thread_id IS NOT NULL LIMIT %(limit)s
+"""
+
+TRY_LOCK_THREAD_SQL = """
+    SELECT pg_try_advisory_xact_lock(hashtextextended('eai-compact:' || %s, 0)) AS locked
+"""
+
+# One bounded batch for one thread: the oldest `batch` removable checkpoints
+COMPACT_BATCH_SQL = f"""
+    WITH ranked AS (
+        SELECT checkpoint_ns, checkpoint_id, checkpoint,
+               row_number() OVER (PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+          FROM checkpoints
+         WHERE thread_id = %(thread_id)s
+    ),
+    doomed AS (
+        SELECT checkpoint_ns, checkpoint_id, checkpoint
+          FROM ranked
+         WHERE rn > %(keep_latest)s
+           AND (checkpoint ->> 'ts')::timestamptz < now() - make_interval(secs => %(min_age_seconds)s)
+         ORDER BY checkpoint_id
+         LIMIT %(batch_size)s
+    ),
+    doomed_refs AS (
+        SELECT d.checkpoint_ns, v.key AS channel, v.value AS version
+          FROM doomed d, jsonb_each_text(d.checkpoint -> 'channel_versions') v
+    ),
+    kept_refs AS (
+        SELECT r.checkpoint_ns, v.key AS channel, v.value AS version
+          FROM ranked r, jsonb_each_text(r.checkpoint -> 'channel_versions') v
+         WHERE NOT EXISTS (
+             SELECT 1 FROM doomed d
+              WHERE d.checkpoint_ns = r.checkpoint_ns AND d.checkpoint_id = r.checkpoint_id
+         )
+    ),
+    del_blobs AS (
+        DELETE FROM checkpoint_blobs b
+         USING (SELECT * FROM doomed_refs EXCEPT SELECT * FROM kept_refs) x
+         WHERE b.thread_id = %(thread_id)s
+           AND b.checkpoint_ns = x.checkpoint_ns
+           AND b.channel = x.channel
+           AND b.version = x.version
+        RETURNING b.type, b.blob, pg_column_size(b.*) AS size
+    ),
+    release_content AS (
+        UPDATE checkpoint_blob_content c
+           SET refcount = c.refcount - r.n,
+               zeroed_at = CASE WHEN c.refcount - r.n <= 0 THEN now() END
+          FROM (
+              SELECT blob, count(*) AS n FROM del_blobs
+               WHERE type = '{CONTENT_BLOB_TYPE}'
+               GROUP BY blob
+          ) r
+         WHERE c.hash = r.blob
+    ),
+    del_writes AS (
+        DELETE FROM checkpoint_writes w
+         USING doomed d
+         WHERE w.thread_id = %(thread_id)s
+           AND w.checkpoint_ns = d.checkpoint_ns
+           AND w.checkpoint_id = d.checkpoint_id
+        RETURNING pg_column_size(w.*) AS size
+    ),
+    del_checkpoints AS (
+        DELETE FROM checkpoints c
+         USING doomed d
+         WHERE c.thread_id = %(thread_id)s
+           AND c.checkpoint_ns = d.checkpoint_ns
+           AND c.checkpoint_id = d.checkpoint_id
+        RETURNING pg_column_size(c.*) AS size
+    )
+    SELECT
+        (SELECT count(*) FROM del_checkpoints) AS checkpoints,
+        (SELECT count(*) FROM del_blobs) AS blobs,
+        (SELECT count(*) FROM del_writes) AS writes,
+        (SELECT COALESCE(sum(size), 0) FROM del_checkpoints)
+          + (SELECT COALESCE(sum(size), 0) FROM del_blobs)
+          + (SELECT COALESCE(sum(size), 0) FROM del_writes) AS bytes
+"""
+
+
+# Unreferenced content, once the grace period has passed
+COLLECT_CONTENT_SQL = """
+    WITH doomed AS (
+        SELECT hash FROM checkpoint_blob_content
+         WHERE refcount <= 0
+           AND zeroed_at < now() - make_interval(secs => %(grace_seconds)s)
+         LIMIT %(batch_size)s
+           FOR UPDATE SKIP LOCKED
+    ),
+    gone AS (
+        DELETE FROM checkpoint_blob_content c
+         USING doomed d
+         WHERE c.hash = d.hash
+           AND c.refcount <= 0
+           AND c.zeroed_at < now() - make_interval(secs => %(grace_seconds)s)
+        RETURNING pg_column_size(c.*) AS size
+    )
+    SELECT count(*) AS blobs, COALESCE(sum(size), 0) AS bytes FROM gone
+"""
+
+
+class _DryRunRollback(Exception):
+    """Raised inside a transaction to roll back a dry-run batch."""
+
+
+@dataclass
+class CompactionStats:
+    threads: int = 0
+    skipped_threads: int = 0
+    checkpoints: int = 0
+    blobs: int = 0
+    writes: int = 0
+    bytes: int = 0  # approximate: sum of pg_column_size of the deleted rows
+
+    def add(self, other: "CompactionStats") -> None:
+        for name, value in asdict(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+
+async def acompact_thread(
+    conn,
+    thread_id: str,
+    *,
+    keep_latest: int = 5,
+    min_age_seconds: int = 3600,
+    batch_size: int = 500,
+    sleep_seconds: float = 0.0,
+    apply: bool = False,
+) -> CompactionStats:
+    """Compact one thread in batches of at most `batch_size` checkpoints.
+
+    `conn` is a psycopg AsyncConnection in autocommit mode with a dict_row row factory.
+    With apply=False every batch is executed and rolled back, so the returned stats are
+    exact (only the first batch is measured).
+    """
+    if keep_latest < 1:
+        raise ValueError("keep_latest must be at least 1")
+
+    stats = CompactionStats(threads=1)
+    params = {
+        "thread_id": thread_id,
+        "keep_latest": keep_latest,
+        "min_age_seconds": min_age_seconds,
+        "batch_size": batch_size,
+    }
+    while True:
+        batch = None
+        try:
+            async with conn.transaction():
+                cur = await conn.execute(TRY_LOCK_THREAD_SQL, (thread_id,))
+                if not (await cur.fetchone())["locked"]:
+                    return CompactionStats(skipped_threads=1)
+                cur = await conn.execute(COMPACT_BATCH_SQL, params)
+                batch = await cur.fetchone()
+                if not apply:
+                    raise _DryRunRollback()
+        except _DryRunRollback:
+            pass
+
+        stats.add(
+            CompactionStats(
+                checkpoints=batch["checkpoints"],
+                blobs=batch["blobs"],
+                writes=batch["writes"],
+                bytes=batch["bytes"],
+            )
+        )
+        if not apply or batch["checkpoints"] < batch_size:
+            return stats
+        if sleep_seconds:
+            await asyncio.sleep(sleep_seconds)
+
+
+async def acompact(
+    conn,
+    *,
+    after_thread_id: str = "",
+    max_threads: Optional[int] = None,
+    thread_batch: int = 100,
+    sleep_seconds: float = 0.0,
+    **thread_kwargs,
+) -> AsyncIterator[tuple[str, CompactionStats]]:
+    """Compact threads in thread_id order, starting after `after_thread_id`.
+
+    Yields (thread_id, stats) after each thread, so callers can persist thread_id as a
+    resume cursor. Remaining keyword arguments go to acompact_thread.
+    """
+    done = 0
+    after = after_thread_id
+    while max_threads is None or done < max_threads:
+        limit = thread_batch if max_threads is None else min(thread_batch, max_threads - done)
+        cur = await conn.execute(SELECT_THREADS_SQL, {"after": after, "limit": limit})
+        thread_ids = [row["thread_id"] for row in await cur.fetchall()]
+        if not thread_ids:
+            return
+        for thread_id in thread_ids:
+            stats = await acompact_thread(
+                conn, thread_id, sleep_seconds=sleep_seconds, **thread_kwargs
+            )
+            done += 1
+            after = thread_id
+            yield thread_id, stats
+            if sleep_seconds:
+                await asyncio.sleep(sleep_seconds)
+
+
+async def acollect_blob_content(
+    conn,
+    *,
+    grace_seconds: int = 86400,
+    batch_size: int = 500,
+    sleep_seconds: float = 0.0,
+    apply: bool = False,
+) -> CompactionStats:
+    """Delete content-addressed blobs unreferenced for at least `grace_seconds`.
+
+    The grace period must exceed the savers' ContentBlobStore.known_ttl_seconds.
+    With apply=False only the first batch is measured and rolled back.
+    """
+    stats = CompactionStats()
+    params = {"grace_seconds": grace_seconds, "batch_size": batch_size}
+    while True:
+        batch = None
+        try:
+            async with conn.transaction():
+                cur = await conn.execute(COLLECT_CONTENT_SQL, params)
+                batch = await cur.fetchone()
+                if not apply:
+                    raise _DryRunRollback()
+        except _DryRunRollback:
+            pass
+
+        stats.add(CompactionStats(blobs=batch["blobs"], bytes=batch["bytes"]))
+        if not apply or batch["blobs"] < batch_size:
+            return stats
+        if sleep_seconds:
+            await asyncio.sleep(sleep_seconds)
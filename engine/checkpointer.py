@@ -0,0 +1,829 @@
+"""
+Checkpoint Savers
+
+IntVersionPostgresSaver (async_query / async_stream_query) and
+IntVersionSyncPostgresSaver (query / stream_query) share IntVersionSaverMixin: the
+namespace/version hashing, integer versions, legacy fixes and migrations needed to
+read every checkpoint format this agent has written. Kept apart from engine/agent.py
+so scripts and tests can use the savers without importing the LLM and telemetry stack.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import time
+from contextlib import asynccontextmanager, contextmanager
+from copy import deepcopy
+from os import getenv
+
+from langgraph.checkpoint.base import (
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_serializable_checkpoint_metadata,
+)
+from langgraph.checkpoint.postgres import PostgresSaver
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+from engine.checkpoint_cache import CheckpointCache
+from engine.content_blobs import (
+    CONTENT_BLOB_MIGRATIONS,
+    INSERT_CONTENT_REF_SQL,
+    INSERT_CONTENT_SQL,
+    RELEASE_THREAD_REFS_SQL,
+    SELECT_SQL as CONTENT_SELECT_SQL,
+    ContentBlobStore,
+)
+from engine.log import logger
+from engine.message_store import (
+    DELETE_THREAD_MESSAGES_SQL,
+    LOCK_THREAD_MESSAGES_SQL,
+    MESSAGE_ARCHIVE_MIGRATIONS,
+    MESSAGE_STORE_BLOB_TYPE,
+    MESSAGE_STORE_MIGRATIONS,
+    UPSERT_MESSAGES_REF_BLOB_SQL,
+    UPSERT_THREAD_MESSAGE_SQL,
+    HistoryWindow,
+    MessageStoreRef,
+    ThreadMessageStore,
+)
+from engine.thread_summary import DELETE_THREAD_SUMMARY_SQL, THREAD_SUMMARY_MIGRATIONS
+from engine.utils.latency import LatencyStats
+
+
+# Threads still served through the legacy fixes of IntVersionPostgresSaver._aget_tuple.
+# Full scan of checkpoints: meant for status scripts, not for the request path.
+COUNT_LEGACY_THREADS_SQL = """
+    SELECT count(*) AS legacy_threads
+      FROM (
+          SELECT DISTINCT ON (thread_id, checkpoint_ns) checkpoint
+            FROM checkpoints
+           ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC
+      ) latest
+     WHERE EXISTS (
+         SELECT 1
+           FROM jsonb_each(latest.checkpoint -> 'channel_versions') AS v
+          WHERE jsonb_typeof(v.value) = 'string'
+     )
+"""
+
+
+class IntVersionSaverMixin:
+    """Checkpoint compatibility logic shared by the async and sync savers.
+
+    Namespace/version hashing, integer versions, the extra migrations, message-store
+    references and the legacy fixes applied on load (see IntVersionPostgresSaver).
+    Must come before the langgraph saver in the bases.
+    """
+
+    # Resolves content-addressed blobs in the same query
+    SELECT_SQL = CONTENT_SELECT_SQL
+
+    # Own migrations, versioned in a separate table so they never collide with the
+    # numbering of langgraph's checkpoint_migrations.
+    EXTRA_MIGRATIONS = [
+        """CREATE TABLE IF NOT EXISTS eai_checkpoint_migrations (
+    v INTEGER PRIMARY KEY
+);""",
+        *MESSAGE_STORE_MIGRATIONS,
+        *MESSAGE_ARCHIVE_MIGRATIONS,
+        *CONTENT_BLOB_MIGRATIONS,
+        *THREAD_SUMMARY_MIGRATIONS,
+    ]
+
+    @staticmethod
+    def _safe_ns(ns: str) -> str:
+        """Return ns unchanged if short enough; otherwise return a stable 37-byte hash."""
+        max_bytes = int(getenv("NS_MAX_BYTES", "2500"))
+        prefix = getenv("NS_HASH_PREFIX", "hash:")
+        if len(ns.encode()) > max_bytes:
+            return prefix + hashlib.md5(ns.encode()).hexdigest()
+        return ns
+
+    @staticmethod
+    def _safe_version(v) -> str:
+        """Return version unchanged if short enough; otherwise return a stable 37-byte hash."""
+        max_bytes = int(getenv("NS_VERSION_MAX_BYTES", "2000"))
+        s = str(v)
+        if len(s.encode()) > max_bytes:
+            return "hash:" + hashlib.md5(s.encode()).hexdigest()
+        return s
+
+    def _safe_config(self, config):
+        return {
+            **config,
+            "configurable": {
+                **config["configurable"],
+                "checkpoint_ns": self._safe_ns(config["configurable"].get("checkpoint_ns", "")),
+            },
+        }
+
+    def get_next_version(self, current, channel):
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            # Strip the 16-digit random suffix that was appended on the previous write
+            # to recover the logical counter. Without this, every call appends 16 more
+            # digits to an already-giant integer, growing versions without bound.
+            s = str(current)
+            current_v = int(s[:-16]) if len(s) > 16 else current
+        else:
+            current_v = int(current.split(".")[0])
+        return int(f"{current_v + 1}{int(random.random() * 10**16):016}")
+
+    def _split_channel_values(self, checkpoint, new_versions):
+        """Split a checkpoint for writing.
+
+        Returns (checkpoint copy with the inline values, blob values, blob versions,
+        messages for the store or None).
+        """
+        copy = checkpoint.copy()
+        copy["channel_values"] = copy["channel_values"].copy()
+        # Inline primitive values in the checkpoint table, others go to blobs
+        blob_values = {
+            k: copy["channel_values"].pop(k)
+            for k, v in checkpoint["channel_values"].items()
+            if not (v is None or isinstance(v, (str, int, float, bool)))
+        }
+        messages = blob_values.get("messages")
+        if (
+            self._message_store_enabled
+            and "messages" in new_versions
+            and isinstance(messages, list)
+        ):
+            blob_values.pop("messages")
+        else:
+            messages = None
+        blob_versions = {k: v for k, v in new_versions.items() if k in blob_values}
+        return copy, blob_values, blob_versions, messages
+
+    def _dump_and_split_blobs(self, thread_id, checkpoint_ns, blob_values, blob_versions):
+        """Return (plain blob rows, content rows, content refs) for the blob upserts."""
+        blob_rows = self._dump_blobs(thread_id, checkpoint_ns, blob_values, blob_versions)
+        if self.content_blobs is None:
+            return blob_rows, [], []
+        return self.content_blobs.split(blob_rows)
+
+    def _load_blobs(self, blob_values):
+        if not blob_values:
+            return {}
+        refs = {
+            k.decode(): MessageStoreRef(int(v))
+            for k, t, v in blob_values
+            if t.decode() == MESSAGE_STORE_BLOB_TYPE
+        }
+        if not refs:
+            return super()._load_blobs(blob_values)
+        return {
+            **super()._load_blobs(
+                [(k, t, v) for k, t, v in blob_values if k.decode() not in refs]
+            ),
+            **refs,
+        }
+
+    def _fix_legacy(self, result) -> bool:
+        """Apply the legacy fixes to a loaded checkpoint in place; True if anything changed."""
+        from langchain_core.load import load as lc_load
+
+        thread_id = result.config["configurable"]["thread_id"]
+        upgraded = False
+
+        # Fix 1: normalize legacy string channel versions
+        cv = result.checkpoint.get("channel_versions", {})
+        if any(isinstance(v, str) for v in cv.values()):
+            result.checkpoint["channel_versions"] = {
+                k: int(v.replace(".", "")) if isinstance(v, str) else v
+                for k, v in cv.items()
+            }
+            vs = result.checkpoint.get("versions_seen", {})
+            result.checkpoint["versions_seen"] = {
+                node: {
+                    c: int(ver.replace(".", "")) if isinstance(ver, str) else ver
+                    for c, ver in chans.items()
+                }
+                for node, chans in vs.items()
+            }
+            upgraded = True
+            logger.info(f"[Checkpoint] Normalized legacy string versions for thread '{thread_id}'")
+
+        # Fix 2: deserialize legacy LangChain-serialized messages
+        # Pre-migration messages are stored as dumpd() dicts: {"lc": 1, "type": "constructor", ...}
+        # The new langchain_core no longer handles these in convert_to_messages.
+        channel_values = result.checkpoint.get("channel_values", {})
+        messages = channel_values.get("messages", [])
+        legacy_msgs = [m for m in messages if isinstance(m, dict) and m.get("lc") == 1]
+        if legacy_msgs:
+            try:
+                channel_values["messages"] = [
+                    lc_load(m) if isinstance(m, dict) and m.get("lc") == 1 else m
+                    for m in messages
+                ]
+                upgraded = True
+                logger.info(f"[Checkpoint] Deserialized {len(legacy_msgs)} legacy messages for thread '{thread_id}'")
+            except Exception as e:
+                logger.error(f"[Checkpoint] Failed to deserialize legacy messages for thread '{thread_id}': {e}")
+
+        if upgraded:
+            self.legacy_stats["legacy_loads"] += 1
+        return upgraded
+
+
+class IntVersionPostgresSaver(IntVersionSaverMixin, AsyncPostgresSaver):
+    """
+    Fixes compatibility issues for threads with pre-migration checkpoint history.
+
+    Two problems fixed on load via aget_tuple() (with legacy_write_back=True the fixed
+    checkpoint is written back in the background, so each thread is only fixed once):
+
+    1. TypeError: '>' not supported between instances of 'str' and 'int'
+       LangGraph's get_next_version() returns strings, but pre-migration checkpoints stored
+       integer versions. Fix: override get_next_version() to always return integers, and
+       normalize any remaining string versions on load.
+
+    2. ValueError: Message dict must contain 'role' and 'content' keys
+       Pre-migration checkpoints stored messages using LangChain's dumpd() serialization
+       format ({"lc": 1, "type": "constructor", "kwargs": {...}}). The new langchain_core
+       no longer handles this format in convert_to_messages. Fix: deserialize those dicts
+       back into proper message objects using langchain_core.load.load() on load.
+
+    Optionally (message_store=True) the `messages` channel is persisted one row per
+    message in thread_messages and only the tail selected by `history_window` is
+    loaded by aget_tuple(); see engine/message_store.py. Threads written by the store
+    are always read back through it, even if the option is later disabled.
+
+    aput queues every statement of a superstep (messages, blobs, checkpoint row) in a
+    single psycopg pipeline; latency_stats() reports recent aput/aput_writes timings.
+    With an AsyncConnectionPool each operation checks out its own connection instead
+    of taking the saver-wide lock, so concurrent turns use the whole pool.
+
+    With a CheckpointCache, the latest tuple of each thread is kept in memory and
+    aget_tuple only goes to the database on a miss (or for a cheap checkpoint_id probe
+    once the entry is older than the cache trust window); see engine/checkpoint_cache.py.
+
+    With a ContentBlobStore, large blobs are stored once per distinct payload in
+    checkpoint_blob_content and referenced by hash; see engine/content_blobs.py.
+    """
+
+    SELECT_LATEST_CHECKPOINT_ID_SQL = """
+        SELECT checkpoint_id
+          FROM checkpoints
+         WHERE thread_id = %s AND checkpoint_ns = %s
+         ORDER BY checkpoint_id DESC
+         LIMIT 1
+    """
+
+    def __init__(
+        self,
+        conn,
+        pipe=None,
+        serde=None,
+        *,
+        message_store: bool = False,
+        history_window: HistoryWindow | None = None,
+        cache: CheckpointCache | None = None,
+        legacy_write_back: bool = False,
+        content_blobs: ContentBlobStore | None = None,
+    ):
+        super().__init__(conn, pipe=pipe, serde=serde)
+        self._message_store_enabled = message_store
+        self._message_store = ThreadMessageStore(self.serde)
+        self._history_window = history_window or HistoryWindow()
+        self.cache = cache
+        # Per-superstep database latency of aput / aput_writes (see latency_stats)
+        self.latency = LatencyStats()
+        # In-flight cache-miss loads, so concurrent readers of a thread share one query
+        self._cache_loads: dict[tuple[str, str], asyncio.Future] = {}
+        self._legacy_write_back = legacy_write_back
+        # Background write-backs in flight, by checkpoint_id (keeps task references alive)
+        self._write_backs: dict[str, asyncio.Task] = {}
+        self.legacy_stats = {"legacy_loads": 0, "upgraded": 0, "failed": 0}
+        self.content_blobs = content_blobs
+
+    @asynccontextmanager
+    async def _cursor(self, *, pipeline: bool = False):
+        if self.pipe or not isinstance(self.conn, AsyncConnectionPool):
+            async with super()._cursor(pipeline=pipeline) as cur:
+                yield cur
+            return
+        # A pooled connection belongs to this call only: no saver-wide lock needed
+        async with self.conn.connection() as conn:
+            if not pipeline:
+                async with conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+            elif self.supports_pipeline:
+                async with conn.pipeline(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+            else:
+                async with conn.transaction(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+
+    async def setup(self) -> None:
+        await super().setup()
+        async with self._cursor() as cur:
+            await cur.execute(self.EXTRA_MIGRATIONS[0])
+            results = await cur.execute(
+                "SELECT v FROM eai_checkpoint_migrations ORDER BY v DESC LIMIT 1"
+            )
+            row = await results.fetchone()
+            version = -1 if row is None else row["v"]
+            for v in range(version + 1, len(self.EXTRA_MIGRATIONS)):
+                await cur.execute(self.EXTRA_MIGRATIONS[v])
+                await cur.execute(
+                    "INSERT INTO eai_checkpoint_migrations (v) VALUES (%s)", (v,)
+                )
+        if self.pipe:
+            await self.pipe.sync()
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        safe_config = self._safe_config(config)
+        safe_new_versions = {k: self._safe_version(v) for k, v in new_versions.items()}
+        key = (safe_config["configurable"]["thread_id"], safe_config["configurable"]["checkpoint_ns"])
+
+        # Write-through before the first await, so aput_writes for the new checkpoint
+        # (scheduled right after this call) always finds it in the cache.
+        if self.cache is not None:
+            self._cache_put_checkpoint(key, safe_config, checkpoint, metadata)
+
+        try:
+            return await self._aput_pipelined(key, safe_config, checkpoint, metadata, safe_new_versions)
+        except Exception:
+            if self.cache is not None:
+                self.cache.invalidate(key)
+            raise
+
+    async def _aput_pipelined(self, key, config, checkpoint, metadata, new_versions):
+        """Same writes as AsyncPostgresSaver.aput, all queued in a single pipeline.
+
+        Messages (when the store is enabled), blobs and the checkpoint row are sent
+        together in one transaction and synced once, so a superstep costs one round trip
+        regardless of how many channels changed (two when content references are
+        checked before the commit).
+        """
+        thread_id, checkpoint_ns = key
+        start = time.perf_counter()
+
+        copy, blob_values, blob_versions, messages = self._split_channel_values(
+            checkpoint, new_versions
+        )
+        store_messages = messages is not None
+
+        message_params = []
+        blob_rows, contents, refs = [], [], []
+        if blob_versions:
+            blob_rows, contents, refs = await asyncio.to_thread(
+                self._dump_and_split_blobs, thread_id, checkpoint_ns, blob_values, blob_versions
+            )
+        # The thread's message lock (if taken) is held until the transaction commits
+        async with self._cursor(pipeline=True) as cur, cur.connection.transaction():
+            if store_messages:
+                message_params = await self._message_store.aprepare(*key, messages)
+                if message_params:
+                    await cur.execute(LOCK_THREAD_MESSAGES_SQL, key)
+                    await cur.executemany(UPSERT_THREAD_MESSAGE_SQL, message_params)
+                await cur.execute(
+                    UPSERT_MESSAGES_REF_BLOB_SQL,
+                    (thread_id, checkpoint_ns, "messages", str(new_versions["messages"]), thread_id, checkpoint_ns),
+                )
+            if blob_rows:
+                await cur.executemany(self.UPSERT_CHECKPOINT_BLOBS_SQL, blob_rows)
+            if contents:
+                await cur.executemany(INSERT_CONTENT_SQL, contents)
+            await cur.execute(
+                self.UPSERT_CHECKPOINTS_SQL,
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    Jsonb(copy),
+                    Jsonb(get_serializable_checkpoint_metadata(config, metadata)),
+                ),
+            )
+            if refs:
+                # Checked before the transaction commits, on their own cursor: in a
+                # pipeline, results of earlier statements arrive on the shared one
+                async with cur.connection.cursor(row_factory=dict_row) as ref_cur:
+                    await ref_cur.executemany(INSERT_CONTENT_REF_SQL, refs, returning=True)
+                    dangling = []
+                    for _ in refs:
+                        dangling.append((await ref_cur.fetchone())["dangling"])
+                        ref_cur.nextset()
+                self.content_blobs.check_refs(refs, dangling)
+        if contents:
+            self.content_blobs.remember(contents)
+        if store_messages:
+            self._message_store.remember(
+                *key, ThreadMessageStore.known_from_messages(messages)
+            )
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.latency.record("aput", elapsed_ms)
+        logger.debug(
+            f"[Checkpoint] aput {elapsed_ms:.1f} ms for thread '{thread_id}' "
+            f"({len(blob_versions)} blobs, {len(message_params)} messages)"
+        )
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def _cache_put_checkpoint(self, key, config, checkpoint, metadata):
+        """Cache the tuple aget_tuple would load right after this aput."""
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+        self.cache.put(
+            key,
+            CheckpointTuple(
+                config={
+                    "configurable": {
+                        "thread_id": key[0],
+                        "checkpoint_ns": key[1],
+                        "checkpoint_id": checkpoint["id"],
+                    }
+                },
+                checkpoint=checkpoint,
+                # Same round trip as the JSONB metadata column
+                metadata=json.loads(
+                    json.dumps(get_serializable_checkpoint_metadata(config, metadata))
+                ),
+                parent_config=(
+                    {
+                        "configurable": {
+                            "thread_id": key[0],
+                            "checkpoint_ns": key[1],
+                            "checkpoint_id": parent_checkpoint_id,
+                        }
+                    }
+                    if parent_checkpoint_id
+                    else None
+                ),
+                pending_writes=[],
+            ),
+            written=True,
+        )
+
+    async def _aresolve_messages(self, result, window: HistoryWindow):
+        """Replace a MessageStoreRef in the loaded checkpoint with the actual messages."""
+        channel_values = result.checkpoint.get("channel_values", {})
+        ref = channel_values.get("messages")
+        if not isinstance(ref, MessageStoreRef):
+            return
+        configurable = result.config["configurable"]
+        async with self._cursor() as cur:
+            channel_values["messages"] = await self._message_store.aread_window(
+                cur,
+                configurable["thread_id"],
+                configurable["checkpoint_ns"],
+                ref.seq,
+                window,
+            )
+        logger.info(
+            f"[Checkpoint] Loaded {len(channel_values['messages'])} messages from thread_messages "
+            f"for thread '{configurable['thread_id']}'"
+        )
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        safe_config = self._safe_config(config)
+        start = time.perf_counter()
+        await super().aput_writes(safe_config, writes, task_id, task_path)
+        self.latency.record("aput_writes", (time.perf_counter() - start) * 1000)
+        if self.cache is not None:
+            self.cache.add_writes(
+                (safe_config["configurable"]["thread_id"], safe_config["configurable"]["checkpoint_ns"]),
+                safe_config["configurable"]["checkpoint_id"],
+                task_id,
+                task_path,
+                writes,
+            )
+
+    def latency_stats(self) -> dict:
+        """p50/p95/p99/max (ms) of recent aput and aput_writes calls."""
+        return self.latency.summary()
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        async with self._cursor() as cur:
+            await cur.execute(RELEASE_THREAD_REFS_SQL, (thread_id,))
+        await super().adelete_thread(thread_id)
+        async with self._cursor(pipeline=True) as cur:
+            for sql in DELETE_THREAD_MESSAGES_SQL:
+                await cur.execute(sql, (thread_id,))
+            await cur.execute(DELETE_THREAD_SUMMARY_SQL, (thread_id,))
+        self._message_store.forget(thread_id)
+        if self.cache is not None:
+            self.cache.invalidate_thread(thread_id)
+
+    async def aget_tuple(self, config):
+        if self.cache is None:
+            return await self._aget_tuple(config, self._history_window)
+
+        key = (
+            config["configurable"]["thread_id"],
+            self._safe_ns(config["configurable"].get("checkpoint_ns", "")),
+        )
+        checkpoint_id = get_checkpoint_id(config)
+        cached = await self._aget_cached_tuple(key, checkpoint_id)
+        if cached is not None:
+            return cached
+        if checkpoint_id:
+            # Older checkpoints (history, time travel) are never cached
+            return await self._aget_tuple(config, self._history_window)
+
+        load = self._cache_loads.get(key)
+        if load is None:
+            load = asyncio.ensure_future(self._aget_tuple_and_cache(key, config))
+            self._cache_loads[key] = load
+            load.add_done_callback(lambda _: self._cache_loads.pop(key, None))
+        result = await asyncio.shield(load)
+        logger.debug(f"[Checkpoint] Cache miss for thread '{key[0]}': {self.cache.stats()}")
+        return deepcopy(result)
+
+    async def _aget_cached_tuple(self, key, checkpoint_id):
+        """Serve a tuple from the cache, probing the database once the entry is no longer trusted."""
+        cached_id, trusted = self.cache.lookup(key)
+        if cached_id is None or trusted:
+            return self.cache.get(key, checkpoint_id)
+        if checkpoint_id:
+            return None
+        async with self._cursor() as cur:
+            await cur.execute(self.SELECT_LATEST_CHECKPOINT_ID_SQL, key)
+            row = await cur.fetchone()
+        # A newer checkpoint was written by another replica (or the thread was deleted).
+        # An older one means our own aput is still in flight: the cache is ahead.
+        if row is None or row["checkpoint_id"] > cached_id:
+            self.cache.invalidate(key)
+        return self.cache.get(key, validated=True)
+
+    async def _aget_tuple_and_cache(self, key, config):
+        result = await self._aget_tuple(config, self._history_window)
+        if result is not None:
+            self.cache.put(key, result)
+        return result
+
+    async def aget_full_history(self, config, *, include_archived: bool = False) -> list:
+        """Return every message of the thread, ignoring the configured history window.
+
+        Messages moved to thread_messages_archive (engine/message_archive.py) are only
+        included with include_archived=True (exports, audits).
+        """
+        result = await self._aget_tuple(config, HistoryWindow())
+        if not result:
+            return []
+        messages = list(result.checkpoint.get("channel_values", {}).get("messages", []))
+        if include_archived:
+            configurable = result.config["configurable"]
+            async with self._cursor() as cur:
+                archived = await self._message_store.aread_archived(
+                    cur, configurable["thread_id"], configurable["checkpoint_ns"]
+                )
+            messages = archived + messages
+        return messages
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        # Drain first: without a pool the parent generator holds the saver lock while yielding.
+        results = [
+            result
+            async for result in super().alist(config, filter=filter, before=before, limit=limit)
+        ]
+        for result in results:
+            await self._aresolve_messages(result, HistoryWindow())
+            yield result
+
+    async def _aget_tuple(self, config, window: HistoryWindow):
+        result = await super().aget_tuple(self._safe_config(config))
+        if result and result.checkpoint:
+            await self._aresolve_messages(result, window)
+            if self._fix_legacy(result) and self._legacy_write_back:
+                self._schedule_legacy_write_back(result)
+        return result
+
+    def _schedule_legacy_write_back(self, result) -> None:
+        """Persist the upgraded checkpoint in the background, so later loads skip both fixes."""
+        checkpoint_id = result.config["configurable"]["checkpoint_id"]
+        if checkpoint_id in self._write_backs:
+            return
+        # The caller owns (and may mutate) the returned tuple
+        task = asyncio.get_running_loop().create_task(
+            self._awrite_back_legacy(
+                deepcopy(result.config), deepcopy(result.checkpoint), deepcopy(result.metadata)
+            )
+        )
+        self._write_backs[checkpoint_id] = task
+        task.add_done_callback(lambda _: self._write_backs.pop(checkpoint_id, None))
+
+    async def _awrite_back_legacy(self, config, checkpoint, metadata) -> None:
+        """Rewrite a legacy checkpoint in place with integer versions and new-format messages.
+
+        The checkpoint row keeps its checkpoint_id and is updated by the aput upsert;
+        every blob is written again under its normalized version (blobs are looked up
+        by the version strings in channel_versions, so the old rows are simply no longer
+        referenced by this checkpoint).
+        """
+        configurable = config["configurable"]
+        key = (configurable["thread_id"], configurable["checkpoint_ns"])
+        versions = {
+            k: self._safe_version(v)
+            for k, v in checkpoint["channel_versions"].items()
+            if k in checkpoint["channel_values"]
+        }
+        try:
+            await self._aput_pipelined(key, config, checkpoint, metadata, versions)
+            self.legacy_stats["upgraded"] += 1
+            logger.info(
+                f"[Checkpoint] Upgraded legacy checkpoint {configurable['checkpoint_id']} "
+                f"for thread '{key[0]}' ({self.legacy_stats})"
+            )
+        except Exception as e:
+            self.legacy_stats["failed"] += 1
+            logger.warning(
+                f"[Checkpoint] Failed to upgrade legacy checkpoint for thread '{key[0]}': {e}"
+            )
+
+    async def acount_legacy_threads(self) -> int:
+        """Number of threads whose latest checkpoint still has legacy string versions."""
+        async with self._cursor() as cur:
+            await cur.execute(COUNT_LEGACY_THREADS_SQL)
+            row = await cur.fetchone()
+        return row["legacy_threads"]
+
+
+class IntVersionSyncPostgresSaver(IntVersionSaverMixin, PostgresSaver):
+    """Sync counterpart of IntVersionPostgresSaver, used by query() and stream_query().
+
+    Same namespace hashing, integer versions, legacy fixes, message store and
+    content-addressed blobs as the async saver. With a ConnectionPool every operation
+    checks out its own connection instead of taking the saver-wide lock, so concurrent
+    sync calls run in parallel rather than queuing on a single connection.
+
+    There is no checkpoint cache, and legacy checkpoints are fixed on every load
+    (the async path writes them back).
+    """
+
+    def __init__(
+        self,
+        conn,
+        pipe=None,
+        serde=None,
+        *,
+        message_store: bool = False,
+        history_window: HistoryWindow | None = None,
+        content_blobs: ContentBlobStore | None = None,
+    ):
+        super().__init__(conn, pipe=pipe, serde=serde)
+        self._message_store_enabled = message_store
+        self._message_store = ThreadMessageStore(self.serde)
+        self._history_window = history_window or HistoryWindow()
+        self.latency = LatencyStats()
+        self.legacy_stats = {"legacy_loads": 0}
+        self.content_blobs = content_blobs
+
+    @contextmanager
+    def _cursor(self, *, pipeline: bool = False):
+        if self.pipe or not isinstance(self.conn, ConnectionPool):
+            with super()._cursor(pipeline=pipeline) as cur:
+                yield cur
+            return
+        # A pooled connection belongs to this call only: no saver-wide lock needed
+        with self.conn.connection() as conn:
+            if not pipeline:
+                with conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+            elif self.supports_pipeline:
+                with conn.pipeline(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+            else:
+                with conn.transaction(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+
+    def setup(self) -> None:
+        super().setup()
+        with self._cursor() as cur:
+            cur.execute(self.EXTRA_MIGRATIONS[0])
+            row = cur.execute(
+                "SELECT v FROM eai_checkpoint_migrations ORDER BY v DESC LIMIT 1"
+            ).fetchone()
+            version = -1 if row is None else row["v"]
+            for v in range(version + 1, len(self.EXTRA_MIGRATIONS)):
+                cur.execute(self.EXTRA_MIGRATIONS[v])
+                cur.execute(
+                    "INSERT INTO eai_checkpoint_migrations (v) VALUES (%s)", (v,)
+                )
+        if self.pipe:
+            self.pipe.sync()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        """Same writes as IntVersionPostgresSaver._aput_pipelined, in one pipeline."""
+        config = self._safe_config(config)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        new_versions = {k: self._safe_version(v) for k, v in new_versions.items()}
+        start = time.perf_counter()
+
+        copy, blob_values, blob_versions, messages = self._split_channel_values(
+            checkpoint, new_versions
+        )
+        blob_rows, contents, refs = [], [], []
+        if blob_versions:
+            blob_rows, contents, refs = self._dump_and_split_blobs(
+                thread_id, checkpoint_ns, blob_values, blob_versions
+            )
+        with self._cursor(pipeline=True) as cur, cur.connection.transaction():
+            if messages is not None:
+                message_params = self._message_store.prepare(thread_id, checkpoint_ns, messages)
+                if message_params:
+                    cur.execute(LOCK_THREAD_MESSAGES_SQL, (thread_id, checkpoint_ns))
+                    cur.executemany(UPSERT_THREAD_MESSAGE_SQL, message_params)
+                cur.execute(
+                    UPSERT_MESSAGES_REF_BLOB_SQL,
+                    (thread_id, checkpoint_ns, "messages", str(new_versions["messages"]), thread_id, checkpoint_ns),
+                )
+            if blob_rows:
+                cur.executemany(self.UPSERT_CHECKPOINT_BLOBS_SQL, blob_rows)
+            if contents:
+                cur.executemany(INSERT_CONTENT_SQL, contents)
+            cur.execute(
+                self.UPSERT_CHECKPOINTS_SQL,
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    Jsonb(copy),
+                    Jsonb(get_serializable_checkpoint_metadata(config, metadata)),
+                ),
+            )
+            if refs:
+                with cur.connection.cursor(row_factory=dict_row) as ref_cur:
+                    ref_cur.executemany(INSERT_CONTENT_REF_SQL, refs, returning=True)
+                    dangling = []
+                    for _ in refs:
+                        dangling.append(ref_cur.fetchone()["dangling"])
+                        ref_cur.nextset()
+                self.content_blobs.check_refs(refs, dangling)
+        if contents:
+            self.content_blobs.remember(contents)
+        if messages is not None:
+            self._message_store.remember(
+                thread_id, checkpoint_ns, ThreadMessageStore.known_from_messages(messages)
+            )
+        self.latency.record("put", (time.perf_counter() - start) * 1000)
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        start = time.perf_counter()
+        super().put_writes(self._safe_config(config), writes, task_id, task_path)
+        self.latency.record("put_writes", (time.perf_counter() - start) * 1000)
+
+    def latency_stats(self) -> dict:
+        """p50/p95/p99/max (ms) of recent put and put_writes calls."""
+        return self.latency.summary()
+
+    def get_tuple(self, config):
+        result = super().get_tuple(self._safe_config(config))
+        if result and result.checkpoint:
+            self._resolve_messages(result, self._history_window)
+            self._fix_legacy(result)
+        return result
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        # Drain first: without a pool the parent generator holds the saver lock while yielding.
+        results = list(super().list(config, filter=filter, before=before, limit=limit))
+        for result in results:
+            self._resolve_messages(result, HistoryWindow())
+            yield result
+
+    def _resolve_messages(self, result, window: HistoryWindow):
+        """Replace a MessageStoreRef in the loaded checkpoint with the actual messages."""
+        channel_values = result.checkpoint.get("channel_values", {})
+        ref = channel_values.get("messages")
+        if not isinstance(ref, MessageStoreRef):
+            return
+        configurable = result.config["configurable"]
+        with self._cursor() as cur:
+            channel_values["messages"] = self._message_store.read_window(
+                cur,
+                configurable["thread_id"],
+                configurable["checkpoint_ns"],
+                ref.seq,
+                window,
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._cursor() as cur:
+            cur.execute(RELEASE_THREAD_REFS_SQL, (thread_id,))
+        super().delete_thread(thread_id)
+        with self._cursor(pipeline=True) as cur:
+            for sql in DELETE_THREAD_MESSAGES_SQL:
+                cur.execute(sql, (thread_id,))
+            cur.execute(DELETE_THREAD_SUMMARY_SQL, (thread_id,))
+        self._message_store.forget(thread_id)
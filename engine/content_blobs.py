@@ -0,0 +1,211 @@
+"""
+Content-Addressed Checkpoint Blobs
+
+Optional (CHECKPOINT_BLOB_DEDUP=true) deduplication of checkpoint_blobs payloads.
+Serialized blobs of at least `min_bytes` are stored once in checkpoint_blob_content,
+keyed by the SHA-256 of their type and bytes; the checkpoint_blobs row only keeps the
+hash (type CONTENT_BLOB_TYPE). Identical payloads - a channel re-versioned without
+changing, the same large tool output or instructions in many threads - are written
+once.
+
+- Each checkpoint_blobs reference counts once in checkpoint_blob_content.refcount.
+  The counter is incremented only when the reference row is actually inserted, and
+  decremented by adelete_thread and checkpoint compaction.
+- Hashes written or seen recently are remembered per process, so aput does not even
+  send the bytes of a payload it knows is stored.
+- Content whose refcount dropped to zero is deleted by the compaction job
+  (engine/checkpoint_compaction.py) only after a grace period longer than that
+  memory. Writing unreferenced content again restarts its grace period (the row is
+  locked and revived, or re-inserted if the collection won the race), so content
+  stays until the reference written in the same transaction is counted.
+- A reference whose content row is missing anyway fails the write: the transaction
+  is rolled back and the hash forgotten, so a retry sends the bytes again.
+- Reading is always supported: the saver's SELECT joins the content table, so
+  references resolve in the same query even if deduplication is disabled later.
+
+Note that the `messages` channel changes on every turn, so its whole-list blob rarely
+repeats; per-message storage is what engine/message_store.py is for.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from os import getenv
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# Type stored in checkpoint_blobs.type for a reference; blob holds the content hash
+CONTENT_BLOB_TYPE = "content_ref"
+
+CONTENT_BLOB_MIGRATIONS = [
+    """CREATE TABLE IF NOT EXISTS checkpoint_blob_content (
+    hash BYTEA PRIMARY KEY,
+    type TEXT NOT NULL,
+    blob BYTEA,
+    refcount INTEGER NOT NULL DEFAULT 0,
+    zeroed_at TIMESTAMPTZ
+);""",
+    """CREATE INDEX IF NOT EXISTS checkpoint_blob_content_zeroed_idx
+    ON checkpoint_blob_content (zeroed_at) WHERE refcount <= 0;""",
+]
+
+# langgraph's SELECT_SQL, with content references resolved through a join
+SELECT_SQL = f"""
+select
+    thread_id,
+    checkpoint,
+    checkpoint_ns,
+    checkpoint_id,
+    parent_checkpoint_id,
+    metadata,
+    (
+        select array_agg(array[
+            bl.channel::bytea,
+            COALESCE(bc.type, bl.type)::bytea,
+            CASE WHEN bl.type = '{CONTENT_BLOB_TYPE}' THEN bc.blob ELSE bl.blob END
+        ])
+        from jsonb_each_text(checkpoint -> 'channel_versions')
+        inner join checkpoint_blobs bl
+            on bl.thread_id = checkpoints.thread_id
+            and bl.checkpoint_ns = checkpoints.checkpoint_ns
+            and bl.channel = jsonb_each_text.key
+            and bl.version = jsonb_each_text.value
+        left join checkpoint_blob_content bc
+            on bl.type = '{CONTENT_BLOB_TYPE}' and bc.hash = bl.blob
+    ) as channel_values,
+    (
+        select
+        array_agg(array[cw.task_id::text::bytea, cw.channel::bytea, cw.type::bytea, cw.blob] order by cw.task_id, cw.idx)
+        from checkpoint_writes cw
+        where cw.thread_id = checkpoints.thread_id
+            and cw.checkpoint_ns = checkpoints.checkpoint_ns
+            and cw.checkpoint_id = checkpoints.checkpoint_id
+    ) as pending_writes
+from checkpoints """
+
+# Unreferenced content is revived: its grace period restarts from now
+INSERT_CONTENT_SQL = """
+    INSERT INTO checkpoint_blob_content (hash, type, blob)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (hash) DO UPDATE SET zeroed_at = now()
+     WHERE checkpoint_blob_content.refcount <= 0
+"""
+
+# Inserts the reference and counts it, only if the (channel, version) row is new.
+# `dangling` is true when the reference was inserted but its content row is missing.
+INSERT_CONTENT_REF_SQL = f"""
+    WITH ref AS (
+        INSERT INTO checkpoint_blobs (thread_id, checkpoint_ns, channel, version, type, blob)
+        VALUES (%s, %s, %s, %s, '{CONTENT_BLOB_TYPE}', %s)
+        ON CONFLICT (thread_id, checkpoint_ns, channel, version) DO NOTHING
+        RETURNING blob
+    ),
+    counted AS (
+        UPDATE checkpoint_blob_content
+           SET refcount = refcount + 1, zeroed_at = NULL
+         WHERE hash = (SELECT blob FROM ref)
+        RETURNING hash
+    )
+    SELECT EXISTS (SELECT 1 FROM ref) AND NOT EXISTS (SELECT 1 FROM counted) AS dangling
+"""
+
+# Releases the references of a thread (run before its checkpoint_blobs rows are deleted)
+RELEASE_THREAD_REFS_SQL = f"""
+    WITH gone AS (
+        DELETE FROM checkpoint_blobs
+         WHERE thread_id = %s AND type = '{CONTENT_BLOB_TYPE}'
+        RETURNING blob
+    )
+    UPDATE checkpoint_blob_content c
+       SET refcount = c.refcount - g.n,
+           zeroed_at = CASE WHEN c.refcount - g.n <= 0 THEN now() END
+      FROM (SELECT blob, count(*) AS n FROM gone GROUP BY blob) g
+     WHERE c.hash = g.blob
+"""
+
+
+def content_hash(type_: str, blob: bytes) -> bytes:
+    return hashlib.sha256(type_.encode() + b"\0" + blob).digest()
+
+
+class ContentBlobStore:
+    """Splits checkpoint_blobs rows into plain rows and content-addressed ones.
+
+    Remembers the hashes written in the last `known_ttl_seconds` (bounded LRU) to
+    skip re-sending their bytes. known_ttl_seconds must stay below the grace period
+    of the compaction job's content collection.
+    """
+
+    def __init__(
+        self,
+        min_bytes: int = 1024,
+        max_known: int = 65536,
+        known_ttl_seconds: float = 3600,
+    ):
+        self.min_bytes = min_bytes
+        self.max_known = max_known
+        self.known_ttl_seconds = known_ttl_seconds
+        self._known: "OrderedDict[bytes, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"blobs": 0, "bytes": 0, "skipped": 0, "skipped_bytes": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["ContentBlobStore"]:
+        """Build from CHECKPOINT_BLOB_DEDUP and CHECKPOINT_BLOB_DEDUP_MIN_BYTES (None if disabled)."""
+        if getenv("CHECKPOINT_BLOB_DEDUP", "false").lower() != "true":
+            return None
+        return cls(min_bytes=int(getenv("CHECKPOINT_BLOB_DEDUP_MIN_BYTES", "1024")))
+
+    def split(
+        self, rows: Iterable[Sequence]
+    ) -> Tuple[List[Sequence], List[tuple], List[tuple]]:
+        """Split UPSERT_CHECKPOINT_BLOBS_SQL params.
+
+        Returns (plain rows, INSERT_CONTENT_SQL params, INSERT_CONTENT_REF_SQL params).
+        """
+        plain, contents, refs = [], [], []
+        now = time.monotonic()
+        with self._lock:
+            for row in rows:
+                thread_id, checkpoint_ns, channel, version, type_, blob = row
+                if blob is None or len(blob) < self.min_bytes:
+                    plain.append(row)
+                    continue
+                digest = content_hash(type_, blob)
+                refs.append((thread_id, checkpoint_ns, channel, version, digest))
+                self.stats["blobs"] += 1
+                self.stats["bytes"] += len(blob)
+                seen = self._known.get(digest)
+                if seen is not None and now - seen < self.known_ttl_seconds:
+                    self.stats["skipped"] += 1
+                    self.stats["skipped_bytes"] += len(blob)
+                    continue
+                contents.append((digest, type_, blob))
+        return plain, contents, refs
+
+    def check_refs(self, refs: Sequence[tuple], dangling: Sequence[bool]) -> None:
+        """Raise if INSERT_CONTENT_REF_SQL inserted references without content.
+
+        Their hashes are forgotten, so a retried write sends the bytes again.
+        """
+        missing = [ref for ref, flag in zip(refs, dangling) if flag]
+        if not missing:
+            return
+        with self._lock:
+            for ref in missing:
+                self._known.pop(ref[4], None)
+        thread_id, _, channel, _, _ = missing[0]
+        raise RuntimeError(
+            f"Missing content for {len(missing)} checkpoint blob reference(s) "
+            f"(thread '{thread_id}', channel '{channel}')"
+        )
+
+    def remember(self, contents: Sequence[tuple]) -> None:
+        """Record hashes once their INSERT_CONTENT_SQL has been executed."""
+        now = time.monotonic()
+        with self._lock:
+            for digest, _, _ in contents:
+                self._known[digest] = now
+                self._known.move_to_end(digest)
+            while len(self._known) > self.max_known:
+                self._known.popitem(last=False)
@@ -0,0 +1,194 @@
+"""
+Context budget for the model input.
+
+Every model call sends the system prompt, the tool schemas bound to the model, the
+LONG-TERM MEMORY and CONVERSATION SUMMARY SystemMessages, the conversation history
+and the tool results of the current turn. ContextBudget caps the sections that
+depend on the user or the tools, and fits the history in what is left:
+
+  - memory        CONTEXT_MEMORY_MAX_TOKENS: the memory JSON is compacted, then cut
+  - summary       CONTEXT_SUMMARY_MAX_TOKENS: cut
+  - tool results  CONTEXT_TOOL_RESULT_MAX_TOKENS per ToolMessage: the copy sent to
+                  the model is cut (the state keeps the full result), and the
+                  window counts it at the cap (CappedCounter)
+  - history       min(SHORT_MEMORY_TOKEN_LIMIT, CONTEXT_MAX_INPUT_TOKENS minus the
+                  system prompt, tool schemas, memory and summary)
+
+0 disables a cap or the ceiling, and all are 0 by default: the model input is then
+the same as without a budget. The allocation of each call (tokens per section,
+history budget, messages left out) is logged and recorded as context.* attributes on
+the span of the hook and on the conversation span (see Agent._record_allocation).
+Sizes are estimates of engine/token_count.py, so the ceiling should keep some margin
+below the model's input limit.
+"""
+
+import json
+from bisect import bisect_left
+from dataclasses import dataclass
+from os import getenv
+from typing import Dict, List, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+from engine.history_scan import HistoryScan, leading_system_messages
+from engine.thread_summary import SUMMARY_PREFIX
+from engine.token_count import TOKEN_COUNT_KEY, TokenCounter
+
+MEMORY_PREFIX = "LONG-TERM MEMORY:"
+SECTIONS = ("system", "tools", "memory", "summary", "history", "tool_results")
+
+
+@dataclass(frozen=True)
+class CappedCounter(TokenCounter):
+    """TokenCounter that counts a ToolMessage at most tool_result_tokens, as sent to
+    the model. Cached counts are the uncapped ones, so they are shared with
+    TokenCounter."""
+
+    tool_result_tokens: int = 0
+
+    def count(self, message: BaseMessage) -> int:
+        tokens = super().count(message)
+        if self.tool_result_tokens > 0 and isinstance(message, ToolMessage):
+            return min(tokens, self.tool_result_tokens)
+        return tokens
+
+
+@dataclass(frozen=True)
+class ContextBudget:
+    max_input_tokens: int = 0
+    memory_tokens: int = 0
+    summary_tokens: int = 0
+    tool_result_tokens: int = 0
+
+    @classmethod
+    def from_env(cls) -> "ContextBudget":
+        """Build from CONTEXT_MAX_INPUT_TOKENS and CONTEXT_*_MAX_TOKENS."""
+        return cls(
+            max_input_tokens=int(getenv("CONTEXT_MAX_INPUT_TOKENS", "0")),
+            memory_tokens=int(getenv("CONTEXT_MEMORY_MAX_TOKENS", "0")),
+            summary_tokens=int(getenv("CONTEXT_SUMMARY_MAX_TOKENS", "0")),
+            tool_result_tokens=int(getenv("CONTEXT_TOOL_RESULT_MAX_TOKENS", "0")),
+        )
+
+    def counter(self, base: TokenCounter) -> CappedCounter:
+        return CappedCounter(base.chars_per_token, base.json_chars_per_token, self.tool_result_tokens)
+
+    def history_tokens(self, short_memory_limit: int, reserved: int) -> int:
+        """Token budget of the history once `reserved` tokens of other sections are
+        accounted for (at least 0: the window then keeps only the last message)."""
+        if self.max_input_tokens <= 0:
+            return short_memory_limit
+        return max(0, min(short_memory_limit, self.max_input_tokens - reserved))
+
+    def memory_content(self, memory_data, counter: TokenCounter) -> str:
+        """The LONG-TERM MEMORY message content, within memory_tokens."""
+        content = f"{MEMORY_PREFIX}\n{json.dumps(memory_data, indent=2, ensure_ascii=False)}"
+        if self.memory_tokens <= 0 or counter.estimate(SystemMessage(content=content)) <= self.memory_tokens:
+            return content
+        compact = json.dumps(memory_data, ensure_ascii=False, separators=(",", ":"))
+        content = f"{MEMORY_PREFIX}\n{compact}"
+        if counter.estimate(SystemMessage(content=content)) <= self.memory_tokens:
+            return content
+        return cut_text(content, self.memory_tokens, counter)
+
+    def fit(self, window: Sequence[BaseMessage], counter: TokenCounter) -> List[BaseMessage]:
+        """window with the summary and tool results cut to their caps (copies)."""
+        fitted = []
+        for message in window:
+            cap = 0
+            if isinstance(message, ToolMessage):
+                cap = self.tool_result_tokens
+            elif isinstance(message, SystemMessage) and _starts_with(message, SUMMARY_PREFIX):
+                cap = self.summary_tokens
+            if cap > 0 and TokenCounter.count(counter, message) > cap:
+                message = cut_message(message, cap, counter)
+            fitted.append(message)
+        return fitted
+
+    def allocation(
+        self,
+        window: Sequence[BaseMessage],
+        counter: TokenCounter,
+        fixed: Dict[str, int],
+        history_budget: int,
+        scan: HistoryScan,
+        messages: Sequence[BaseMessage],
+    ) -> Dict[str, int]:
+        """Tokens per section of the model input (see SECTIONS) and its total.
+
+        window is the model input (SystemMessages first) selected from messages, the
+        history scanned by scan. When its conversation is a contiguous run of the
+        history, as it usually is, it is measured with the scan's prefix sums.
+        """
+        sections = dict.fromkeys(SECTIONS, 0)
+        sections.update(fixed)
+        head = leading_system_messages(window)
+        for message in window[:head]:
+            if _starts_with(message, MEMORY_PREFIX):
+                sections["memory"] += counter.count(message)
+            elif _starts_with(message, SUMMARY_PREFIX):
+                sections["summary"] += counter.count(message)
+            else:
+                sections["system"] += counter.count(message)
+
+        conversation = window[head:]
+        for message in reversed(conversation):  # tool results of the current turn
+            if isinstance(message, HumanMessage):
+                break
+            if isinstance(message, ToolMessage):
+                sections["tool_results"] += counter.count(message)
+        sections["history"] = self._conversation_tokens(conversation, counter, scan, messages) - sections["tool_results"]
+        return {
+            **{f"{section}_tokens": tokens for section, tokens in sections.items()},
+            "total_tokens": sum(sections.values()),
+            "max_input_tokens": self.max_input_tokens,
+            "history_budget": history_budget,
+            "dropped_messages": max(0, len(scan.positions) - len(conversation)),
+        }
+
+    @staticmethod
+    def _conversation_tokens(conversation, counter, scan: HistoryScan, messages) -> int:
+        try:
+            first, last = scan.positions_of(messages, [conversation[0], conversation[-1]])
+        except (IndexError, KeyError):  # empty, or cut copies of messages without ids
+            first = last = None
+        if first is not None:
+            i, j = bisect_left(scan.positions, first), bisect_left(scan.positions, last)
+            if j - i + 1 == len(conversation) and scan.positions[j] == last:
+                return scan.sums[j + 1] - scan.sums[i]
+        return sum(counter.count(message) for message in conversation)
+
+
+def tool_schema_tokens(tools: Sequence, counter: TokenCounter) -> int:
+    """Estimated tokens of the tool declarations bound to the model."""
+    from langchain_core.utils.function_calling import convert_to_openai_tool
+
+    chars = sum(len(json.dumps(convert_to_openai_tool(tool), ensure_ascii=False)) for tool in tools)
+    return round(chars / counter.json_chars_per_token)
+
+
+def cut_text(text: str, max_tokens: int, counter: TokenCounter) -> str:
+    """text cut to about max_tokens (at the denser JSON ratio, so it fits either way)."""
+    keep = int(max_tokens * min(counter.chars_per_token, counter.json_chars_per_token))
+    if len(text) <= keep:
+        return text
+    return f"{text[:keep]}\n[... {len(text) - keep} characters truncated]"
+
+
+def cut_message(message: BaseMessage, max_tokens: int, counter: TokenCounter) -> BaseMessage:
+    """Copy of message with its text content cut to about max_tokens."""
+    content = message.content
+    if not isinstance(content, str):
+        content = "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for part in content
+            if isinstance(part, str) or part.get("type") == "text"
+        )
+    additional_kwargs = {k: v for k, v in message.additional_kwargs.items() if k != TOKEN_COUNT_KEY}
+    return message.model_copy(
+        update={"content": cut_text(content, max_tokens, counter), "additional_kwargs": additional_kwargs}
+    )
+
+
+def _starts_with(message: BaseMessage, prefix: str) -> bool:
+    return isinstance(message.content, str) and message.content.startswith(prefix)
@@ -50,6 +50,7 @@ from langgraph.store.base import BaseStore
 from langgraph.types import Checkpointer, Send
 from langgraph.typing import ContextT
 from langgraph.warnings import LangGraphDeprecatedSinceV10
+from engine.history_scan import ToolCallIndex
 from engine.log import logger
 from engine.monitored_tool_node import MonitoredToolNode
 
@@ -235,22 +236,17 @@ def _validate_chat_history(
     messages: Sequence[BaseMessage],
 ) -> None:
     """Validate that all tool calls in AIMessages have a corresponding ToolMessage."""
-    all_tool_calls = [
-        tool_call
-        for message in messages
-        if isinstance(message, AIMessage)
-        for tool_call in message.tool_calls
-    ]
-    tool_call_ids_with_results = {
-        message.tool_call_id for message in messages if isinstance(message, ToolMessage)
-    }
+    index = ToolCallIndex.of(messages)
+    unanswered = index.unanswered()
+    if not unanswered:
+        return
     tool_calls_without_results = [
         tool_call
-        for tool_call in all_tool_calls
-        if tool_call["id"] not in tool_call_ids_with_results
+        for call_id in unanswered
+        for position in index.calls[call_id]
+        for tool_call in messages[position].tool_calls
+        if tool_call["id"] == call_id
     ]
-    if not tool_calls_without_results:
-        return
 
     error_message = create_error_message(
         message="Found AIMessages with tool_calls that do not have a corresponding ToolMessage. "
@@ -942,14 +938,13 @@ def create_react_agent(
             """
 
             messages = _get_state_value(state, "messages")
-            tool_messages = [
-                m.tool_call_id for m in messages if isinstance(m, ToolMessage)
-            ]
-            last_ai_message = next(
-                m for m in reversed(messages) if isinstance(m, AIMessage)
+            last_ai_position = next(
+                i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], AIMessage)
             )
+            # Results of the last AIMessage's calls can only follow it: index that suffix
+            answered = ToolCallIndex.of(messages[last_ai_position:]).results
             pending_tool_calls = [
-                c for c in last_ai_message.tool_calls if c["id"] not in tool_messages
+                c for c in messages[last_ai_position].tool_calls if c["id"] not in answered
             ]
 
             if pending_tool_calls:
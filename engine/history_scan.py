@@ -0,0 +1,249 @@
+"""
+Incremental history scan for the pre-model hook.
+
+The pre-model hook runs before every model call of a ReAct turn, on a history that
+only grew since the previous call. HistoryScan keeps, per thread, what the hook
+derives from each message (kind, parsed timestamp, token count) up to a watermark:
+the number of messages already scanned and the id of the last one. The next call
+scans only the messages appended after the watermark, and the short-term memory
+window is found with binary searches over the cached timestamps and token prefix
+sums instead of a pass over the whole history.
+
+The scan also maintains a ToolCallIndex (tool_call_id -> positions of the AIMessage
+that made the call and of its ToolMessage), so repairing tool call / result pairs cut
+by the window costs dictionary lookups instead of passes over the history.
+
+Positions are relative to the leading SystemMessages, where the long-term memory
+message is inserted or replaced on every call. If the message at the watermark is
+not the one recorded (another replica wrote the thread, messages were removed, a
+windowed load returned a different tail), the scan starts over.
+"""
+
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from collections.abc import Sequence
+from datetime import datetime, timezone
+from os import getenv
+from typing import Dict, Iterable, List, Optional
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+
+from engine.log import logger
+from engine.token_count import TokenCounter, trim_to_token_budget
+
+# Messages without a (valid) timestamp are always within the time limit
+NO_TIMESTAMP = math.inf
+
+
+def leading_system_messages(messages: Sequence) -> int:
+    """Number of SystemMessages at the start of messages."""
+    head = 0
+    while head < len(messages) and isinstance(messages[head], SystemMessage):
+        head += 1
+    return head
+
+
+def message_time(message: BaseMessage) -> float:
+    """Epoch seconds of additional_kwargs["timestamp"], NO_TIMESTAMP if missing or invalid."""
+    timestamp = message.additional_kwargs.get("timestamp")
+    if not timestamp:
+        return NO_TIMESTAMP
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except (ValueError, AttributeError) as e:
+        logger.warning(f"Invalid timestamp format in message: {timestamp}, error: {e}")
+        return NO_TIMESTAMP
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class ToolCallIndex:
+    """Positions of tool calls and tool results, by tool_call_id."""
+
+    def __init__(self):
+        self.calls: Dict[str, List[int]] = defaultdict(list)  # AIMessages with the call
+        self.results: Dict[str, List[int]] = defaultdict(list)  # ToolMessages answering it
+
+    @classmethod
+    def of(cls, messages: Iterable[BaseMessage]) -> "ToolCallIndex":
+        index = cls()
+        for position, message in enumerate(messages):
+            index.add(position, message)
+        return index
+
+    def add(self, position: int, message: BaseMessage) -> None:
+        if isinstance(message, AIMessage):
+            for tool_call in message.tool_calls:
+                self.calls[tool_call.get("id")].append(position)
+        elif isinstance(message, ToolMessage):
+            self.results[message.tool_call_id].append(position)
+
+    def unanswered(self) -> List[str]:
+        """Ids of tool calls without a result."""
+        return [call_id for call_id in self.calls if call_id not in self.results]
+
+    def orphaned(self) -> List[str]:
+        """Ids of tool results without a call."""
+        return [call_id for call_id in self.results if call_id not in self.calls]
+
+
+class _View(Sequence):
+    """messages[head + positions[i]] for i in indices, without copying."""
+
+    def __init__(self, messages, head: int, positions, indices):
+        self._messages = messages
+        self._head = head
+        self._positions = positions
+        self._indices = indices
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._messages[self._head + self._positions[self._indices[i]]]
+
+
+class HistoryScan:
+    """Watermarked scan of one thread's messages. Not thread-safe: hold self.lock."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rescans = 0
+        self.reset()
+
+    def reset(self) -> None:
+        self.size = 0  # messages scanned, after the leading SystemMessages
+        self.last_id: Optional[str] = None
+        self.system = array("l")  # positions of the other SystemMessages
+        self.positions = array("l")  # positions of the conversation messages
+        self.times = array("d")  # their timestamps (see message_time)
+        self.sums = array("q", [0])  # prefix sums of their token counts
+        self.ordered = True  # times are non-decreasing: the time limit cuts a prefix
+        self.ids: Dict[str, int] = {}  # message id -> position
+        self.tool_calls = ToolCallIndex()
+
+    def _check_watermark(self, messages: Sequence[BaseMessage], head: int) -> None:
+        if self.size and (
+            self.last_id is None
+            or len(messages) - head < self.size
+            or messages[head + self.size - 1].id != self.last_id
+        ):
+            self.reset()
+            self.rescans += 1
+
+    def pending(self, messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+        """Messages after the watermark (all of them if it no longer matches)."""
+        head = leading_system_messages(messages)
+        self._check_watermark(messages, head)
+        return list(messages[head + self.size :])
+
+    def advance(self, messages: Sequence[BaseMessage], counter: TokenCounter) -> None:
+        """Scan the pending messages and move the watermark to the end of messages."""
+        head = leading_system_messages(messages)
+        self._check_watermark(messages, head)
+        for i in range(self.size, len(messages) - head):
+            message = messages[head + i]
+            if message.id is not None:
+                self.ids[message.id] = i
+            if isinstance(message, SystemMessage):
+                self.system.append(i)
+                continue
+            time = message_time(message)
+            if self.times and time < self.times[-1]:
+                self.ordered = False
+            self.tool_calls.add(i, message)
+            self.positions.append(i)
+            self.times.append(time)
+            self.sums.append(self.sums[-1] + counter.count(message))
+        self.size = len(messages) - head
+        self.last_id = messages[-1].id if self.size else None
+
+    def positions_of(
+        self, messages: Sequence[BaseMessage], selected: Iterable[BaseMessage]
+    ) -> List[int]:
+        """Positions of the selected messages in the scanned history."""
+        positions = [self.ids.get(message.id) for message in selected]
+        if None in positions:  # messages without ids: match by identity
+            head = leading_system_messages(messages)
+            where = {id(message): i - head for i, message in enumerate(messages)}
+            positions = [where[id(message)] for message in selected]
+        return positions
+
+    def system_messages(self, messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+        head = leading_system_messages(messages)
+        return list(messages[:head]) + [messages[head + i] for i in self.system]
+
+    def conversation(self, messages: Sequence[BaseMessage]) -> Sequence[BaseMessage]:
+        """The non-system messages, as a view."""
+        return _View(messages, leading_system_messages(messages), self.positions, range(len(self.positions)))
+
+    def within_time(self, messages: Sequence[BaseMessage], min_time: float) -> Sequence[BaseMessage]:
+        """Conversation messages with a timestamp >= min_time (or none), as a view."""
+        head = leading_system_messages(messages)
+        if self.ordered:
+            first = bisect_left(self.times, min_time)
+            indices = range(first, len(self.positions))
+        else:
+            indices = [i for i, time in enumerate(self.times) if time >= min_time]
+        return _View(messages, head, self.positions, indices)
+
+    def trim(
+        self,
+        view: Sequence[BaseMessage],
+        max_tokens: int,
+        counter: TokenCounter,
+        start_on=HumanMessage,
+        end_on=(HumanMessage, ToolMessage),
+    ) -> List[BaseMessage]:
+        """trim_to_token_budget(view, ...), over the cached prefix sums when view is a
+        suffix of the conversation (see within_time)."""
+        indices = getattr(view, "_indices", None)
+        if not isinstance(indices, range):
+            return trim_to_token_budget(list(view), max_tokens, counter, start_on, end_on)
+        end = len(view)
+        while end and not isinstance(view[end - 1], end_on):
+            end -= 1
+        first = indices.start
+        start = bisect_left(self.sums, self.sums[first + end] - max_tokens, first, first + end + 1) - first
+        while start < end and not isinstance(view[start], start_on):
+            start += 1
+        return view[start:end]
+
+
+class HistoryScans:
+    """Bounded LRU of HistoryScan per thread_id. Thread-safe."""
+
+    def __init__(self, max_threads: int = 1024):
+        self.max_threads = max_threads
+        self._scans: "OrderedDict[str, HistoryScan]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "HistoryScans":
+        """Build from HISTORY_SCAN_MAX_THREADS (0: no watermarks, every call scans everything)."""
+        return cls(int(getenv("HISTORY_SCAN_MAX_THREADS", "1024")))
+
+    def get(self, thread_id: str) -> HistoryScan:
+        if self.max_threads <= 0:
+            return HistoryScan()
+        with self._lock:
+            scan = self._scans.get(thread_id)
+            if scan is None:
+                scan = self._scans[thread_id] = HistoryScan()
+                if len(self._scans) > self.max_threads:
+                    self._scans.popitem(last=False)
+            else:
+                self._scans.move_to_end(thread_id)
+            return scan
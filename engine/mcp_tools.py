@@ -2,169 +2,139 @@
 
 from typing import List, Optional
 from langchain_core.tools import BaseTool
+import hashlib
 import os
-from langchain_mcp_adapters.client import MultiServerMCPClient
+import time
+from datetime import datetime, timezone
 from engine.log import logger
 import json
 
 
-async def get_mcp_tools(
+# ---------------------------------------------------------------------------
+# Tool catalogue snapshot
+#
+# The tools/list result (names, descriptions, JSON schemas) is enough to build the
+# LangChain tools: every call opens its own MCP session from the connection config.
+# A snapshot taken at deploy time (src/deploy.py, pickled with the Agent) or cached in
+# MCP_TOOL_SNAPSHOT_PATH lets a replica compile its graph without waiting for the MCP
+# server. The Agent then re-lists the tools in the background (right away, then every
+# MCP_TOOL_REFRESH_SECONDS) and swaps its graph when the catalogue version changes.
+# ---------------------------------------------------------------------------
+
+MCP_SERVER_NAME = "rio_mcp"
+
+
+def _mcp_connection(url: Optional[str] = None, token: Optional[str] = None) -> dict:
+    url = url or os.getenv("MCP_SERVER_URL")
+    token = token or os.getenv("MCP_API_TOKEN")
+    if not url or not token:
+        raise ValueError("MCP_SERVER_URL and MCP_API_TOKEN environment variables must be set")
+    return {
+        "transport": "streamable_http",
+        "url": url,
+        "headers": {"Authorization": f"Bearer {token}"},
+    }
+
+
+def tool_catalogue_version(specs: List[dict]) -> str:
+    """Stable hash of a tools/list result (order of tools does not matter)."""
+    canonical = json.dumps(
+        sorted(specs, key=lambda spec: spec["name"]), sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def make_tool_snapshot(specs: List[dict]) -> dict:
+    return {
+        "version": tool_catalogue_version(specs),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "tools": specs,
+    }
+
+
+def diff_tool_snapshots(old: Optional[dict], new: dict) -> dict:
+    """Tool names added, removed and changed (description or schema) between snapshots."""
+    old_specs = {spec["name"]: spec for spec in (old or {}).get("tools", [])}
+    new_specs = {spec["name"]: spec for spec in new["tools"]}
+    return {
+        "added": sorted(new_specs.keys() - old_specs.keys()),
+        "removed": sorted(old_specs.keys() - new_specs.keys()),
+        "changed": sorted(
+            name for name in new_specs.keys() & old_specs.keys() if new_specs[name] != old_specs[name]
+        ),
+    }
+
+
+async def fetch_tool_snapshot(url: Optional[str] = None, token: Optional[str] = None) -> dict:
+    """Send tools/list and return the catalogue as a JSON-serializable snapshot.
+
+    url/token default to MCP_SERVER_URL/MCP_API_TOKEN (src/deploy.py passes the public URL).
+    """
+    from langchain_mcp_adapters.sessions import create_session
+
+    start = time.perf_counter()
+    specs, cursor = [], None
+    async with create_session(_mcp_connection(url, token)) as session:
+        await session.initialize()
+        while True:
+            page = await session.list_tools(cursor=cursor)
+            specs.extend(
+                tool.model_dump(mode="json", by_alias=True, exclude_none=True) for tool in page.tools
+            )
+            cursor = page.nextCursor
+            if not cursor:
+                break
+    snapshot = make_tool_snapshot(specs)
+    logger.info(
+        f"[MCP Tools] Fetched catalogue {snapshot['version']} ({len(specs)} tools) "
+        f"in {(time.perf_counter() - start) * 1000:.0f} ms"
+    )
+    return snapshot
+
+
+def build_tools(
+    snapshot: dict,
     include_tools: Optional[List[str]] = None,
     exclude_tools: Optional[List[str]] = None,
 ) -> List[BaseTool]:
-    """
-    Load MCP tools from server URL specified in environment variables.
-    
-    This function reads MCP_SERVER_URL and MCP_API_TOKEN from environment variables,
-    allowing different URLs in local development vs deployed environments.
-
-    Args:
-        include_tools (List[str], optional): Lista de nomes de ferramentas para incluir.
-                                           Se fornecida, apenas essas ferramentas serão retornadas.
-        exclude_tools (List[str], optional): Lista de nomes de ferramentas para excluir.
-                                           Se fornecida, todas as ferramentas exceto essas serão retornadas.
-
-    Returns:
-        List[BaseTool]: Lista de ferramentas disponíveis do servidor MCP, filtrada conforme os parâmetros
-    """
-    logger.info("[MCP Tools] Starting MCP tools loading process")
-    
-    # Initialize default values
-    if include_tools is None:
-        include_tools = []
-    if exclude_tools is None:
-        exclude_tools = []
-
-    # Log filtering parameters
-    if include_tools:
-        logger.info(f"[MCP Tools] Include filter: {include_tools}")
-    if exclude_tools:
-        logger.info(f"[MCP Tools] Exclude filter: {exclude_tools}")
-
-    # Read from environment variables (works in both local and deployed environments)
-    mcp_url = os.getenv("MCP_SERVER_URL")
-    mcp_token = os.getenv("MCP_API_TOKEN")
-    
-    logger.info(f"[MCP Tools] MCP_SERVER_URL: {mcp_url}")
-    logger.info(f"[MCP Tools] MCP_API_TOKEN: {'SET' if mcp_token else 'NOT SET'}")
-    
-    if not mcp_url:
-        error_msg = "[MCP Tools] ERROR: MCP_SERVER_URL environment variable is not set"
-        logger.error(error_msg)
-        raise ValueError("MCP_SERVER_URL environment variable must be set")
-    
-    if not mcp_token:
-        error_msg = "[MCP Tools] ERROR: MCP_API_TOKEN environment variable is not set"
-        logger.error(error_msg)
-        raise ValueError("MCP_API_TOKEN environment variable must be set")
+    """Build the LangChain tools of a snapshot, as MultiServerMCPClient.get_tools() would."""
+    from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+    from mcp.types import Tool
 
-    try:
-        logger.info(f"[MCP Tools] Creating MultiServerMCPClient for URL: {mcp_url}")
-        
-        # Log the full client configuration (except sensitive token)
-        client_config = {
-            "rio_mcp": {
-                "transport": "streamable_http",
-                "url": mcp_url,
-                "headers": {
-                    "Authorization": f"Bearer {mcp_token[:10]}..." if mcp_token else "NOT SET",
-                },
-            }
-        }
-        logger.info(f"[MCP Tools] Client configuration: {client_config}")
-        
-        client = MultiServerMCPClient(
-            {
-                "rio_mcp": {
-                    "transport": "streamable_http",
-                    "url": mcp_url,
-                    "headers": {
-                        "Authorization": f"Bearer {mcp_token}",
-                    },
-                },
-            }
+    connection = _mcp_connection()
+    return [
+        convert_mcp_tool_to_langchain_tool(
+            None, Tool.model_validate(spec), connection=connection, server_name=MCP_SERVER_NAME
         )
-        logger.info("[MCP Tools] MultiServerMCPClient created successfully")
-    except Exception as e:
-        logger.error(f"[MCP Tools] ERROR: Failed to create MCP client: {type(e).__name__}: {str(e)}", exc_info=True)
-        raise
+        for spec in snapshot["tools"]
+        if (not include_tools or spec["name"] in include_tools)
+        and spec["name"] not in (exclude_tools or [])
+    ]
+
 
+def load_tool_snapshot(path: str) -> Optional[dict]:
+    """Read a snapshot file; None if missing or unreadable."""
+    if not path or not os.path.exists(path):
+        return None
     try:
-        logger.info(f"[MCP Tools] Fetching tools from MCP server at {mcp_url}")
-        logger.info("[MCP Tools] Calling client.get_tools() - this will send a tools/list request to the MCP server")
-        logger.info("[MCP Tools] MCP Protocol: The request will be a JSON-RPC 2.0 message with method 'tools/list'")
-        
-        # Log what we're about to request
-        logger.info("[MCP Tools] Expected JSON-RPC request structure:")
-        logger.info("[MCP Tools]   - jsonrpc: '2.0'")
-        logger.info("[MCP Tools]   - method: 'tools/list'")
-        logger.info("[MCP Tools]   - params: {} (empty params for tools/list)")
-        logger.info(f"[MCP Tools]   - Authorization header: Bearer {mcp_token[:10]}...")
-        
-        try:
-            tools = await client.get_tools()
-            logger.info(f"[MCP Tools] Successfully fetched {len(tools)} tools from server")
-        except Exception as get_tools_error:
-            logger.error(f"[MCP Tools] ERROR during get_tools() call:")
-            logger.error(f"[MCP Tools]   Error Type: {type(get_tools_error).__name__}")
-            logger.error(f"[MCP Tools]   Error Message: {str(get_tools_error)}")
-            logger.error(f"[MCP Tools]   Error Details: {repr(get_tools_error)}")
-            
-            # Try to extract more information from the error
-            if hasattr(get_tools_error, 'args'):
-                logger.error(f"[MCP Tools]   Error Args: {get_tools_error.args}")
-            if hasattr(get_tools_error, '__dict__'):
-                logger.error(f"[MCP Tools]   Error Attributes: {get_tools_error.__dict__}")
-            
-            logger.error("[MCP Tools] This error suggests the MCP server rejected the request.")
-            logger.error("[MCP Tools] Common causes:")
-            logger.error("[MCP Tools]   1. Invalid Authorization token")
-            logger.error("[MCP Tools]   2. MCP server expects different request format")
-            logger.error("[MCP Tools]   3. Server-side validation failed")
-            logger.error("[MCP Tools]   4. Network/connectivity issues")
-            
-            raise
-        
-        # Log all tool names received
-        tool_names = [tool.name for tool in tools]
-        logger.info(f"[MCP Tools] All available tools: {tool_names}")
-        
-    except Exception as e:
-        logger.error(
-            f"[MCP Tools] ERROR: Failed to fetch tools from {mcp_url}. "
-            f"Error type: {type(e).__name__}, Message: {str(e)}",
-            exc_info=True
-        )
-        logger.error(f"[MCP Tools] Full exception details:", exc_info=True)
-        raise
+        with open(path) as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != tool_catalogue_version(snapshot["tools"]):
+            raise ValueError("version does not match its tools")
+        return snapshot
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"[MCP Tools] Ignoring tool snapshot {path}: {e}")
+        return None
 
-    # Apply filtering logic
+
+def save_tool_snapshot(snapshot: dict, path: str) -> None:
+    """Write a snapshot file atomically (no-op without a path)."""
+    if not path:
+        return
+    tmp = f"{path}.tmp"
     try:
-        if include_tools:
-            # If include list is not empty, return only tools in the include list
-            filtered_tools = [tool for tool in tools if tool.name in include_tools]
-            logger.info(f"[MCP Tools] Applied include filter. Included {len(filtered_tools)} tools")
-        elif exclude_tools:
-            # If exclude list is not empty, return all tools except the ones in exclude list
-            filtered_tools = [tool for tool in tools if tool.name not in exclude_tools]
-            excluded_count = len(tools) - len(filtered_tools)
-            logger.info(f"[MCP Tools] Applied exclude filter. Excluded {excluded_count} tools, kept {len(filtered_tools)} tools")
-        else:
-            # If both lists are empty, return all tools
-            filtered_tools = tools
-            logger.info(f"[MCP Tools] No filtering applied. Returning all {len(filtered_tools)} tools")
-        
-        # Log final tool names that will be returned
-        final_tool_names = [tool.name for tool in filtered_tools]
-        logger.info(f"[MCP Tools] Final tools to be loaded: {final_tool_names}")
-        logger.info(f"[MCP Tools] Successfully completed MCP tools loading. Total tools: {len(filtered_tools)}")
-        
-        return filtered_tools
-        
-    except Exception as e:
-        logger.error(
-            f"[MCP Tools] ERROR: Failed to filter tools. "
-            f"Error type: {type(e).__name__}, Message: {str(e)}",
-            exc_info=True
-        )
-        raise
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"[MCP Tools] Could not write tool snapshot {path}: {e}")
@@ -0,0 +1,145 @@
+"""
+Message Archival
+
+Moves thread_messages rows that the history window can no longer load (older than
+`older_than_seconds`, which should be at least the window's age limit, i.e.
+SHORT_MEMORY_TIME_LIMIT) into thread_messages_archive as compressed segments. The hot
+table then only holds recent history, so it and its indexes stay small enough to be
+cached.
+
+The last message of each thread, system messages and AIMessages whose tool calls are
+answered after the cutoff are kept (see SELECT_ARCHIVABLE_SQL). Archived messages are
+only read back on request: IntVersionPostgresSaver.aget_full_history(include_archived=True).
+
+Each batch moves its rows in one short transaction under a per-thread advisory lock,
+with the rows locked FOR UPDATE SKIP LOCKED, so it is safe to run against live traffic
+and from several workers. Only threads written with CHECKPOINT_MESSAGE_STORE=true have
+rows to archive. Used by scripts/archive_thread_messages.py.
+"""
+
+import asyncio
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
+
+from engine.checkpoint_codec import CompressingSerializer
+from engine.message_store import ThreadMessageStore
+
+# Distinct (thread_id, checkpoint_ns) after a cursor, as a loose index scan over the
+# thread_messages PK
+SELECT_THREADS_SQL = """
+    WITH RECURSIVE t AS (
+        (SELECT thread_id, checkpoint_ns FROM thread_messages
+          WHERE (thread_id, checkpoint_ns) > (%(after_thread_id)s, %(after_checkpoint_ns)s)
+          ORDER BY thread_id, checkpoint_ns
+          LIMIT 1)
+        UNION ALL
+        SELECT n.thread_id, n.checkpoint_ns
+          FROM t, LATERAL (
+              SELECT m.thread_id, m.checkpoint_ns FROM thread_messages m
+               WHERE (m.thread_id, m.checkpoint_ns) > (t.thread_id, t.checkpoint_ns)
+               ORDER BY m.thread_id, m.checkpoint_ns
+               LIMIT 1
+          ) n
+    )
+    SELECT thread_id, checkpoint_ns FROM t LIMIT %(limit)s
+"""
+
+TRY_LOCK_THREAD_SQL = """
+    SELECT pg_try_advisory_xact_lock(hashtextextended('eai-archive:' || %s, 0)) AS locked
+"""
+
+
+@dataclass
+class ArchiveStats:
+    threads: int = 0
+    skipped_threads: int = 0
+    messages: int = 0
+    segments: int = 0
+    hot_bytes: int = 0  # payload bytes removed from thread_messages
+    archived_bytes: int = 0  # compressed segment bytes written
+
+    def add(self, other: "ArchiveStats") -> None:
+        for name, value in asdict(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+
+async def aarchive_thread(
+    conn,
+    thread_id: str,
+    checkpoint_ns: str = "",
+    *,
+    older_than_seconds: int,
+    store: Optional[ThreadMessageStore] = None,
+    batch_size: int = 1000,
+    sleep_seconds: float = 0.0,
+) -> ArchiveStats:
+    """Archive one thread in segments of at most `batch_size` messages.
+
+    `conn` is a psycopg AsyncConnection in autocommit mode with a dict_row row factory.
+    """
+    store = store or ThreadMessageStore(CompressingSerializer.from_env())
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=older_than_seconds)
+    stats = ArchiveStats(threads=1)
+    while True:
+        async with conn.transaction():
+            cur = await conn.execute(TRY_LOCK_THREAD_SQL, (thread_id,))
+            if not (await cur.fetchone())["locked"]:
+                return ArchiveStats(skipped_threads=1)
+            async with conn.cursor() as cur:
+                moved, hot_bytes, archived_bytes = await store.aarchive(
+                    cur, thread_id, checkpoint_ns, cutoff, batch_size
+                )
+        if not moved:
+            return stats
+        stats.add(
+            ArchiveStats(
+                messages=moved, segments=1, hot_bytes=hot_bytes, archived_bytes=archived_bytes
+            )
+        )
+        if moved < batch_size:
+            return stats
+        if sleep_seconds:
+            await asyncio.sleep(sleep_seconds)
+
+
+async def aarchive(
+    conn,
+    *,
+    older_than_seconds: int,
+    after: tuple[str, str] = ("", ""),
+    max_threads: Optional[int] = None,
+    thread_batch: int = 100,
+    sleep_seconds: float = 0.0,
+    **thread_kwargs,
+) -> AsyncIterator[tuple[tuple[str, str], ArchiveStats]]:
+    """Archive threads in (thread_id, checkpoint_ns) order, starting after `after`.
+
+    Yields ((thread_id, checkpoint_ns), stats) after each thread, so callers can persist
+    it as a resume cursor. Remaining keyword arguments go to aarchive_thread.
+    """
+    store = thread_kwargs.pop("store", None) or ThreadMessageStore(CompressingSerializer.from_env())
+    done = 0
+    while max_threads is None or done < max_threads:
+        limit = thread_batch if max_threads is None else min(thread_batch, max_threads - done)
+        cur = await conn.execute(
+            SELECT_THREADS_SQL,
+            {"after_thread_id": after[0], "after_checkpoint_ns": after[1], "limit": limit},
+        )
+        keys = [(row["thread_id"], row["checkpoint_ns"]) for row in await cur.fetchall()]
+        if not keys:
+            return
+        for key in keys:
+            stats = await aarchive_thread(
+                conn,
+                *key,
+                older_than_seconds=older_than_seconds,
+                store=store,
+                sleep_seconds=sleep_seconds,
+                **thread_kwargs,
+            )
+            done += 1
+            after = key
+            yield key, stats
+            if sleep_seconds:
+                await asyncio.sleep(sleep_seconds)
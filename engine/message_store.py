@@ -0,0 +1,521 @@
+"""
+Thread Message Store
+
+Stores the `messages` channel one row per message in the `thread_messages` table
+instead of re-serializing the whole conversation into a single checkpoint blob.
+
+With the store enabled, IntVersionPostgresSaver:
+
+- writes each message of the `messages` channel as its own row and stores only a small
+  reference (the highest `seq` at write time) in checkpoint_blobs. Writes are append-only:
+  messages already in the table are skipped unless their timestamp or content changed
+  (the hooks stamp or replace messages in place under the same id after they were first
+  persisted), so a turn costs O(new messages) instead of re-serializing the whole history.
+  Concurrent writers of a thread take a per-thread advisory lock, so they never collide
+  on seq;
+- loads only the tail of the conversation (by message count, age and/or token budget)
+  in a single indexed query, extended backwards so that every ToolMessage in the window
+  keeps the AIMessage that requested it. SystemMessages are always loaded;
+- can still return the full history on demand (exports, audits).
+
+Old messages can be moved to thread_messages_archive (see engine/message_archive.py):
+each archived range becomes one compressed segment row, so thread_messages and its
+indexes only hold what the window can still load. Archived messages are never loaded
+by aget_tuple; aget_full_history(include_archived=True) rehydrates them.
+
+Messages removed from the state with RemoveMessage are NOT deleted from the table.
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from os import getenv
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from engine.checkpoint_codec import CompressingSerializer, ZlibCodec
+from engine.token_count import default_counter
+
+# Type stored in checkpoint_blobs.type for the `messages` channel when its value
+# lives in thread_messages. The blob holds the highest seq written for the thread.
+MESSAGE_STORE_BLOB_TYPE = "thread_messages"
+
+MESSAGE_STORE_MIGRATIONS = [
+    """CREATE TABLE IF NOT EXISTS thread_messages (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    seq BIGINT NOT NULL,
+    message_id TEXT NOT NULL,
+    ts TIMESTAMPTZ,
+    role TEXT NOT NULL,
+    tool_call_id TEXT,
+    tool_call_ids TEXT[],
+    est_tokens INTEGER NOT NULL DEFAULT 0,
+    type TEXT NOT NULL,
+    payload BYTEA NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, seq),
+    UNIQUE (thread_id, checkpoint_ns, message_id)
+);""",
+]
+
+# New rows take seq = max(seq) + 1, so the writers of a thread (several replicas, a
+# double-sent message) are serialized until their transaction commits.
+LOCK_THREAD_MESSAGES_SQL = """
+    SELECT pg_advisory_xact_lock(hashtextextended('eai-messages:' || %s || ':' || %s, 0))
+"""
+
+UPSERT_THREAD_MESSAGE_SQL = """
+    INSERT INTO thread_messages (
+        thread_id, checkpoint_ns, seq, message_id, ts, role,
+        tool_call_id, tool_call_ids, est_tokens, type, payload
+    )
+    SELECT %s, %s,
+           COALESCE(
+               (SELECT max(seq) FROM thread_messages WHERE thread_id = %s AND checkpoint_ns = %s),
+               0
+           ) + 1,
+           %s, %s, %s, %s, %s, %s, %s, %s
+    ON CONFLICT (thread_id, checkpoint_ns, message_id) DO UPDATE SET
+        ts = EXCLUDED.ts,
+        tool_call_id = EXCLUDED.tool_call_id,
+        tool_call_ids = EXCLUDED.tool_call_ids,
+        est_tokens = EXCLUDED.est_tokens,
+        type = EXCLUDED.type,
+        payload = EXCLUDED.payload
+    WHERE thread_messages.payload IS DISTINCT FROM EXCLUDED.payload
+"""
+
+# Archived history: one row per archived range of a thread, holding the original
+# thread_messages rows (seq, message_id, ts, type, payload) as one compressed segment.
+MESSAGE_ARCHIVE_MIGRATIONS = [
+    """CREATE TABLE IF NOT EXISTS thread_messages_archive (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    first_seq BIGINT NOT NULL,
+    last_seq BIGINT NOT NULL,
+    message_count INTEGER NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    type TEXT NOT NULL,
+    segment BYTEA NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, first_seq)
+);""",
+]
+
+# checkpoint_blobs row of the `messages` channel, pointing at the highest seq of the
+# thread. Computed server-side so it can be queued in the same pipeline as the upserts.
+UPSERT_MESSAGES_REF_BLOB_SQL = f"""
+    INSERT INTO checkpoint_blobs (thread_id, checkpoint_ns, channel, version, type, blob)
+    SELECT %s, %s, %s, %s, '{MESSAGE_STORE_BLOB_TYPE}',
+           convert_to(COALESCE(max(seq), 0)::text, 'UTF8')
+      FROM thread_messages
+     WHERE thread_id = %s AND checkpoint_ns = %s
+    ON CONFLICT (thread_id, checkpoint_ns, channel, version) DO NOTHING
+"""
+
+# Tail window in a single statement:
+#   ranked  - messages up to the checkpoint's seq, newest first, with running counts/tokens
+#   bounds  - oldest seq within the count/token limits and newer than the most recent
+#             message older than min_ts (always keeps at least the last message)
+#   answered - tool_call_ids answered inside the window
+#   partner - oldest AIMessage before the window whose tool calls are answered inside it
+# CTEs are MATERIALIZED so each runs once; inlined, the planner may re-run them per row.
+SELECT_WINDOW_SQL = """
+    WITH ranked AS (
+        SELECT seq, ts,
+               row_number() OVER w AS rn,
+               sum(est_tokens) OVER w AS running_tokens
+          FROM thread_messages
+         WHERE thread_id = %(thread_id)s
+           AND checkpoint_ns = %(checkpoint_ns)s
+           AND seq <= %(max_seq)s
+        WINDOW w AS (ORDER BY seq DESC)
+    ),
+    bounds AS MATERIALIZED (
+        SELECT GREATEST(
+                   COALESCE(
+                       min(seq) FILTER (
+                           WHERE (%(max_messages)s::int IS NULL OR rn <= %(max_messages)s::int)
+                             AND (%(max_tokens)s::int IS NULL OR running_tokens <= %(max_tokens)s::int)
+                       ),
+                       max(seq)
+                   ),
+                   LEAST(
+                       COALESCE(max(seq) FILTER (WHERE ts < %(min_ts)s::timestamptz) + 1, 0),
+                       max(seq)
+                   )
+               ) AS start_seq
+          FROM ranked
+    ),
+    answered AS MATERIALIZED (
+        SELECT COALESCE(array_agg(t.tool_call_id), '{}') AS ids
+          FROM thread_messages t, bounds
+         WHERE t.thread_id = %(thread_id)s
+           AND t.checkpoint_ns = %(checkpoint_ns)s
+           AND t.seq >= bounds.start_seq
+           AND t.seq <= %(max_seq)s
+           AND t.tool_call_id IS NOT NULL
+    ),
+    partner AS MATERIALIZED (
+        SELECT min(a.seq) AS seq
+          FROM thread_messages a, bounds, answered
+         WHERE a.thread_id = %(thread_id)s
+           AND a.checkpoint_ns = %(checkpoint_ns)s
+           AND a.seq < bounds.start_seq
+           AND a.tool_call_ids && answered.ids
+    )
+    SELECT m.seq, m.message_id, m.ts, m.type, m.payload
+      FROM thread_messages m, bounds
+      LEFT JOIN partner ON true
+     WHERE m.thread_id = %(thread_id)s
+       AND m.checkpoint_ns = %(checkpoint_ns)s
+       AND m.seq <= %(max_seq)s
+       AND (
+           m.seq >= LEAST(bounds.start_seq, COALESCE(partner.seq, bounds.start_seq))
+           OR m.role = 'system'
+       )
+     ORDER BY m.seq
+"""
+
+# Rows that can no longer be loaded by a window whose age limit is at most `cutoff`:
+# up to the newest message older than the cutoff, except the last message of the
+# thread (it anchors seq numbering), system messages and AIMessages whose tool calls
+# are answered after the cutoff (window partners).
+SELECT_ARCHIVABLE_SQL = """
+    WITH bound AS MATERIALIZED (
+        SELECT max(seq) FILTER (WHERE ts < %(cutoff)s) AS stale_seq, max(seq) AS last_seq
+          FROM thread_messages
+         WHERE thread_id = %(thread_id)s AND checkpoint_ns = %(checkpoint_ns)s
+    ),
+    answered AS MATERIALIZED (
+        SELECT COALESCE(array_agg(t.tool_call_id), '{}') AS ids
+          FROM thread_messages t, bound
+         WHERE t.thread_id = %(thread_id)s
+           AND t.checkpoint_ns = %(checkpoint_ns)s
+           AND t.seq > bound.stale_seq
+           AND t.tool_call_id IS NOT NULL
+    )
+    SELECT m.seq, m.message_id, m.ts, m.type, m.payload
+      FROM thread_messages m, bound, answered
+     WHERE m.thread_id = %(thread_id)s
+       AND m.checkpoint_ns = %(checkpoint_ns)s
+       AND m.seq <= bound.stale_seq
+       AND m.seq < bound.last_seq
+       AND m.role <> 'system'
+       AND NOT COALESCE(m.tool_call_ids && answered.ids, false)
+     ORDER BY m.seq
+     LIMIT %(limit)s
+       FOR UPDATE OF m SKIP LOCKED
+"""
+
+INSERT_ARCHIVE_SEGMENT_SQL = """
+    INSERT INTO thread_messages_archive (
+        thread_id, checkpoint_ns, first_seq, last_seq, message_count, type, segment
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+DELETE_ARCHIVED_SQL = """
+    DELETE FROM thread_messages
+     WHERE thread_id = %s AND checkpoint_ns = %s AND seq = ANY(%s)
+"""
+
+SELECT_ARCHIVE_SEGMENTS_SQL = """
+    SELECT type, segment
+      FROM thread_messages_archive
+     WHERE thread_id = %s AND checkpoint_ns = %s
+     ORDER BY first_seq
+"""
+
+DELETE_THREAD_MESSAGES_SQL = [
+    "DELETE FROM thread_messages WHERE thread_id = %s",
+    "DELETE FROM thread_messages_archive WHERE thread_id = %s",
+]
+
+SELECT_ALL_SQL = """
+    SELECT seq, message_id, ts, type, payload
+      FROM thread_messages
+     WHERE thread_id = %s AND checkpoint_ns = %s AND seq <= %s
+     ORDER BY seq
+"""
+
+
+@dataclass(frozen=True)
+class MessageStoreRef:
+    """Placeholder for the `messages` channel value stored in thread_messages."""
+
+    seq: int
+
+
+@dataclass(frozen=True)
+class HistoryWindow:
+    """Limits applied when loading the tail of a thread. None disables a limit."""
+
+    max_messages: Optional[int] = None
+    max_age_seconds: Optional[int] = None
+    max_tokens: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "HistoryWindow":
+        """Build a window from CHECKPOINT_HISTORY_* environment variables.
+
+        CHECKPOINT_HISTORY_MAX_AGE is expressed in days, like SHORT_MEMORY_TIME_LIMIT.
+        """
+        max_messages = getenv("CHECKPOINT_HISTORY_MAX_MESSAGES", "")
+        max_age_days = getenv("CHECKPOINT_HISTORY_MAX_AGE", "")
+        max_tokens = getenv("CHECKPOINT_HISTORY_MAX_TOKENS", "")
+        return cls(
+            max_messages=int(max_messages) if max_messages else None,
+            max_age_seconds=round(float(max_age_days) * 86400) if max_age_days else None,
+            max_tokens=int(max_tokens) if max_tokens else None,
+        )
+
+    @property
+    def is_unbounded(self) -> bool:
+        return (
+            self.max_messages is None
+            and self.max_age_seconds is None
+            and self.max_tokens is None
+        )
+
+
+def estimate_tokens(message: BaseMessage) -> int:
+    """Token count used by the short-term memory filter (cached on the message)."""
+    return default_counter().count(message)
+
+
+# What a write compares to decide whether a stored message must be rewritten:
+# (timestamp, hash of the content and tool calls). Only kept in-process.
+Fingerprint = Tuple[Optional[datetime], int]
+
+
+def _fingerprint(message: BaseMessage) -> Fingerprint:
+    content = message.content
+    digest = hash(content) if isinstance(content, str) else hash(repr(content))
+    if isinstance(message, AIMessage) and message.tool_calls:
+        digest = hash((digest, repr(message.tool_calls)))
+    return _message_timestamp(message), digest
+
+
+def _message_timestamp(message: BaseMessage) -> Optional[datetime]:
+    timestamp_str = getattr(message, "additional_kwargs", {}).get("timestamp")
+    if not timestamp_str:
+        return None
+    try:
+        ts = datetime.fromisoformat(str(timestamp_str).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+class ThreadMessageStore:
+    """SQL helpers for the thread_messages table.
+
+    Methods take an open cursor so the saver decides how statements are grouped
+    (pipeline, transaction) and which connection they run on.
+
+    The ids and fingerprints of the messages last read or written for each thread are
+    remembered (bounded LRU), so a write only sends messages that are new or changed
+    since. A thread this process has not read or written yet has all its messages
+    sent; the upsert leaves rows whose payload is unchanged alone. The set may be stale
+    if another replica wrote the thread; that only causes a redundant (no-op) upsert.
+    """
+
+    def __init__(self, serde, max_tracked_threads: int = 1024):
+        self.serde = serde
+        self.max_tracked_threads = max_tracked_threads
+        self._known: "OrderedDict[Tuple[str, str], Dict[str, Fingerprint]]" = OrderedDict()
+        self._known_lock = threading.Lock()
+        # Archive segments are always compressed, whatever the checkpoint codec
+        self._archive_serde = CompressingSerializer(serde, codec=ZlibCodec(level=9), min_bytes=0)
+
+    def dump_messages(
+        self, thread_id: str, checkpoint_ns: str, messages: Sequence[BaseMessage]
+    ) -> List[tuple]:
+        """Build UPSERT_THREAD_MESSAGE_SQL parameters for each message."""
+        params = []
+        for message in messages:
+            if not isinstance(message, BaseMessage) or not message.id:
+                continue
+            tool_call_id = message.tool_call_id if isinstance(message, ToolMessage) else None
+            tool_call_ids = (
+                [tc["id"] for tc in message.tool_calls if tc.get("id")]
+                if isinstance(message, AIMessage) and message.tool_calls
+                else None
+            )
+            est_tokens = estimate_tokens(message)  # before dumping: the count is cached in it
+            type_, payload = self.serde.dumps_typed(message)
+            params.append(
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    thread_id,
+                    checkpoint_ns,
+                    message.id,
+                    _message_timestamp(message),
+                    message.type,
+                    tool_call_id,
+                    tool_call_ids,
+                    est_tokens,
+                    type_,
+                    payload,
+                )
+            )
+        return params
+
+    def load_rows(self, rows: Sequence[Any]) -> List[BaseMessage]:
+        return [self.serde.loads_typed((row["type"], row["payload"])) for row in rows]
+
+    def remember(self, thread_id: str, checkpoint_ns: str, known: Dict[str, Fingerprint]) -> None:
+        """Record the messages known to be stored for a thread."""
+        with self._known_lock:
+            self._known[(thread_id, checkpoint_ns)] = known
+            self._known.move_to_end((thread_id, checkpoint_ns))
+            while len(self._known) > self.max_tracked_threads:
+                self._known.popitem(last=False)
+
+    def forget(self, thread_id: str) -> None:
+        with self._known_lock:
+            for key in [k for k in self._known if k[0] == thread_id]:
+                del self._known[key]
+
+    async def aprepare(
+        self, thread_id: str, checkpoint_ns: str, messages: Sequence[BaseMessage]
+    ) -> List[tuple]:
+        """Return UPSERT_THREAD_MESSAGE_SQL parameters for new or changed messages."""
+        pending = self._pending(thread_id, checkpoint_ns, messages)
+        if not pending:
+            return []
+        return await asyncio.to_thread(self.dump_messages, thread_id, checkpoint_ns, pending)
+
+    def prepare(
+        self, thread_id: str, checkpoint_ns: str, messages: Sequence[BaseMessage]
+    ) -> List[tuple]:
+        """Sync version of aprepare()."""
+        pending = self._pending(thread_id, checkpoint_ns, messages)
+        if not pending:
+            return []
+        return self.dump_messages(thread_id, checkpoint_ns, pending)
+
+    def _pending(
+        self, thread_id: str, checkpoint_ns: str, messages: Sequence[BaseMessage]
+    ) -> List[BaseMessage]:
+        messages = [m for m in messages if isinstance(m, BaseMessage) and m.id]
+        with self._known_lock:
+            stored = self._known.get((thread_id, checkpoint_ns))
+        if stored is None:
+            return messages
+        return [m for m in messages if stored.get(m.id) != _fingerprint(m)]
+
+    @staticmethod
+    def known_from_messages(messages: Sequence[BaseMessage]) -> Dict[str, Fingerprint]:
+        return {
+            m.id: _fingerprint(m)
+            for m in messages
+            if isinstance(m, BaseMessage) and m.id
+        }
+
+    async def aread_window(
+        self,
+        cur,
+        thread_id: str,
+        checkpoint_ns: str,
+        max_seq: int,
+        window: HistoryWindow,
+    ) -> List[BaseMessage]:
+        """Load the tail of a thread (up to max_seq) honoring the window limits."""
+        if window.is_unbounded:
+            return await self.aread_all(cur, thread_id, checkpoint_ns, max_seq)
+        await cur.execute(
+            SELECT_WINDOW_SQL, self._window_params(thread_id, checkpoint_ns, max_seq, window)
+        )
+        return self._load_and_remember(thread_id, checkpoint_ns, await cur.fetchall())
+
+    async def aread_all(
+        self, cur, thread_id: str, checkpoint_ns: str, max_seq: int
+    ) -> List[BaseMessage]:
+        await cur.execute(SELECT_ALL_SQL, (thread_id, checkpoint_ns, max_seq))
+        return self._load_and_remember(thread_id, checkpoint_ns, await cur.fetchall())
+
+    def read_window(
+        self,
+        cur,
+        thread_id: str,
+        checkpoint_ns: str,
+        max_seq: int,
+        window: HistoryWindow,
+    ) -> List[BaseMessage]:
+        """Sync version of aread_window()."""
+        if window.is_unbounded:
+            return self.read_all(cur, thread_id, checkpoint_ns, max_seq)
+        cur.execute(
+            SELECT_WINDOW_SQL, self._window_params(thread_id, checkpoint_ns, max_seq, window)
+        )
+        return self._load_and_remember(thread_id, checkpoint_ns, cur.fetchall())
+
+    def read_all(
+        self, cur, thread_id: str, checkpoint_ns: str, max_seq: int
+    ) -> List[BaseMessage]:
+        cur.execute(SELECT_ALL_SQL, (thread_id, checkpoint_ns, max_seq))
+        return self._load_and_remember(thread_id, checkpoint_ns, cur.fetchall())
+
+    @staticmethod
+    def _window_params(
+        thread_id: str, checkpoint_ns: str, max_seq: int, window: HistoryWindow
+    ) -> Dict[str, Any]:
+        min_ts = (
+            datetime.now(timezone.utc) - timedelta(seconds=window.max_age_seconds)
+            if window.max_age_seconds is not None
+            else None
+        )
+        return {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "max_seq": max_seq,
+            "max_messages": window.max_messages,
+            "max_tokens": window.max_tokens,
+            "min_ts": min_ts,
+        }
+
+    def _load_and_remember(self, thread_id, checkpoint_ns, rows) -> List[BaseMessage]:
+        messages = self.load_rows(rows)
+        self.remember(thread_id, checkpoint_ns, self.known_from_messages(messages))
+        return messages
+
+    async def aarchive(
+        self, cur, thread_id: str, checkpoint_ns: str, cutoff: datetime, limit: int = 1000
+    ) -> Tuple[int, int, int]:
+        """Move up to `limit` archivable messages (see SELECT_ARCHIVABLE_SQL) into one
+        archive segment. Must run inside a transaction.
+
+        Returns (messages, bytes removed from thread_messages, segment bytes).
+        """
+        await cur.execute(
+            SELECT_ARCHIVABLE_SQL,
+            {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "cutoff": cutoff, "limit": limit},
+        )
+        rows = await cur.fetchall()
+        if not rows:
+            return 0, 0, 0
+        type_, segment = await asyncio.to_thread(
+            self._archive_serde.dumps_typed,
+            [[r["seq"], r["message_id"], r["ts"], r["type"], r["payload"]] for r in rows],
+        )
+        seqs = [r["seq"] for r in rows]
+        await cur.execute(
+            INSERT_ARCHIVE_SEGMENT_SQL,
+            (thread_id, checkpoint_ns, seqs[0], seqs[-1], len(rows), type_, segment),
+        )
+        await cur.execute(DELETE_ARCHIVED_SQL, (thread_id, checkpoint_ns, seqs))
+        return len(rows), sum(len(r["payload"]) for r in rows), len(segment)
+
+    async def aread_archived(self, cur, thread_id: str, checkpoint_ns: str) -> List[BaseMessage]:
+        """Rehydrate every archived message of a thread, oldest first."""
+        await cur.execute(SELECT_ARCHIVE_SEGMENTS_SQL, (thread_id, checkpoint_ns))
+        rows = [
+            row
+            for segment in await cur.fetchall()
+            for row in self._archive_serde.loads_typed((segment["type"], segment["segment"]))
+        ]
+        return self.load_rows([{"type": row[3], "payload": row[4]} for row in rows])
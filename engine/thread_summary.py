@@ -0,0 +1,290 @@
+"""
+Rolling Conversation Summary
+
+Optional (CONVERSATION_SUMMARY=true). Messages that fall out of the short-term memory
+window are folded into a per-thread summary stored in thread_summaries, and the
+pre-model hook adds it to the model input as a SystemMessage ("CONVERSATION
+SUMMARY:") ahead of the window, so a small SHORT_MEMORY_TOKEN_LIMIT keeps the gist
+of older turns.
+
+- Updates are incremental: the stored summary and the messages dropped since the
+  last update (after covered_until) are sent to the model, which returns the new
+  summary. At most CONVERSATION_SUMMARY_MAX_INPUT_TOKENS of the most recent dropped
+  messages are folded per update; older ones are skipped.
+- They run off the response path: the hook only records what fell out of the window
+  (see pending_batch); async_query / async_stream_query start the update as a
+  background task after the turn, once CONVERSATION_SUMMARY_MIN_MESSAGES are
+  pending. Until it completes, the previous summary is used.
+- The summary is read once per turn (primary-key lookup) and kept per replica. A
+  write only replaces a summary that covers older messages (covered_at), so
+  concurrent updates from several replicas never go backwards.
+"""
+
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from os import getenv
+from typing import List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+from engine.history_scan import NO_TIMESTAMP, HistoryScan, leading_system_messages
+
+SUMMARY_PREFIX = "CONVERSATION SUMMARY:"
+
+THREAD_SUMMARY_MIGRATIONS = [
+    """CREATE TABLE IF NOT EXISTS thread_summaries (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    summary TEXT NOT NULL,
+    covered_until TEXT,
+    covered_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (thread_id, checkpoint_ns)
+);""",
+]
+
+SELECT_SUMMARY_SQL = """
+    SELECT summary, covered_until, covered_at
+      FROM thread_summaries
+     WHERE thread_id = %s AND checkpoint_ns = %s
+"""
+
+UPSERT_SUMMARY_SQL = """
+    INSERT INTO thread_summaries (thread_id, checkpoint_ns, summary, covered_until, covered_at)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (thread_id, checkpoint_ns) DO UPDATE
+       SET summary = EXCLUDED.summary,
+           covered_until = EXCLUDED.covered_until,
+           covered_at = EXCLUDED.covered_at,
+           updated_at = now()
+     WHERE thread_summaries.covered_at < EXCLUDED.covered_at
+"""
+
+DELETE_THREAD_SUMMARY_SQL = "DELETE FROM thread_summaries WHERE thread_id = %s"
+
+SUMMARY_PROMPT = """You maintain the running summary of a conversation between a user and an \
+AI assistant. Update the current summary with the new messages below.
+
+Keep what the assistant may need later: what the user asked for, details they shared \
+about themselves, answers and decisions given, and anything still pending. Drop \
+greetings and repetition. Write in the language of the conversation, as short \
+bullet points, in at most {max_words} words. Return only the summary.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+# Tool results are truncated to this many characters in the summarization prompt
+MAX_TOOL_RESULT_CHARS = 1000
+
+
+@dataclass(frozen=True)
+class ThreadSummary:
+    text: str
+    covered_until: Optional[str]  # id of the last message folded into the summary
+    covered_at: datetime  # its timestamp: summaries only move forward
+
+
+@dataclass(frozen=True)
+class PendingBatch:
+    """Messages dropped from the window and not yet in the summary."""
+
+    messages: List[BaseMessage]
+    covered_at: datetime  # timestamp of the last one
+
+
+@dataclass
+class SummaryOptions:
+    enabled: bool = False
+    model: str = "gemini-2.5-flash-lite"
+    min_messages: int = 8
+    max_tokens: int = 600
+    max_input_tokens: int = 8000
+
+    @classmethod
+    def from_env(cls) -> "SummaryOptions":
+        """Build from CONVERSATION_SUMMARY and CONVERSATION_SUMMARY_*."""
+        return cls(
+            enabled=getenv("CONVERSATION_SUMMARY", "false").lower() == "true",
+            model=getenv("CONVERSATION_SUMMARY_MODEL", "gemini-2.5-flash-lite"),
+            min_messages=int(getenv("CONVERSATION_SUMMARY_MIN_MESSAGES", "8")),
+            max_tokens=int(getenv("CONVERSATION_SUMMARY_MAX_TOKENS", "600")),
+            max_input_tokens=int(getenv("CONVERSATION_SUMMARY_MAX_INPUT_TOKENS", "8000")),
+        )
+
+
+class ThreadSummaries:
+    """Per-replica summaries and pending batches by thread_id (bounded LRU). Thread-safe."""
+
+    def __init__(self, max_threads: int = 1024):
+        self.max_threads = max_threads
+        self._summaries: "OrderedDict[str, ThreadSummary]" = OrderedDict()
+        self._pending: dict[str, PendingBatch] = {}
+        self._lock = threading.Lock()
+        self.stats = {"updates": 0, "errors": 0, "last_update_ms": None, "last_error": None}
+
+    def get(self, thread_id: str) -> Optional[ThreadSummary]:
+        with self._lock:
+            summary = self._summaries.get(thread_id)
+            if summary is not None:
+                self._summaries.move_to_end(thread_id)
+            return summary
+
+    def put(self, thread_id: str, summary: Optional[ThreadSummary]) -> None:
+        """Keep summary unless the one already known covers newer messages."""
+        if summary is None:
+            return
+        with self._lock:
+            current = self._summaries.get(thread_id)
+            if current is not None and current.covered_at >= summary.covered_at:
+                return
+            self._summaries[thread_id] = summary
+            self._summaries.move_to_end(thread_id)
+            if len(self._summaries) > self.max_threads:
+                self._summaries.popitem(last=False)
+
+    def set_pending(self, thread_id: str, batch: Optional[PendingBatch]) -> None:
+        with self._lock:
+            self._pending.pop(thread_id, None)
+            if batch is not None:
+                self._pending[thread_id] = batch
+                if len(self._pending) > self.max_threads:
+                    self._pending.pop(next(iter(self._pending)))
+
+    def take_pending(self, thread_id: str) -> Optional[PendingBatch]:
+        with self._lock:
+            return self._pending.pop(thread_id, None)
+
+
+def summary_message(summary: ThreadSummary) -> SystemMessage:
+    return SystemMessage(content=f"{SUMMARY_PREFIX}\n{summary.text}")
+
+
+def with_summary(window: List[BaseMessage], summary: ThreadSummary) -> List[BaseMessage]:
+    """window with the summary message after its SystemMessages."""
+    head = leading_system_messages(window)
+    return window[:head] + [summary_message(summary)] + window[head:]
+
+
+def dropped_count(scan: HistoryScan, messages: Sequence[BaseMessage], window: Sequence[BaseMessage]) -> int:
+    """Number of conversation messages (scan.positions) before the window."""
+    first = next((m for m in window if not isinstance(m, SystemMessage)), None)
+    if first is None:
+        return 0
+    return bisect_left(scan.positions, scan.positions_of(messages, [first])[0])
+
+
+def pending_batch(
+    scan: HistoryScan,
+    messages: Sequence[BaseMessage],
+    dropped: int,
+    summary: Optional[ThreadSummary],
+    max_input_tokens: int,
+) -> Optional[PendingBatch]:
+    """The first `dropped` conversation messages not yet in summary, at most
+    max_input_tokens of them (the most recent)."""
+    start = 0
+    if summary is not None:
+        covered = scan.ids.get(summary.covered_until) if summary.covered_until else None
+        if covered is not None:
+            start = bisect_right(scan.positions, covered)
+        else:  # not in the loaded history (windowed load, rewritten thread): by time
+            covered_at = summary.covered_at.timestamp()
+            times = scan.times[:dropped]
+            if scan.ordered:
+                start = bisect_right(times, covered_at)
+            else:
+                start = max((i + 1 for i, time in enumerate(times) if time <= covered_at), default=0)
+    if start >= dropped:
+        return None
+    start = max(start, bisect_left(scan.sums, scan.sums[dropped] - max_input_tokens, start, dropped))
+    if start >= dropped:
+        return None
+    head = leading_system_messages(messages)
+    batch = [messages[head + scan.positions[i]] for i in range(start, dropped)]
+    times = [time for time in scan.times[start:dropped] if time != NO_TIMESTAMP]
+    covered_at = epoch_to_datetime(max(times)) if times else datetime.now(timezone.utc)
+    return PendingBatch(messages=batch, covered_at=covered_at)
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part if isinstance(part, str) else part.get("text", "")
+        for part in content
+        if isinstance(part, str) or part.get("type") == "text"
+    )
+
+
+def render_messages(messages: Sequence[BaseMessage]) -> str:
+    """Messages as plain text lines for the summarization prompt."""
+    lines = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            lines.append(f"User: {_text(message.content)}")
+        elif isinstance(message, AIMessage):
+            if _text(message.content).strip():
+                lines.append(f"Assistant: {_text(message.content)}")
+            for tool_call in message.tool_calls:
+                args = json.dumps(tool_call.get("args", {}), ensure_ascii=False)
+                lines.append(f"Assistant called {tool_call.get('name')}({args})")
+        elif isinstance(message, ToolMessage):
+            result = _text(message.content)
+            if len(result) > MAX_TOOL_RESULT_CHARS:
+                result = result[:MAX_TOOL_RESULT_CHARS] + "..."
+            lines.append(f"Tool {message.name or ''} returned: {result}")
+    return "\n".join(lines)
+
+
+async def asummarize(
+    llm, previous: Optional[ThreadSummary], batch: PendingBatch, max_tokens: int
+) -> ThreadSummary:
+    """Fold batch into previous with one model call."""
+    prompt = SUMMARY_PROMPT.format(
+        max_words=int(max_tokens * 0.75),
+        summary=previous.text if previous else "(none yet)",
+        messages=render_messages(batch.messages),
+    )
+    response = await llm.ainvoke([HumanMessage(content=prompt)])
+    return ThreadSummary(
+        text=_text(response.content).strip(),
+        covered_until=batch.messages[-1].id,
+        covered_at=batch.covered_at,
+    )
+
+
+async def aload_summary(conn, thread_id: str, checkpoint_ns: str = "") -> Optional[ThreadSummary]:
+    """`conn` is a psycopg AsyncConnection with a dict_row row factory."""
+    cur = await conn.execute(SELECT_SUMMARY_SQL, (thread_id, checkpoint_ns))
+    row = await cur.fetchone()
+    return _from_row(row)
+
+
+def load_summary(conn, thread_id: str, checkpoint_ns: str = "") -> Optional[ThreadSummary]:
+    return _from_row(conn.execute(SELECT_SUMMARY_SQL, (thread_id, checkpoint_ns)).fetchone())
+
+
+async def asave_summary(conn, thread_id: str, summary: ThreadSummary, checkpoint_ns: str = "") -> None:
+    await conn.execute(
+        UPSERT_SUMMARY_SQL,
+        (thread_id, checkpoint_ns, summary.text, summary.covered_until, summary.covered_at),
+    )
+
+
+def _from_row(row) -> Optional[ThreadSummary]:
+    if row is None:
+        return None
+    return ThreadSummary(
+        text=row["summary"], covered_until=row["covered_until"], covered_at=row["covered_at"]
+    )
+
+
+def epoch_to_datetime(seconds: float) -> datetime:
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
@@ -0,0 +1,147 @@
+"""
+Per-message token counts for the short-term memory window.
+
+A message is counted once and the result is cached in
+additional_kwargs["token_count"] as {"n": tokens, "by": counter}, so it is persisted
+with the checkpoint (like the timestamp) and later turns only read it:
+  - AIMessage with usage_metadata: the output tokens reported by the model, minus
+    reasoning tokens whose thoughts are not kept in the content ("by": "usage");
+    exact, and never recomputed
+  - any other message: a calibrated estimate, characters / TOKEN_CHARS_PER_TOKEN for
+    prose and / TOKEN_CHARS_PER_TOKEN_JSON for JSON content (most tool results),
+    other content parts and tool call arguments (JSON packs fewer characters per
+    token). "by" names the ratios, so changing
+    them recounts old messages instead of mixing scales.
+
+Calibrate the ratios on real threads with
+`uv run python -m scripts.calibrate_token_counter`.
+
+trim_to_token_budget() selects the same window as
+trim_messages(strategy="last", start_on="human", end_on=("human", "tool")) did, with
+one pass of cached counts and a binary search over their prefix sums instead of
+recounting the remaining messages for every candidate cut.
+"""
+
+import json
+import math
+from bisect import bisect_left
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from itertools import accumulate
+from os import getenv
+from typing import List, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+TOKEN_COUNT_KEY = "token_count"
+USAGE_COUNTER = "usage"
+
+
+@dataclass(frozen=True)
+class TokenCounter:
+    """Counts (and caches) the tokens of a message; see the module docstring."""
+
+    chars_per_token: float = 4.0
+    json_chars_per_token: float = 3.0
+
+    @classmethod
+    def from_env(cls) -> "TokenCounter":
+        return cls(
+            chars_per_token=float(getenv("TOKEN_CHARS_PER_TOKEN", "4")),
+            json_chars_per_token=float(getenv("TOKEN_CHARS_PER_TOKEN_JSON", "3")),
+        )
+
+    @cached_property
+    def name(self) -> str:
+        return f"chars:{self.chars_per_token:g}/{self.json_chars_per_token:g}"
+
+    def count(self, message: BaseMessage) -> int:
+        """Cached token count of message, computed and cached on first use."""
+        cached = message.additional_kwargs.get(TOKEN_COUNT_KEY)
+        if isinstance(cached, dict) and cached.get("by") in (USAGE_COUNTER, self.name):
+            return cached["n"]
+        usage = usage_tokens(message)
+        if usage is not None:
+            tokens, by = usage, USAGE_COUNTER
+        else:
+            tokens, by = self.estimate(message), self.name
+        message.additional_kwargs[TOKEN_COUNT_KEY] = {"n": tokens, "by": by}
+        return tokens
+
+    def estimate(self, message: BaseMessage) -> int:
+        text_chars, json_chars = message_chars(message)
+        return math.ceil(text_chars / self.chars_per_token + json_chars / self.json_chars_per_token)
+
+    def prefix_sums(self, messages: Sequence[BaseMessage]) -> List[int]:
+        """[0, t0, t0 + t1, ...]: tokens of messages[i:j] is sums[j] - sums[i]."""
+        return list(accumulate((self.count(m) for m in messages), initial=0))
+
+
+@lru_cache(maxsize=1)
+def default_counter() -> TokenCounter:
+    """The process-wide counter configured by TOKEN_CHARS_PER_TOKEN[_JSON]."""
+    return TokenCounter.from_env()
+
+
+def trim_to_token_budget(
+    messages: Sequence[BaseMessage],
+    max_tokens: int,
+    counter: TokenCounter,
+    start_on=HumanMessage,
+    end_on=(HumanMessage, ToolMessage),
+) -> List[BaseMessage]:
+    """Latest messages fitting in max_tokens, starting on start_on and ending on end_on.
+
+    Empty if not even the last message fits.
+    """
+    end = len(messages)
+    while end and not isinstance(messages[end - 1], end_on):
+        end -= 1
+    sums = counter.prefix_sums(messages[:end])
+    # First cut whose suffix fits: sums is non-decreasing, so binary search
+    start = bisect_left(sums, sums[end] - max_tokens, 0, end + 1)
+    while start < end and not isinstance(messages[start], start_on):
+        start += 1
+    return list(messages[start:end])
+
+
+def message_chars(message: BaseMessage) -> tuple[int, int]:
+    """(prose characters, JSON characters) of a message, tool call arguments included."""
+    text_chars, json_chars = _content_chars(message.content)
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        json_chars += len(tool_call.get("name", "")) + len(
+            json.dumps(tool_call.get("args", {}), ensure_ascii=False)
+        )
+    return text_chars, json_chars
+
+
+def usage_tokens(message: BaseMessage) -> int | None:
+    """Tokens the model reported for an AIMessage it generated, None if unknown."""
+    usage = getattr(message, "usage_metadata", None) if isinstance(message, AIMessage) else None
+    if not usage or not usage.get("output_tokens"):
+        return None
+    tokens = usage["output_tokens"]
+    has_thoughts = isinstance(message.content, list) and any(
+        isinstance(part, dict) and part.get("type") == "thinking" for part in message.content
+    )
+    if not has_thoughts:
+        tokens -= (usage.get("output_token_details") or {}).get("reasoning", 0)
+    return tokens if tokens > 0 else None
+
+
+def _content_chars(content) -> tuple[int, int]:
+    """(prose characters, JSON characters) of a message content."""
+    if isinstance(content, str):
+        looks_like_json = content.lstrip()[:1] in ("{", "[")
+        return (0, len(content)) if looks_like_json else (len(content), 0)
+    text_chars = json_chars = 0
+    for part in content:
+        if isinstance(part, str):
+            text_chars += len(part)
+        elif part.get("type") in ("text", "thinking"):
+            chars = _content_chars(part.get(part["type"], ""))
+            text_chars += chars[0]
+            json_chars += chars[1]
+        else:
+            json_chars += len(json.dumps(part, ensure_ascii=False, default=str))
+    return text_chars, json_chars
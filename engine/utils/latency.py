@@ -0,0 +1,47 @@
+"""
+Rolling latency samples per operation, for cheap in-process percentiles.
+"""
+
+import threading
+from collections import deque
+from typing import Deque, Dict
+
+
+class LatencyStats:
+    """Keeps the last `window` samples (in milliseconds) of each operation."""
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, elapsed_ms: float) -> None:
+        with self._lock:
+            samples = self._samples.get(operation)
+            if samples is None:
+                samples = self._samples[operation] = deque(maxlen=self.window)
+            samples.append(elapsed_ms)
+            self._counts[operation] = self._counts.get(operation, 0) + 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Count and p50/p95/p99/max (ms) over the retained samples of each operation."""
+        with self._lock:
+            snapshot = {op: sorted(samples) for op, samples in self._samples.items()}
+            counts = dict(self._counts)
+        return {
+            op: {
+                "count": counts[op],
+                "p50": _percentile(samples, 50),
+                "p95": _percentile(samples, 95),
+                "p99": _percentile(samples, 99),
+                "max": samples[-1],
+            }
+            for op, samples in snapshot.items()
+            if samples
+        }
+
+
+def _percentile(sorted_samples, pct: float) -> float:
+    index = min(len(sorted_samples) - 1, int(round(pct / 100 * (len(sorted_samples) - 1))))
+    return round(sorted_samples[index], 3)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Throughput of the checkpointer versus connection pool size under concurrent turns.
+
+Creates a throwaway database next to --dsn (dropped at the end unless --keep-db) and,
+for every --pool-sizes value, runs --concurrency workers, each replaying --turns
+synthetic ReAct turns on its own thread (aget_tuple + 3 x (aput_writes + aput), as in
+scripts/bench_checkpointer.py) through one IntVersionPostgresSaver on an
+AsyncConnectionPool. Reports per pool size:
+  - turns/s       completed turns over wall-clock time
+  - turn p50/p95  latency of a turn, including waits for a connection
+  - wait ms       psycopg_pool requests_wait_ms / requests_queued (time spent
+                  queued for a connection)
+
+On a local database turns are CPU-bound and a bigger pool barely helps; --rtt-ms adds
+a delay to every statement sent outside a pipeline to approximate the round trip of
+the PSC link to Cloud SQL (pipelined aput batches are not delayed).
+
+--shared-lock uses the stock AsyncPostgresSaver cursor (one saver-wide lock), to
+compare with the per-operation pooled connections. --output writes JSON (with the
+git commit) that can be diffed between commits.
+
+Usage:
+  uv run python -m scripts.bench_pool --dsn postgresql://postgres@localhost:5432/postgres \\
+      [--pool-sizes 1 2 5 10 20] [--concurrency 32] [--turns 10] [--history 20] \\
+      [--rtt-ms 2] [--shared-lock] [--output pool.json] [--keep-db]
+"""
+import argparse
+import asyncio
+import json
+import platform
+import time
+import uuid
+from datetime import datetime, timezone
+
+import psycopg
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg import AsyncCursor
+from psycopg.conninfo import conninfo_to_dict, make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from engine.checkpointer import IntVersionPostgresSaver
+from engine.utils.latency import LatencyStats
+from scripts.bench_checkpoint_codec import synthetic_conversation
+from scripts.bench_checkpointer import (
+    _build_dsn,
+    _checkpoint,
+    _create_database,
+    _drop_database,
+    _git_commit,
+    _ts,
+    _turn,
+)
+
+
+class SharedLockSaver(IntVersionPostgresSaver):
+    """IntVersionPostgresSaver with the stock cursor: every operation takes self.lock."""
+
+    _cursor = AsyncPostgresSaver._cursor
+
+
+def _delayed_cursor(rtt_ms: float):
+    class DelayedCursor(AsyncCursor):
+        async def execute(self, query, params=None, **kwargs):
+            if self.connection._pipeline is None:
+                await asyncio.sleep(rtt_ms / 1000)
+            return await super().execute(query, params, **kwargs)
+
+    return DelayedCursor
+
+
+async def _worker(saver, stats: LatencyStats, args, worker: int) -> None:
+    config = {"configurable": {"thread_id": f"bench-pool-{worker}-{uuid.uuid4()}", "checkpoint_ns": ""}}
+    version = 1
+    await saver.aput(
+        config, _checkpoint(synthetic_conversation(args.history), version), {"step": 1}, {"messages": 1}
+    )
+    for i in range(args.turns):
+        start = time.perf_counter()
+        current = await saver.aget_tuple(config)
+        messages = list(current.checkpoint["channel_values"]["messages"])
+        parent = current.config
+        for message in _turn(i)[1:]:
+            messages.append(message)
+            version += 1
+            await saver.aput_writes(parent, [("messages", [message])], str(uuid.uuid4()))
+            parent = await saver.aput(
+                parent, _checkpoint(messages, version), {"step": version}, {"messages": version}
+            )
+        stats.record("turn", (time.perf_counter() - start) * 1000)
+
+
+async def bench_pool_size(dsn: str, args, size: int) -> dict:
+    async with AsyncConnectionPool(
+        conninfo=dsn,
+        min_size=size,
+        max_size=size,
+        open=False,
+        kwargs={
+            "autocommit": True,
+            "prepare_threshold": 0,
+            "row_factory": dict_row,
+            **({"cursor_factory": _delayed_cursor(args.rtt_ms)} if args.rtt_ms else {}),
+        },
+    ) as pool:
+        await pool.open(wait=True)
+        saver = (SharedLockSaver if args.shared_lock else IntVersionPostgresSaver)(conn=pool)
+        stats = LatencyStats(window=args.concurrency * args.turns)
+        pool.pop_stats()
+        start = time.perf_counter()
+        await asyncio.gather(*(_worker(saver, stats, args, w) for w in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        pool_stats = pool.pop_stats()
+
+    turn = stats.summary()["turn"]
+    return {
+        "pool_size": size,
+        "turns_per_s": round(turn["count"] / elapsed, 1),
+        "turn": turn,
+        "requests_num": pool_stats.get("requests_num", 0),
+        "requests_queued": pool_stats.get("requests_queued", 0),
+        "requests_wait_ms": pool_stats.get("requests_wait_ms", 0),
+        "usage_ms": pool_stats.get("usage_ms", 0),
+    }
+
+
+async def bench(args: argparse.Namespace) -> dict:
+    admin_dsn = _build_dsn(args)
+    db_name = f"eai_bench_{uuid.uuid4().hex[:8]}"
+    dsn = make_conninfo(admin_dsn, dbname=db_name)
+    await _create_database(admin_dsn, db_name)
+    print(f"[{_ts()}] Created throwaway database {db_name}", flush=True)
+
+    results = []
+    try:
+        async with await psycopg.AsyncConnection.connect(
+            dsn, autocommit=True, prepare_threshold=0, row_factory=dict_row
+        ) as conn:
+            await IntVersionPostgresSaver(conn=conn).setup()
+            server_version = conn.info.server_version
+
+        for size in args.pool_sizes:
+            results.append(await bench_pool_size(dsn, args, size))
+            print(f"[{_ts()}] pool size {size}: {results[-1]['turns_per_s']} turns/s", flush=True)
+    finally:
+        if args.keep_db:
+            print(f"[{_ts()}] Kept database {db_name}")
+        else:
+            await _drop_database(admin_dsn, db_name)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "postgres": server_version,
+            "host": conninfo_to_dict(dsn).get("host"),
+            "concurrency": args.concurrency,
+            "turns": args.turns,
+            "history": args.history,
+            "rtt_ms": args.rtt_ms,
+            "shared_lock": args.shared_lock,
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark checkpointer throughput by pool size.")
+    parser.add_argument("--dsn", help="Postgres DSN used to create the throwaway database. If omitted, uses env vars.")
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 2, 5, 10, 20], help="Pool sizes to compare.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent threads (default: 32).")
+    parser.add_argument("--turns", type=int, default=10, help="Turns per thread (default: 10).")
+    parser.add_argument("--history", type=int, default=20, help="Messages already in each thread (default: 20).")
+    parser.add_argument("--rtt-ms", type=float, default=0, help="Simulated round trip per statement (default: 0).")
+    parser.add_argument("--shared-lock", action="store_true", help="Use the stock saver-wide lock.")
+    parser.add_argument("--output", help="Write JSON results to this file.")
+    parser.add_argument("--keep-db", action="store_true", help="Do not drop the throwaway database.")
+    args = parser.parse_args()
+
+    report = asyncio.run(bench(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[{_ts()}] Wrote {args.output}")
+
+    print(f"\n{'pool':>5} {'turns/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'queued':>8} {'wait ms':>9}")
+    for r in report["results"]:
+        print(
+            f"{r['pool_size']:>5} {r['turns_per_s']:>9.1f} {r['turn']['p50']:>8.2f} "
+            f"{r['turn']['p95']:>8.2f} {r['requests_queued']:>8} {r['requests_wait_ms']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
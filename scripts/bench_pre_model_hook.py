@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Per-step cost of the pre-model hook as a function of thread length.
+
+For every --history length, builds a synthetic thread (scripts/bench_checkpoint_codec.py
+conversation, with timestamps) and replays a ReAct turn of --steps model calls: each
+step appends an AIMessage with a tool call and its ToolMessage, then runs the Agent's
+pre-model hook (tool timestamps, long-term memory from the cache, short-term memory
+window, thread_id injection) with the production short-term memory limits
+(--token-limit, 30 days). Reports per length, with and without watermarks
+(engine/history_scan.py; HISTORY_SCAN_MAX_THREADS=0 rescans everything):
+  - first ms   the first call of the turn (full scan either way)
+  - step p50   p50 / p95 of the following calls
+
+With watermarks the per-step cost should stay flat as the history grows. No database
+or model is used; logging is disabled.
+
+Usage:
+  uv run python -m scripts.bench_pre_model_hook [--history 100 1000 5000 20000] \\
+      [--steps 20] [--token-limit 50000] [--output hook.json]
+"""
+import argparse
+import json
+import os
+import platform
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from engine.log import logger
+from engine.utils.latency import LatencyStats
+from scripts.bench_checkpoint_codec import synthetic_conversation
+from scripts.bench_checkpointer import _git_commit, _ts
+
+VARIANTS = ("watermark", "rescan")
+
+
+def _thread(length: int) -> list:
+    messages = synthetic_conversation(length)
+    start = datetime.now(timezone.utc) - timedelta(seconds=len(messages))
+    for i, message in enumerate(messages):
+        message.additional_kwargs["timestamp"] = (start + timedelta(seconds=i)).isoformat()
+    return messages
+
+
+def _step(n: int) -> list:
+    call_id = f"bench-hook-{n}"
+    return [
+        AIMessage(
+            content="",
+            tool_calls=[{"name": "google_search", "args": {"query": f"busca {n}"}, "id": call_id}],
+            id=str(uuid.uuid4()),
+            additional_kwargs={"timestamp": datetime.now(timezone.utc).isoformat()},
+        ),
+        ToolMessage(content=f"resultado {n} " * 50, tool_call_id=call_id, id=str(uuid.uuid4())),
+    ]
+
+
+def bench_length(length: int, variant: str, steps: int) -> dict:
+    from engine.agent import Agent
+
+    os.environ["HISTORY_SCAN_MAX_THREADS"] = "1024" if variant == "watermark" else "0"
+    agent = Agent(otpl_service="bench-pre-model-hook")
+    thread_id = f"bench-hook-{uuid.uuid4()}"
+    config = {"configurable": {"thread_id": thread_id}}
+    agent._memory_cache[thread_id] = {
+        "data": {"nome": "Maria"},
+        "timestamp": datetime.now(timezone.utc) + timedelta(days=1),
+    }
+
+    messages = _thread(length)
+    stats = LatencyStats(window=steps)
+    first_ms = None
+    for n in range(steps + 1):
+        messages += _step(n)
+        start = time.perf_counter()
+        agent._combined_pre_model_hook({"messages": messages}, config)
+        elapsed = (time.perf_counter() - start) * 1000
+        if first_ms is None:
+            first_ms = elapsed
+        else:
+            stats.record("step", elapsed)
+    return {"history": length, "variant": variant, "first_ms": round(first_ms, 3), "step": stats.summary()["step"]}
+
+
+def bench(args: argparse.Namespace) -> dict:
+    logger.disable("engine")
+    os.environ["SHORT_MEMORY_TIME_LIMIT"] = "30"
+    os.environ["SHORT_MEMORY_TOKEN_LIMIT"] = str(args.token_limit)
+    results = []
+    for length in args.history:
+        for variant in VARIANTS:
+            results.append(bench_length(length, variant, args.steps))
+        print(f"[{_ts()}] history {length}: done", flush=True)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "steps": args.steps,
+            "token_limit": args.token_limit,
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the pre-model hook by thread length.")
+    parser.add_argument("--history", type=int, nargs="+", default=[100, 1000, 5000, 20000], help="Thread lengths.")
+    parser.add_argument("--steps", type=int, default=20, help="Model calls per turn (default: 20).")
+    parser.add_argument("--token-limit", type=int, default=50000, help="SHORT_MEMORY_TOKEN_LIMIT (default: 50000).")
+    parser.add_argument("--output", help="Write JSON results to this file.")
+    args = parser.parse_args()
+
+    report = bench(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[{_ts()}] Wrote {args.output}")
+
+    print(f"\n{'history':>8} {'variant':<10} {'first ms':>9} {'step p50':>9} {'step p95':>9}")
+    for r in report["results"]:
+        print(
+            f"{r['history']:>8} {r['variant']:<10} {r['first_ms']:>9.2f} "
+            f"{r['step']['p50']:>9.3f} {r['step']['p95']:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Measure the cold-start cost of the agent on a fresh interpreter.
+
+Every sample runs in a new Python process, like an Agent Engine replica:
+  - import       `python -X importtime -c "import engine.agent"`: total time and the
+                 heaviest modules imported directly by engine.agent
+  - unpickle     cloudpickle.loads of an Agent (what the replica does first; includes
+                 importing engine.agent)
+  - first_query  first async_query, lazy setup included, with a stubbed LLM (fixed
+                 answer) and an in-memory checkpointer instead of Postgres; MCP tools
+                 are not loaded (the agent has none)
+  - second_query the next async_query on the same thread (warm)
+
+Reports the median of --repeat runs. --output writes JSON (with the git commit) that
+can be diffed between commits; --max-import-ms fails (exit 1) if the median import time
+is above the limit, for CI.
+
+Usage:
+  uv run python -m scripts.bench_startup [--repeat 5] [--top 15] \\
+      [--output startup.json] [--max-import-ms 1500]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+PHASES = ("unpickle", "first_query", "second_query")
+
+
+def _ts() -> str:
+    """Return current timestamp in HH:MM:SS format."""
+    return datetime.now().strftime("%H:%M:%S")
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parse_importtime(stderr: str, top: int) -> tuple[float, list[dict]]:
+    """Return (engine.agent cumulative ms, its heaviest direct imports)."""
+    total_ms, children = 0.0, []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # header
+        depth = len(name) - len(name.lstrip(" "))
+        ms = int(cumulative) / 1000
+        # -X importtime prints children before their parent, two spaces deeper
+        if depth == 1 and name.strip() == "engine.agent":
+            total_ms = ms
+        elif depth == 3:
+            children.append({"module": name.strip(), "ms": ms})
+    children.sort(key=lambda c: c["ms"], reverse=True)
+    return total_ms, children[:top]
+
+
+def measure_import(top: int) -> tuple[float, list[dict]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import engine.agent"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return _parse_importtime(result.stderr, top)
+
+
+def _pickle_agent(path: str) -> None:
+    import cloudpickle
+
+    from engine.agent import Agent
+
+    agent = Agent(system_prompt="Responda em uma frase.", tools=[], otpl_service="bench-startup")
+    with open(path, "wb") as f:
+        cloudpickle.dump(agent, f)
+
+
+async def _child(path: str) -> dict:
+    """Runs in a fresh interpreter: unpickle the agent and answer two queries."""
+    import cloudpickle
+
+    timings = {}
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        agent = cloudpickle.load(f)
+    timings["unpickle"] = (time.perf_counter() - start) * 1000
+
+    from itertools import cycle
+
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    class StubChatModel(GenericFakeChatModel):
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+    async def set_up_async():
+        # Same imports and graph as the real setup; only the database is replaced
+        import engine.checkpointer  # noqa: F401
+
+        agent._loop_resources().graph = agent._create_react_agent(checkpointer=InMemorySaver())
+
+    agent._llm = StubChatModel(messages=cycle([AIMessage(content="ok")]))
+    agent._set_up_async = set_up_async
+
+    config = {"configurable": {"thread_id": "bench-startup"}}
+    for phase in ("first_query", "second_query"):
+        start = time.perf_counter()
+        await agent.async_query(
+            input={"messages": [{"role": "user", "content": "oi"}]}, config=config
+        )
+        timings[phase] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def measure_cold_start(path: str) -> dict:
+    # Telemetry is set up for real, but must not export anywhere
+    env = {**os.environ, "OTEL_EXPORTER_OTLP_TRACES_ENDPOINT": "http://127.0.0.1:9/v1/traces"}
+    result = subprocess.run(
+        [sys.executable, "-m", "scripts.bench_startup", "--child", path],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"child failed:\n{result.stderr[-4000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench(args: argparse.Namespace) -> dict:
+    imports, top_modules = [], []
+    for _ in range(args.repeat):
+        total_ms, top_modules = measure_import(args.top)
+        imports.append(total_ms)
+    print(f"[{_ts()}] import engine.agent: median {statistics.median(imports):.0f} ms", flush=True)
+
+    samples = {phase: [] for phase in PHASES}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "agent.pkl")
+        _pickle_agent(path)
+        for i in range(args.repeat):
+            for phase, ms in measure_cold_start(path).items():
+                samples[phase].append(ms)
+            print(f"[{_ts()}] cold start {i + 1}/{args.repeat}: done", flush=True)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "repeat": args.repeat,
+        },
+        "import_ms": round(statistics.median(imports), 1),
+        "top_imports": top_modules,
+        **{f"{phase}_ms": round(statistics.median(samples[phase]), 1) for phase in PHASES},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure agent import and cold-start time.")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per measurement (default: 5).")
+    parser.add_argument("--top", type=int, default=15, help="Heaviest direct imports to list (default: 15).")
+    parser.add_argument("--output", help="Write JSON results to this file.")
+    parser.add_argument("--max-import-ms", type=float, help="Exit 1 if the median import time is above this.")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(_child(args.child))))
+        return
+
+    report = bench(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[{_ts()}] Wrote {args.output}")
+
+    print(f"\n{'module':<50} {'ms':>8}")
+    for module in report["top_imports"]:
+        print(f"{module['module']:<50} {module['ms']:>8.1f}")
+    print(f"\n{'import engine.agent':<50} {report['import_ms']:>8.1f}")
+    for phase in PHASES:
+        print(f"{phase:<50} {report[f'{phase}_ms']:>8.1f}")
+
+    if args.max_import_ms is not None and report["import_ms"] > args.max_import_ms:
+        print(f"[{_ts()}] FAIL: import time {report['import_ms']} ms > {args.max_import_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Calibrate the token estimate of engine/token_count.py on real conversations.
+
+Loads the latest checkpoint of the most recently active threads and, for every
+AIMessage that carries the model's usage_metadata (exact output tokens), compares
+those tokens with the message's characters. Fits, by least squares,
+  tokens ~ prose chars / TOKEN_CHARS_PER_TOKEN + JSON chars / TOKEN_CHARS_PER_TOKEN_JSON
+and reports:
+  - samples       AI messages with usage (and how many had JSON: tool call arguments)
+  - recommended   the fitted ratios, to set in TOKEN_CHARS_PER_TOKEN[_JSON]
+  - error         mean absolute error (%) and total drift (%) of the current and
+                  fitted ratios over the sample
+
+Tool results and user messages never carry usage, so their ratios can only be learned
+from the model's own JSON (tool call arguments); check the drift after changing them.
+
+Usage:
+  uv run python -m scripts.calibrate_token_counter [--dsn postgresql://...] \\
+      [--threads 500] [--json]
+"""
+import argparse
+import json
+from os import getenv
+
+import psycopg
+from psycopg.rows import dict_row
+
+from engine.checkpointer import IntVersionSyncPostgresSaver
+from engine.token_count import TokenCounter, message_chars, usage_tokens
+from scripts.blob_dedup_stats import SELECT_RECENT_THREADS_SQL, _build_dsn, _ts
+
+
+def collect_samples(args: argparse.Namespace) -> tuple[int, list[tuple[int, int, int]]]:
+    """(threads, [(prose chars, JSON chars, tokens)]) of AI messages with usage."""
+    samples = []
+    with psycopg.connect(
+        _build_dsn(args), autocommit=True, prepare_threshold=0, row_factory=dict_row
+    ) as conn:
+        thread_ids = [r["thread_id"] for r in conn.execute(SELECT_RECENT_THREADS_SQL, (args.threads,))]
+        print(f"[{_ts()}] Loading {len(thread_ids)} threads...", flush=True)
+        saver = IntVersionSyncPostgresSaver(
+            conn=conn,
+            message_store=getenv("CHECKPOINT_MESSAGE_STORE", "false").lower() == "true",
+        )
+        for thread_id in thread_ids:
+            loaded = saver.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}})
+            if loaded is None:
+                continue
+            for message in loaded.checkpoint["channel_values"].get("messages", []):
+                tokens = usage_tokens(message)
+                if tokens is not None:
+                    samples.append((*message_chars(message), tokens))
+    return len(thread_ids), samples
+
+
+def fit(samples: list[tuple[int, int, int]]) -> TokenCounter | None:
+    """Least-squares chars/token for prose and JSON (no intercept)."""
+    stt = sum(t * t for t, _, _ in samples)
+    sjj = sum(j * j for _, j, _ in samples)
+    stj = sum(t * j for t, j, _ in samples)
+    sty = sum(t * y for t, _, y in samples)
+    sjy = sum(j * y for _, j, y in samples)
+    det = stt * sjj - stj * stj
+    if det > 0:
+        text_rate = (sty * sjj - sjy * stj) / det
+        json_rate = (sjy * stt - sty * stj) / det
+        if text_rate > 0 and json_rate > 0:
+            return TokenCounter(chars_per_token=round(1 / text_rate, 2), json_chars_per_token=round(1 / json_rate, 2))
+    # Too few JSON samples to separate the two: fit prose only, keep the JSON ratio
+    if stt and sty > 0:
+        current = TokenCounter.from_env()
+        return TokenCounter(chars_per_token=round(stt / sty, 2), json_chars_per_token=current.json_chars_per_token)
+    return None
+
+
+def error(counter: TokenCounter, samples: list[tuple[int, int, int]]) -> dict:
+    """Mean absolute error and total drift of counter over samples, in %."""
+    estimates = [t / counter.chars_per_token + j / counter.json_chars_per_token for t, j, _ in samples]
+    tokens = [y for _, _, y in samples]
+    return {
+        "mean_abs_error_pct": round(100 * sum(abs(e - y) / y for e, y in zip(estimates, tokens)) / len(tokens), 1),
+        "drift_pct": round(100 * (sum(estimates) - sum(tokens)) / sum(tokens), 1),
+    }
+
+
+def calibrate(args: argparse.Namespace) -> dict:
+    threads, samples = collect_samples(args)
+    current = TokenCounter.from_env()
+    report = {
+        "threads": threads,
+        "samples": len(samples),
+        "samples_with_json": sum(1 for _, j, _ in samples if j),
+        "current": {"chars_per_token": current.chars_per_token, "json_chars_per_token": current.json_chars_per_token},
+        "recommended": None,
+    }
+    if not samples:
+        return report
+    report["current"].update(error(current, samples))
+    fitted = fit(samples)
+    if fitted is not None:
+        report["recommended"] = {
+            "chars_per_token": fitted.chars_per_token,
+            "json_chars_per_token": fitted.json_chars_per_token,
+            **error(fitted, samples),
+        }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Calibrate TOKEN_CHARS_PER_TOKEN[_JSON] on real threads.")
+    parser.add_argument("--dsn", help="Postgres DSN. If omitted, uses env vars.")
+    parser.add_argument("--threads", type=int, default=500, help="Most recent threads to sample (default: 500).")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    report = calibrate(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(
+        f"[{_ts()}] {report['samples']} AI messages with usage in {report['threads']} threads "
+        f"({report['samples_with_json']} with tool call arguments)"
+    )
+    for label in ("current", "recommended"):
+        r = report[label]
+        if r is None or "drift_pct" not in r:
+            continue
+        print(
+            f"[{_ts()}] {label:<11} TOKEN_CHARS_PER_TOKEN={r['chars_per_token']:g} "
+            f"TOKEN_CHARS_PER_TOKEN_JSON={r['json_chars_per_token']:g}: "
+            f"mean error {r['mean_abs_error_pct']}%, drift {r['drift_pct']:+}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
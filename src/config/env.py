@@ -53,6 +53,39 @@ SHORT_MEMORY_TIME_LIMIT = getenv_or_action(
 SHORT_MEMORY_TOKEN_LIMIT = getenv_or_action(
     "SHORT_MEMORY_TOKEN_LIMIT", default="50000"
 )  # in tokens
+# Deadline of the long-term memory fetch on the async path; the cached memory is
+# used past it
+LONG_TERM_MEMORY_TIMEOUT_SECONDS = getenv_or_action(
+    "LONG_TERM_MEMORY_TIMEOUT_SECONDS", default="3"
+)
+# Token estimate for messages without model usage (engine/token_count.py)
+TOKEN_CHARS_PER_TOKEN = getenv_or_action("TOKEN_CHARS_PER_TOKEN", default="4")
+TOKEN_CHARS_PER_TOKEN_JSON = getenv_or_action(
+    "TOKEN_CHARS_PER_TOKEN_JSON", default="3"
+)
+# Threads whose pre-model hook watermark is kept per replica (engine/history_scan.py)
+HISTORY_SCAN_MAX_THREADS = getenv_or_action(
+    "HISTORY_SCAN_MAX_THREADS", default="1024"
+)
+# Rolling summary of the messages left out of the window (engine/thread_summary.py)
+CONVERSATION_SUMMARY = getenv_or_action("CONVERSATION_SUMMARY", default="false")
+CONVERSATION_SUMMARY_MODEL = getenv_or_action(
+    "CONVERSATION_SUMMARY_MODEL", default="gemini-2.5-flash-lite"
+)
+CONVERSATION_SUMMARY_MIN_MESSAGES = getenv_or_action(
+    "CONVERSATION_SUMMARY_MIN_MESSAGES", default="8"
+)
+CONVERSATION_SUMMARY_MAX_TOKENS = getenv_or_action(
+    "CONVERSATION_SUMMARY_MAX_TOKENS", default="600"
+)
+CONVERSATION_SUMMARY_MAX_INPUT_TOKENS = getenv_or_action(
+    "CONVERSATION_SUMMARY_MAX_INPUT_TOKENS", default="8000"
+)
+# Model input budget by section (engine/context_budget.py; 0 disables a cap)
+CONTEXT_MAX_INPUT_TOKENS = getenv_or_action("CONTEXT_MAX_INPUT_TOKENS", default="0")
+CONTEXT_MEMORY_MAX_TOKENS = getenv_or_action("CONTEXT_MEMORY_MAX_TOKENS", default="0")
+CONTEXT_SUMMARY_MAX_TOKENS = getenv_or_action("CONTEXT_SUMMARY_MAX_TOKENS", default="0")
+CONTEXT_TOOL_RESULT_MAX_TOKENS = getenv_or_action("CONTEXT_TOOL_RESULT_MAX_TOKENS", default="0")
 
 # VPC Network attachment for accessing MCP server in private network
 NETWORK_ATTACHMENT = getenv_or_action("NETWORK_ATTACHMENT", default="")
@@ -65,3 +98,78 @@ ERROR_INTERCEPTOR_TOKEN = getenv_or_action("ERROR_INTERCEPTOR_TOKEN", default=""
 NS_MAX_BYTES = (getenv_or_action("_NS_MAX_BYTES", default="2500"))
 NS_HASH_PREFIX = getenv_or_action("_NS_HASH_PREFIX", default="hash:")
 NS_VERSION_MAX_BYTES = getenv_or_action("_NS_VERSION_MAX_BYTES", default="2000")
+
+# Checkpointer connection pools (engine/agent.py Agent._pool_options)
+CHECKPOINT_POOL_MIN_SIZE = getenv_or_action("CHECKPOINT_POOL_MIN_SIZE", default="1")
+CHECKPOINT_POOL_MAX_SIZE = getenv_or_action("CHECKPOINT_POOL_MAX_SIZE", default="10")
+CHECKPOINT_POOL_TIMEOUT = getenv_or_action(
+    "CHECKPOINT_POOL_TIMEOUT", default="30"
+)  # seconds a request waits for a connection
+CHECKPOINT_POOL_MAX_LIFETIME = getenv_or_action(
+    "CHECKPOINT_POOL_MAX_LIFETIME", default="3600"
+)  # seconds
+CHECKPOINT_POOL_MAX_IDLE = getenv_or_action(
+    "CHECKPOINT_POOL_MAX_IDLE", default="600"
+)  # seconds before idle connections above min_size are closed
+CHECKPOINT_POOL_CHECK = getenv_or_action("CHECKPOINT_POOL_CHECK", default="true")
+
+# Checkpointer message storage (see engine/message_store.py)
+CHECKPOINT_MESSAGE_STORE = getenv_or_action("CHECKPOINT_MESSAGE_STORE", default="false")
+CHECKPOINT_HISTORY_MAX_MESSAGES = getenv_or_action(
+    "CHECKPOINT_HISTORY_MAX_MESSAGES", default=""
+)
+CHECKPOINT_HISTORY_MAX_AGE = getenv_or_action(
+    "CHECKPOINT_HISTORY_MAX_AGE", default=""
+)  # in days
+CHECKPOINT_HISTORY_MAX_TOKENS = getenv_or_action(
+    "CHECKPOINT_HISTORY_MAX_TOKENS", default=""
+)  # in tokens
+
+# Checkpoint cache (see engine/checkpoint_cache.py)
+CHECKPOINT_CACHE_MAX_ENTRIES = getenv_or_action(
+    "CHECKPOINT_CACHE_MAX_ENTRIES", default="0"
+)  # 0 disables the cache
+CHECKPOINT_CACHE_MAX_MB = getenv_or_action("CHECKPOINT_CACHE_MAX_MB", default="64")
+CHECKPOINT_CACHE_TRUST_SECONDS = getenv_or_action(
+    "CHECKPOINT_CACHE_TRUST_SECONDS", default="5"
+)
+
+# Checkpoint payload compression (see engine/checkpoint_codec.py)
+CHECKPOINT_CODEC = getenv_or_action("CHECKPOINT_CODEC", default="none")  # none | zlib | zstd
+CHECKPOINT_CODEC_MIN_BYTES = getenv_or_action("CHECKPOINT_CODEC_MIN_BYTES", default="1024")
+CHECKPOINT_CODEC_LEVEL = getenv_or_action("CHECKPOINT_CODEC_LEVEL", default="")
+CHECKPOINT_CODEC_ZSTD_DICT = getenv_or_action(
+    "CHECKPOINT_CODEC_ZSTD_DICT", default=""
+)  # path to a trained zstd dictionary, shipped with the engine package
+
+# Rewrite legacy (pre-migration) checkpoints in the background after their first load
+CHECKPOINT_LEGACY_WRITE_BACK = getenv_or_action(
+    "CHECKPOINT_LEGACY_WRITE_BACK", default="true"
+)
+
+# Content-addressed checkpoint blobs (engine/content_blobs.py)
+CHECKPOINT_BLOB_DEDUP = getenv_or_action("CHECKPOINT_BLOB_DEDUP", default="false")
+CHECKPOINT_BLOB_DEDUP_MIN_BYTES = getenv_or_action(
+    "CHECKPOINT_BLOB_DEDUP_MIN_BYTES", default="1024"
+)
+
+# Warm-up at set_up() instead of on the first request (engine/agent.py Agent._warm_up)
+AGENT_WARMUP = getenv_or_action("AGENT_WARMUP", default="false")
+AGENT_WARMUP_TIMEOUT_SECONDS = getenv_or_action(
+    "AGENT_WARMUP_TIMEOUT_SECONDS", default="30"
+)  # per step; a step that fails or times out is left to the lazy setup
+
+# Async setup retries (engine/agent.py Agent._ensure_async_setup)
+AGENT_SETUP_RETRIES = getenv_or_action("AGENT_SETUP_RETRIES", default="3")
+AGENT_SETUP_BACKOFF_SECONDS = getenv_or_action(
+    "AGENT_SETUP_BACKOFF_SECONDS", default="0.5"
+)  # doubled per attempt, capped at 30s, with jitter
+
+# MCP tool-schema snapshot (engine/mcp_tools.py): build tools without tools/list
+MCP_TOOL_SNAPSHOT = getenv_or_action("MCP_TOOL_SNAPSHOT", default="true")
+MCP_TOOL_SNAPSHOT_PATH = getenv_or_action(
+    "MCP_TOOL_SNAPSHOT_PATH", default="/tmp/eai_mcp_tool_snapshot.json"
+)  # runtime cache, refreshed after every live tools/list
+MCP_TOOL_REFRESH_SECONDS = getenv_or_action(
+    "MCP_TOOL_REFRESH_SECONDS", default="300"
+)  # background tools/list; the graph is rebuilt only if the catalogue changed
@@ -1,9 +1,11 @@
+import asyncio
 from datetime import datetime
 
 import vertexai
 from vertexai import agent_engines
 
 from engine.agent import Agent
+from engine.mcp_tools import fetch_tool_snapshot
 from src.config import env
 from src.prompt import prompt_data
 
@@ -20,8 +22,21 @@ def deploy():
     model = "gemini-2.5-flash"
     now = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
 
-    # Tools will be loaded at runtime from MCP server (not at deployment time)
-    # This allows deployment from local machine where MCP private network is not accessible
+    # Tools are built at runtime; the schemas come from a snapshot taken here through
+    # the public URL, so the replica doesn't wait for tools/list on the private one.
+    # Without it (e.g. no access from this machine) they are listed at runtime.
+    tool_snapshot = None
+    if env.MCP_TOOL_SNAPSHOT.lower() == "true":
+        try:
+            tool_snapshot = asyncio.run(
+                fetch_tool_snapshot(url=env.MCP_SERVER_PUBLIC_URL, token=env.MCP_API_TOKEN)
+            )
+            print(
+                f"MCP tool snapshot {tool_snapshot['version']}: {len(tool_snapshot['tools'])} tools"
+            )
+        except Exception as e:
+            print(f"MCP tool snapshot unavailable, tools will be listed at runtime: {e!r}")
+
     local_agent = Agent(
         model=model,
         system_prompt=system_prompt,
@@ -30,6 +45,7 @@ def deploy():
         temperature=0.7,
         tools=[],  # Empty - tools loaded lazily at runtime
         otpl_service=f"eai-langgraph-v{system_prompt_version}",
+        tool_snapshot=tool_snapshot,
     )
     service_account = f"{env.PROJECT_NUMBER}-compute@developer.gserviceaccount.com"
 
@@ -88,6 +104,7 @@ def deploy():
             "pydantic==2.12.5",
             "python-dotenv>=1.0.0",
             "typing-extensions>=4.14.0",
+            "zstandard==0.25.0",
         ],
         extra_packages=["./engine"],
         gcs_dir_name=f"{model}/v{system_prompt_version}/{now}",
@@ -111,6 +128,46 @@ def deploy():
             "EAI_GATEWAY_API_TOKEN": env.EAI_GATEWAY_API_TOKEN,
             "SHORT_MEMORY_TOKEN_LIMIT": env.SHORT_MEMORY_TOKEN_LIMIT,
             "SHORT_MEMORY_TIME_LIMIT": env.SHORT_MEMORY_TIME_LIMIT,
+            "LONG_TERM_MEMORY_TIMEOUT_SECONDS": env.LONG_TERM_MEMORY_TIMEOUT_SECONDS,
+            "TOKEN_CHARS_PER_TOKEN": env.TOKEN_CHARS_PER_TOKEN,
+            "TOKEN_CHARS_PER_TOKEN_JSON": env.TOKEN_CHARS_PER_TOKEN_JSON,
+            "HISTORY_SCAN_MAX_THREADS": env.HISTORY_SCAN_MAX_THREADS,
+            "CONVERSATION_SUMMARY": env.CONVERSATION_SUMMARY,
+            "CONVERSATION_SUMMARY_MODEL": env.CONVERSATION_SUMMARY_MODEL,
+            "CONVERSATION_SUMMARY_MIN_MESSAGES": env.CONVERSATION_SUMMARY_MIN_MESSAGES,
+            "CONVERSATION_SUMMARY_MAX_TOKENS": env.CONVERSATION_SUMMARY_MAX_TOKENS,
+            "CONVERSATION_SUMMARY_MAX_INPUT_TOKENS": env.CONVERSATION_SUMMARY_MAX_INPUT_TOKENS,
+            "CONTEXT_MAX_INPUT_TOKENS": env.CONTEXT_MAX_INPUT_TOKENS,
+            "CONTEXT_MEMORY_MAX_TOKENS": env.CONTEXT_MEMORY_MAX_TOKENS,
+            "CONTEXT_SUMMARY_MAX_TOKENS": env.CONTEXT_SUMMARY_MAX_TOKENS,
+            "CONTEXT_TOOL_RESULT_MAX_TOKENS": env.CONTEXT_TOOL_RESULT_MAX_TOKENS,
+            "CHECKPOINT_POOL_MIN_SIZE": env.CHECKPOINT_POOL_MIN_SIZE,
+            "CHECKPOINT_POOL_MAX_SIZE": env.CHECKPOINT_POOL_MAX_SIZE,
+            "CHECKPOINT_POOL_TIMEOUT": env.CHECKPOINT_POOL_TIMEOUT,
+            "CHECKPOINT_POOL_MAX_LIFETIME": env.CHECKPOINT_POOL_MAX_LIFETIME,
+            "CHECKPOINT_POOL_MAX_IDLE": env.CHECKPOINT_POOL_MAX_IDLE,
+            "CHECKPOINT_POOL_CHECK": env.CHECKPOINT_POOL_CHECK,
+            "CHECKPOINT_MESSAGE_STORE": env.CHECKPOINT_MESSAGE_STORE,
+            "CHECKPOINT_HISTORY_MAX_MESSAGES": env.CHECKPOINT_HISTORY_MAX_MESSAGES,
+            "CHECKPOINT_HISTORY_MAX_AGE": env.CHECKPOINT_HISTORY_MAX_AGE,
+            "CHECKPOINT_HISTORY_MAX_TOKENS": env.CHECKPOINT_HISTORY_MAX_TOKENS,
+            "CHECKPOINT_CACHE_MAX_ENTRIES": env.CHECKPOINT_CACHE_MAX_ENTRIES,
+            "CHECKPOINT_CACHE_MAX_MB": env.CHECKPOINT_CACHE_MAX_MB,
+            "CHECKPOINT_CACHE_TRUST_SECONDS": env.CHECKPOINT_CACHE_TRUST_SECONDS,
+            "CHECKPOINT_CODEC": env.CHECKPOINT_CODEC,
+            "CHECKPOINT_CODEC_MIN_BYTES": env.CHECKPOINT_CODEC_MIN_BYTES,
+            "CHECKPOINT_CODEC_LEVEL": env.CHECKPOINT_CODEC_LEVEL,
+            "CHECKPOINT_CODEC_ZSTD_DICT": env.CHECKPOINT_CODEC_ZSTD_DICT,
+            "CHECKPOINT_LEGACY_WRITE_BACK": env.CHECKPOINT_LEGACY_WRITE_BACK,
+            "CHECKPOINT_BLOB_DEDUP": env.CHECKPOINT_BLOB_DEDUP,
+            "CHECKPOINT_BLOB_DEDUP_MIN_BYTES": env.CHECKPOINT_BLOB_DEDUP_MIN_BYTES,
+            "AGENT_WARMUP": env.AGENT_WARMUP,
+            "AGENT_WARMUP_TIMEOUT_SECONDS": env.AGENT_WARMUP_TIMEOUT_SECONDS,
+            "AGENT_SETUP_RETRIES": env.AGENT_SETUP_RETRIES,
+            "AGENT_SETUP_BACKOFF_SECONDS": env.AGENT_SETUP_BACKOFF_SECONDS,
+            "MCP_TOOL_SNAPSHOT": env.MCP_TOOL_SNAPSHOT,
+            "MCP_TOOL_SNAPSHOT_PATH": env.MCP_TOOL_SNAPSHOT_PATH,
+            "MCP_TOOL_REFRESH_SECONDS": env.MCP_TOOL_REFRESH_SECONDS,
             "MCP_EXCLUDED_TOOLS": ",".join(env.MCP_EXCLUDED_TOOLS)
             if env.MCP_EXCLUDED_TOOLS
             else "",
@@ -1,11 +1,14 @@
 import asyncio
+import uuid
 import pytest
 import psycopg
 from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
 
 from src.config import env
 from src.tools import mcp_tools
 from engine.agent import Agent
+from engine.checkpointer import IntVersionPostgresSaver
 from src.prompt import prompt_data
 
 # ---------------------------------------------------------------------------
@@ -42,6 +45,54 @@ def dsn():
     )
 
 
+# ---------------------------------------------------------------------------
+# Checkpoint tables: schema applied once, rows removed per thread
+# ---------------------------------------------------------------------------
+
+@pytest.fixture(scope="session")
+async def checkpoint_schema(dsn):
+    """Apply the checkpointer migrations once (they need autocommit: CREATE INDEX CONCURRENTLY)."""
+    async with await psycopg.AsyncConnection.connect(
+        dsn, autocommit=True, prepare_threshold=0, row_factory=dict_row
+    ) as conn:
+        await IntVersionPostgresSaver(conn=conn).setup()
+    return dsn
+
+
+@pytest.fixture
+async def checkpoint_conn(checkpoint_schema):
+    """Autocommit connection with dict rows, as used by the maintenance jobs."""
+    async with await psycopg.AsyncConnection.connect(
+        checkpoint_schema, autocommit=True, prepare_threshold=0, row_factory=dict_row
+    ) as conn:
+        yield conn
+
+
+@pytest.fixture
+async def checkpoint_pool(checkpoint_schema):
+    """Small pool for the savers under test."""
+    async with AsyncConnectionPool(
+        conninfo=checkpoint_schema, min_size=1, max_size=2, open=False
+    ) as pool:
+        await pool.open()
+        yield pool
+
+
+@pytest.fixture
+async def new_thread_id(checkpoint_pool):
+    """Return fresh thread ids; their rows are deleted from every checkpoint table afterwards."""
+    created: list[str] = []
+
+    def _new(prefix: str = "pytest") -> str:
+        created.append(f"{prefix}-{uuid.uuid4()}")
+        return created[-1]
+
+    yield _new
+    saver = IntVersionPostgresSaver(conn=checkpoint_pool)
+    for thread_id in created:
+        await saver.adelete_thread(thread_id)
+
+
 @pytest.fixture(scope="session")
 async def agent():
     """Single agent instance shared across all pre-deploy tests.
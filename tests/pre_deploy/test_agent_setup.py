@@ -0,0 +1,131 @@
+"""
+Agent setup tests.
+
+Verifies Agent._ensure_async_setup without external services (the setup attempt
+itself is replaced):
+  1. Concurrent callers on a cold agent share a single setup
+  2. A failing setup is retried with backoff, and every caller sees the final error
+  3. Each event loop gets its own resources: callers on two loops set up in
+     parallel, and resources of closed loops are dropped
+  4. Agent still satisfies the Agent Engine protocols without inheriting them, and
+     importing engine.agent does not load the LLM, telemetry or Postgres stacks
+
+Run:
+  uv run pytest tests/pre_deploy/test_agent_setup.py -v
+"""
+
+import asyncio
+
+from engine.agent import Agent
+
+
+def _cold_agent(monkeypatch, set_up_async) -> Agent:
+    monkeypatch.setenv("AGENT_SETUP_BACKOFF_SECONDS", "0.01")
+    agent = Agent(otpl_service="pytest")
+    monkeypatch.setattr(agent, "_set_up_opentelemetry", lambda: None)
+    monkeypatch.setattr(agent, "_set_up_async", set_up_async)
+    return agent
+
+
+async def test_concurrent_callers_share_one_setup(monkeypatch):
+    calls = []
+
+    async def set_up_async():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+
+    agent = _cold_agent(monkeypatch, set_up_async)
+    await asyncio.gather(*(agent._ensure_async_setup() for _ in range(10)))
+    await agent._ensure_async_setup()
+
+    assert len(calls) == 1
+    wait = agent.startup_report()["setup_wait_ms"]
+    assert wait["leader"]["count"] == 1
+    assert wait["follower"]["count"] == 9
+
+
+async def test_failed_setup_is_retried_then_raised(monkeypatch):
+    monkeypatch.setenv("AGENT_SETUP_RETRIES", "2")
+    calls = []
+
+    async def set_up_async():
+        calls.append(1)
+        raise ConnectionError("database down")
+
+    agent = _cold_agent(monkeypatch, set_up_async)
+    results = await asyncio.gather(
+        *(agent._ensure_async_setup() for _ in range(3)), return_exceptions=True
+    )
+    assert len(calls) == 3  # first attempt + 2 retries, shared by all callers
+    assert all(isinstance(r, ConnectionError) for r in results)
+
+    # The next call starts a new attempt
+    await asyncio.gather(agent._ensure_async_setup(), return_exceptions=True)
+    assert len(calls) == 6
+
+
+def test_each_event_loop_gets_its_own_setup(monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    both_started = threading.Barrier(2, timeout=5)
+    loops = []
+
+    async def set_up_async():
+        loops.append(asyncio.get_running_loop())
+        if len(loops) <= 2:
+            both_started.wait()  # fails unless the other loop is setting up at the same time
+        agent._loop_resources().graph = object()
+
+    agent = _cold_agent(monkeypatch, set_up_async)
+
+    async def graph_of_this_loop():
+        first = (await agent._ensure_async_setup()).graph
+        assert (await agent._ensure_async_setup()).graph is first
+        return first
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        graphs = list(executor.map(lambda _: asyncio.run(graph_of_this_loop()), range(2)))
+
+    assert loops[0] is not loops[1]
+    assert graphs[0] is not graphs[1]
+    assert len(agent._loops) == 2
+
+    # Both loops are closed now: a new loop replaces their resources
+    asyncio.run(graph_of_this_loop())
+    assert len(loops) == 3 and len(agent._loops) == 1
+
+
+def test_agent_implements_agent_engine_protocols():
+    from vertexai.agent_engines import (
+        AsyncQueryable,
+        AsyncStreamQueryable,
+        Queryable,
+        StreamQueryable,
+    )
+
+    agent = Agent(otpl_service="pytest")
+    for protocol in (Queryable, StreamQueryable, AsyncQueryable, AsyncStreamQueryable):
+        assert isinstance(agent, protocol), protocol.__name__
+
+
+def test_import_does_not_load_heavy_dependencies():
+    import subprocess
+    import sys
+
+    heavy = [
+        "langchain_google_vertexai",
+        "vertexai",
+        "opentelemetry.exporter.otlp.proto.http.trace_exporter",
+        "opentelemetry.instrumentation.langchain",
+        "langgraph.checkpoint.postgres",
+        "psycopg_pool",
+    ]
+    code = (
+        "import sys, engine.agent; "
+        f"print([m for m in {heavy!r} if m in sys.modules])"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
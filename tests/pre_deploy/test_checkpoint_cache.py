@@ -0,0 +1,117 @@
+"""
+Checkpoint cache tests.
+
+Tests for engine/checkpoint_cache.py:
+  1. LRU eviction by entry count and counters
+  2. Pending writes saved before their checkpoint are merged on aput
+  3. An older checkpoint never replaces a newer cached one
+  4. After graph turns whose hooks edit the state, a cached read returns the same
+     messages as a cold read by a new saver (database needed)
+
+Run:
+  uv run pytest tests/pre_deploy/test_checkpoint_cache.py -v
+"""
+
+import uuid
+
+import pytest
+from langgraph.checkpoint.base import CheckpointTuple
+
+from engine.checkpoint_cache import CheckpointCache
+
+
+def _tuple(thread_id: str, checkpoint_id: str, messages=None) -> CheckpointTuple:
+    return CheckpointTuple(
+        config={
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": "",
+                "checkpoint_id": checkpoint_id,
+            }
+        },
+        checkpoint={"id": checkpoint_id, "channel_values": {"messages": messages or []}},
+        metadata={},
+        parent_config=None,
+        pending_writes=[],
+    )
+
+
+def test_lru_eviction_and_counters():
+    cache = CheckpointCache(max_entries=2)
+    cache.put(("a", ""), _tuple("a", "1"))
+    cache.put(("b", ""), _tuple("b", "1"))
+    assert cache.get(("a", "")) is not None  # "b" becomes least recently used
+    cache.put(("c", ""), _tuple("c", "1"))
+
+    assert cache.get(("b", "")) is None
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_returned_tuples_are_copies():
+    cache = CheckpointCache()
+    cache.put(("a", ""), _tuple("a", "1", messages=["hi"]))
+
+    cache.get(("a", "")).checkpoint["channel_values"]["messages"].append("mutated")
+
+    assert cache.get(("a", "")).checkpoint["channel_values"]["messages"] == ["hi"]
+
+
+def test_early_writes_are_merged_on_put():
+    cache = CheckpointCache()
+    cache.put(("a", ""), _tuple("a", "1"), written=True)
+
+    # Writes for checkpoint "2" arrive before its aput
+    cache.add_writes(("a", ""), "2", "task", "~", [("__interrupt__", "q?")])
+    cache.put(("a", ""), _tuple("a", "2"), written=True)
+    cache.add_writes(("a", ""), "2", "task", "~", [("__resume__", "yes")])
+
+    pending = cache.get(("a", "")).pending_writes
+    assert sorted(channel for _, channel, _ in pending) == ["__interrupt__", "__resume__"]
+
+
+def test_older_checkpoint_does_not_replace_newer():
+    cache = CheckpointCache()
+    cache.put(("a", ""), _tuple("a", "2"), written=True)
+    cache.put(("a", ""), _tuple("a", "1"))
+
+    assert cache.get(("a", "")).config["configurable"]["checkpoint_id"] == "2"
+
+
+@pytest.mark.parametrize("message_store", [False, True])
+async def test_cached_read_matches_cold_read(checkpoint_pool, new_thread_id, message_store):
+    from langchain_core.messages import HumanMessage
+    from langchain_core.tools import tool
+
+    from engine.checkpointer import IntVersionPostgresSaver
+    from tests.pre_deploy.test_long_term_memory import _agent
+
+    @tool
+    async def get_user_memory(user_id: str) -> dict:
+        """Stub memory service."""
+        return {"nome": "Maria", "pedido": str(uuid.uuid4())}
+
+    thread_id = new_thread_id("pytest-checkpoint-cache")
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    saver = IntVersionPostgresSaver(
+        conn=checkpoint_pool, message_store=message_store, cache=CheckpointCache()
+    )
+
+    # The pre-model hook timestamps, injects and replaces memory in place
+    agent, graph = _agent(get_user_memory, checkpointer=saver)
+    for i in range(3):
+        agent._memory_needs_refresh = True
+        await graph.ainvoke({"messages": [HumanMessage(content=f"oi {i}")]}, config)
+
+    hits = saver.cache.hits
+    cached = await saver.aget_tuple(config)
+    assert saver.cache.hits == hits + 1
+    cold = await IntVersionPostgresSaver(
+        conn=checkpoint_pool, message_store=message_store
+    ).aget_tuple(config)
+
+    assert cached.config == cold.config
+    assert [(m.id, m.content) for m in cached.checkpoint["channel_values"]["messages"]] == [
+        (m.id, m.content) for m in cold.checkpoint["channel_values"]["messages"]
+    ]
@@ -0,0 +1,48 @@
+"""
+Checkpoint codec tests.
+
+Unit tests for engine/checkpoint_codec.py (no database needed):
+  1. Payloads above the threshold are compressed and tagged, and round-trip
+  2. Untagged payloads written before the codec was enabled are still readable
+  3. Tagged payloads are still readable with compression disabled
+
+Run:
+  uv run pytest tests/pre_deploy/test_checkpoint_codec.py -v
+"""
+
+import pytest
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from engine.checkpoint_codec import CompressingSerializer, ZlibCodec, ZstdCodec
+
+LONG = [AIMessage(content="resposta " * 500, id="m1")]
+
+
+@pytest.mark.parametrize("codec_cls", [ZlibCodec, ZstdCodec])
+def test_large_payload_is_compressed_and_round_trips(codec_cls):
+    serde = CompressingSerializer(codec=codec_cls(), min_bytes=1024)
+
+    typ, data = serde.dumps_typed(LONG)
+    _, raw = JsonPlusSerializer().dumps_typed(LONG)
+
+    assert typ.endswith(f"+{codec_cls.name}")
+    assert len(data) < len(raw)
+    assert serde.loads_typed((typ, data))[0].content == LONG[0].content
+
+
+def test_small_payload_is_not_compressed():
+    serde = CompressingSerializer(codec=ZlibCodec(), min_bytes=1024)
+
+    typ, _ = serde.dumps_typed({"a": 1})
+
+    assert "+" not in typ
+
+
+def test_mixed_rows_are_readable():
+    plain = JsonPlusSerializer().dumps_typed(LONG)
+    compressed = CompressingSerializer(codec=ZlibCodec()).dumps_typed(LONG)
+    reader = CompressingSerializer(codec=None)
+
+    assert reader.loads_typed(plain)[0].content == LONG[0].content
+    assert reader.loads_typed(compressed)[0].content == LONG[0].content
@@ -0,0 +1,79 @@
+"""
+Checkpoint compaction tests.
+
+Verifies engine/checkpoint_compaction.py against a real database:
+  1. A dry run reports what would be deleted without deleting it
+  2. Only the latest N checkpoints survive, with the blobs they reference
+  3. Writes of deleted checkpoints are removed and the thread still resumes
+
+Run:
+  uv run pytest tests/pre_deploy/test_checkpoint_compaction.py -v
+"""
+
+import uuid
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.base.id import uuid6
+
+
+def _checkpoint(messages: list, version: int) -> dict:
+    return {
+        "v": 1,
+        "id": str(uuid6()),
+        "ts": "2024-01-01T00:00:00+00:00",
+        "pending_sends": [],
+        "versions_seen": {},
+        "channel_versions": {"messages": version, "instructions": 1},
+        "channel_values": {"messages": messages, "instructions": ["seja cordial"]},
+    }
+
+
+async def test_compaction_keeps_latest_checkpoints_and_their_blobs(checkpoint_conn, new_thread_id):
+    from engine.checkpointer import IntVersionPostgresSaver
+    from engine.checkpoint_compaction import acompact_thread
+
+    conn = checkpoint_conn
+    thread_id = new_thread_id("pytest-compaction")
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    saver = IntVersionPostgresSaver(conn=conn)
+
+    async def count(table: str) -> int:
+        cur = await conn.execute(
+            f"SELECT count(*) AS n FROM {table} WHERE thread_id = %s",  # noqa: S608
+            (thread_id,),
+        )
+        return (await cur.fetchone())["n"]
+
+    messages = []
+    new_versions = {"messages": 1, "instructions": 1}
+    for version in range(1, 7):
+        messages = messages + [HumanMessage(content=f"mensagem {version}", id=str(uuid.uuid4()))]
+        next_config = await saver.aput(
+            config, _checkpoint(messages, version), {}, new_versions
+        )
+        await saver.aput_writes(next_config, [("messages", messages[-1])], "task-1")
+        new_versions = {"messages": version + 1}
+
+    dry = await acompact_thread(conn, thread_id, keep_latest=2, min_age_seconds=0)
+    assert (dry.checkpoints, dry.blobs, dry.writes) == (4, 4, 4)
+    assert dry.bytes > 0
+    assert await count("checkpoints") == 6
+
+    stats = await acompact_thread(
+        conn, thread_id, keep_latest=2, min_age_seconds=0, batch_size=3, apply=True
+    )
+    assert (stats.checkpoints, stats.blobs, stats.writes) == (4, 4, 4)
+    assert await count("checkpoints") == 2
+    # messages v5 and v6, plus the unchanged instructions v1
+    assert await count("checkpoint_blobs") == 3
+    assert await count("checkpoint_writes") == 2
+
+    result = await saver.aget_tuple(config)
+    assert [m.id for m in result.checkpoint["channel_values"]["messages"]] == [m.id for m in messages]
+    assert result.checkpoint["channel_values"]["instructions"] == ["seja cordial"]
+
+    # Nothing left to do
+    assert (await acompact_thread(conn, thread_id, keep_latest=2, apply=True)).checkpoints == 0
+    # Checkpoints newer than the minimum age are never removed
+    fresh = await acompact_thread(conn, thread_id, keep_latest=1, min_age_seconds=10**10)
+    assert fresh.checkpoints == 0
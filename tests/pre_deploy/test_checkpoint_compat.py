@@ -21,11 +21,6 @@ import pytest
 from psycopg.rows import dict_row
 from langchain_core.messages import AIMessage
 
-# All tests in this module share the session event loop so that the session-
-# scoped `agent` fixture (which holds a psycopg pool and gRPC channel) is always
-# accessed from the same loop it was created in.
-pytestmark = pytest.mark.asyncio(loop_scope="session")
-
 
 # ---------------------------------------------------------------------------
 # SQL (mirrored from queries.sql)
@@ -198,7 +193,7 @@ def test_engine_has_no_src_imports():
 
 def test_safe_ns_short_is_unchanged():
     """Short namespaces must pass through unchanged."""
-    from engine.agent import IntVersionPostgresSaver
+    from engine.checkpointer import IntVersionPostgresSaver
     ns = "some_node:abc123|other_node:def456"
     assert IntVersionPostgresSaver._safe_ns(ns) == ns
 
@@ -206,7 +201,7 @@ def test_safe_ns_short_is_unchanged():
 def test_safe_ns_long_becomes_stable_hash():
     """Namespaces > 2500 bytes must be replaced with a stable 37-byte hash."""
     import hashlib
-    from engine.agent import IntVersionPostgresSaver
+    from engine.checkpointer import IntVersionPostgresSaver
 
     deep_ns = ("some_node:" + "x" * 30 + "|") * 70   # ~2800 bytes
     result = IntVersionPostgresSaver._safe_ns(deep_ns)
@@ -222,7 +217,7 @@ def test_safe_ns_long_becomes_stable_hash():
 
 def test_get_next_version_does_not_grow():
     """get_next_version must not increase the digit count on repeated calls."""
-    from engine.agent import IntVersionPostgresSaver
+    from engine.checkpointer import IntVersionPostgresSaver
 
     saver = IntVersionPostgresSaver.__new__(IntVersionPostgresSaver)
 
@@ -243,7 +238,7 @@ def test_get_next_version_does_not_grow():
 def test_safe_version_with_huge_int():
     """_safe_version must hash values that exceed NS_VERSION_MAX_BYTES bytes."""
     import hashlib
-    from engine.agent import IntVersionPostgresSaver
+    from engine.checkpointer import IntVersionPostgresSaver
 
     huge = "9" * 2001  # 2001 bytes > default 2000-byte limit
     result = IntVersionPostgresSaver._safe_version(huge)
@@ -264,7 +259,7 @@ async def test_checkpoint_blob_deep_ns_does_not_overflow(dsn):
     """
     import hashlib
     from psycopg_pool import AsyncConnectionPool
-    from engine.agent import IntVersionPostgresSaver
+    from engine.checkpointer import IntVersionPostgresSaver
 
     # Realistic deeply-nested namespace produced by multi-step subgraph recursion
     deep_ns = ("some_node:" + "x" * 30 + "|") * 70   # ~2800 bytes
@@ -308,3 +303,136 @@ async def test_checkpoint_blob_deep_ns_does_not_overflow(dsn):
                         f"DELETE FROM {table} WHERE thread_id = %s",  # noqa: S608
                         (thread_id,),
                     )
+
+
+async def test_legacy_checkpoint_is_written_back(checkpoint_pool, new_thread_id):
+    """A legacy checkpoint (string versions, lc:1 messages) is upgraded in place on first load."""
+    import asyncio
+    from langchain_core.load.dump import dumpd
+    from langchain_core.messages import HumanMessage
+    from langgraph.checkpoint.base.id import uuid6
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+    from engine.checkpointer import IntVersionPostgresSaver
+
+    thread_id = new_thread_id("pytest-legacy-write-back")
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+    stock = AsyncPostgresSaver(conn=checkpoint_pool)
+    version = stock.get_next_version(None, None)  # legacy string version
+    await stock.aput(
+        config,
+        {
+            "v": 1,
+            "id": str(uuid6()),
+            "ts": "2024-01-01T00:00:00+00:00",
+            "versions_seen": {"agent": {"messages": version}},
+            "channel_versions": {"messages": version},
+            "channel_values": {
+                "messages": [dumpd(HumanMessage(content="oi", id="m1"))]
+            },
+        },
+        {"source": "loop", "step": 1},
+        {"messages": version},
+    )
+    saver = IntVersionPostgresSaver(conn=checkpoint_pool, legacy_write_back=True)
+
+    await saver.aget_tuple(config)
+    await asyncio.gather(*saver._write_backs.values())
+    assert saver.legacy_stats["upgraded"] == 1
+
+    # Second load takes the fast path: nothing left to fix
+    result = await saver.aget_tuple(config)
+    assert saver.legacy_stats["legacy_loads"] == 1
+    assert isinstance(result.checkpoint["channel_versions"]["messages"], int)
+    assert result.checkpoint["channel_values"]["messages"][0].content == "oi"
+
+
+def test_sync_saver_on_pool_has_async_parity(dsn):
+    """The sync saver hashes long namespaces, fixes legacy rows and reads the message store."""
+    from concurrent.futures import ThreadPoolExecutor
+    from langchain_core.load.dump import dumpd
+    from langchain_core.messages import HumanMessage
+    from langgraph.checkpoint.base.id import uuid6
+    from langgraph.checkpoint.postgres import PostgresSaver
+    from psycopg_pool import ConnectionPool
+    from engine.checkpointer import IntVersionSyncPostgresSaver
+
+    thread_id = f"pytest-sync-saver-{uuid.uuid4()}"
+    legacy = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    deep = {"configurable": {"thread_id": thread_id, "checkpoint_ns": "sub:" + "x" * 3000}}
+
+    def checkpoint(messages, version):
+        return {
+            "v": 1,
+            "id": str(uuid6()),
+            "ts": "2024-01-01T00:00:00+00:00",
+            "versions_seen": {"agent": {"messages": version}},
+            "channel_versions": {"messages": version},
+            "channel_values": {"messages": messages},
+        }
+
+    with ConnectionPool(
+        dsn,
+        min_size=1,
+        max_size=4,
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+    ) as pool:
+        saver = IntVersionSyncPostgresSaver(conn=pool, message_store=True)
+        saver.setup()
+        try:
+            stock = PostgresSaver(conn=pool)
+            version = stock.get_next_version(None, None)  # legacy string version
+            stock.put(
+                legacy,
+                checkpoint([dumpd(HumanMessage(content="oi", id="m1"))], version),
+                {},
+                {"messages": version},
+            )
+            result = saver.get_tuple(legacy)
+            assert isinstance(result.checkpoint["channel_versions"]["messages"], int)
+            assert result.checkpoint["channel_values"]["messages"][0].content == "oi"
+
+            messages = [HumanMessage(content=f"msg {i}", id=f"m{i}") for i in range(3)]
+            version = saver.get_next_version(None, None)
+            saver.put(deep, checkpoint(messages, version), {}, {"messages": version})
+
+            # Concurrent readers each get their own pooled connection
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(saver.get_tuple, [deep] * 4))
+            for result in results:
+                assert result.config["configurable"]["checkpoint_ns"].startswith("hash:")
+                assert [m.content for m in result.checkpoint["channel_values"]["messages"]] == [
+                    "msg 0",
+                    "msg 1",
+                    "msg 2",
+                ]
+
+        finally:
+            saver.delete_thread(thread_id)
+
+
+async def test_async_saver_on_pool_does_not_serialize_operations(checkpoint_pool, new_thread_id):
+    """With a pool, an open cursor does not block other operations of the same saver."""
+    import asyncio
+    from langgraph.checkpoint.base.id import uuid6
+    from engine.checkpointer import IntVersionPostgresSaver
+
+    thread_id = new_thread_id("pytest-async-pool")
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    saver = IntVersionPostgresSaver(conn=checkpoint_pool)
+    checkpoint = {
+        "v": 1,
+        "id": str(uuid6()),
+        "ts": "2024-01-01T00:00:00+00:00",
+        "versions_seen": {},
+        "channel_versions": {"messages": 1},
+        "channel_values": {"messages": [AIMessage(content="oi", id="m1")]},
+    }
+    await saver.aput(config, checkpoint, {}, {"messages": 1})
+
+    async with saver._cursor() as cur:
+        await cur.execute("SELECT 1")
+        # Would wait forever on the saver-wide lock of the stock cursor
+        result = await asyncio.wait_for(saver.aget_tuple(config), timeout=10)
+    assert result.checkpoint["channel_values"]["messages"][0].content == "oi"
+    assert checkpoint_pool.get_stats()["pool_size"] >= 2
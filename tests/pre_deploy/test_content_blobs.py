@@ -0,0 +1,155 @@
+"""
+Content-addressed blob tests.
+
+Verifies engine/content_blobs.py with IntVersionPostgresSaver:
+  1. Known payloads are not re-sent, small ones stay inline
+  2. Identical blobs of two threads are stored once and counted twice
+  3. Deleting a thread or compacting history releases references, and unreferenced
+     content is only collected after the grace period
+  4. Writing unreferenced content again revives it, and a reference to missing
+     content fails the write instead of being committed
+
+Run:
+  uv run pytest tests/pre_deploy/test_content_blobs.py -v
+"""
+
+import pytest
+from langgraph.checkpoint.base.id import uuid6
+
+from engine.content_blobs import ContentBlobStore
+
+INSTRUCTIONS = ["Voce e o assistente virtual da Prefeitura do Rio. " * 100]
+
+
+def _checkpoint(version: int, instructions: list = INSTRUCTIONS) -> dict:
+    return {
+        "v": 1,
+        "id": str(uuid6()),
+        "ts": "2024-01-01T00:00:00+00:00",
+        "pending_sends": [],
+        "versions_seen": {},
+        "channel_versions": {"instructions": version},
+        "channel_values": {"instructions": instructions},
+    }
+
+
+def test_split_skips_known_payloads():
+    store = ContentBlobStore(min_bytes=100)
+    rows = [
+        ("t", "", "small", "1", "msgpack", b"x" * 10),
+        ("t", "", "large", "1", "msgpack", b"y" * 500),
+    ]
+
+    plain, contents, refs = store.split(rows)
+    assert [r[2] for r in plain] == ["small"]
+    assert len(contents) == len(refs) == 1
+
+    store.remember(contents)
+    _, contents, refs = store.split([("u", "", "large", "7", "msgpack", b"y" * 500)])
+    assert contents == []
+    assert refs[0][:4] == ("u", "", "large", "7")
+    assert store.stats["skipped"] == 1
+
+
+async def test_identical_blobs_are_stored_once(checkpoint_conn, new_thread_id):
+    from engine.checkpointer import IntVersionPostgresSaver
+    from engine.checkpoint_compaction import acollect_blob_content, acompact_thread
+    from engine.content_blobs import content_hash
+
+    conn = checkpoint_conn
+    thread_ids = [new_thread_id("pytest-content-blobs") for _ in range(2)]
+    saver = IntVersionPostgresSaver(conn=conn, content_blobs=ContentBlobStore())
+    type_, blob = saver.serde.dumps_typed(INSTRUCTIONS)
+    digest = content_hash(type_, blob)
+
+    async def refcount():
+        cur = await conn.execute(
+            "SELECT refcount FROM checkpoint_blob_content WHERE hash = %s", (digest,)
+        )
+        row = await cur.fetchone()
+        return row and row["refcount"]
+
+    for thread_id in thread_ids:
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+        await saver.aput(config, _checkpoint(1), {}, {"instructions": 1})
+        # Same content under a new version: a new reference, no new content
+        await saver.aput(config, _checkpoint(2), {}, {"instructions": 2})
+        result = await saver.aget_tuple(config)
+        assert result.checkpoint["channel_values"]["instructions"] == INSTRUCTIONS
+
+    assert await refcount() == 4
+    assert saver.content_blobs.stats["skipped"] == 3
+
+    await saver.adelete_thread(thread_ids[0])
+    assert await refcount() == 2
+
+    stats = await acompact_thread(
+        conn, thread_ids[1], keep_latest=1, min_age_seconds=0, apply=True
+    )
+    assert stats.blobs == 1
+    assert await refcount() == 1
+
+    await saver.adelete_thread(thread_ids[1])
+    assert await refcount() == 0
+    await acollect_blob_content(conn, grace_seconds=3600, apply=True)
+    assert await refcount() == 0
+    await acollect_blob_content(conn, grace_seconds=0, apply=True)
+    assert await refcount() is None
+
+
+async def test_unreferenced_content_is_revived_or_rejected(checkpoint_conn, new_thread_id):
+    from engine.checkpointer import IntVersionPostgresSaver
+    from engine.checkpoint_compaction import acollect_blob_content
+    from engine.content_blobs import INSERT_CONTENT_SQL, content_hash
+
+    conn = checkpoint_conn
+    thread_id = new_thread_id("pytest-content-blobs")
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    instructions = [f"Instrucoes {thread_id}. " * 100]
+    saver = IntVersionPostgresSaver(conn=conn, content_blobs=ContentBlobStore())
+    type_, blob = saver.serde.dumps_typed(instructions)
+    content = (content_hash(type_, blob), type_, blob)
+
+    async def unreferenced_for_hours():
+        await conn.execute(
+            "UPDATE checkpoint_blob_content SET zeroed_at = now() - interval '2 hours'"
+            " WHERE hash = %s",
+            content[:1],
+        )
+
+    async def stored() -> bool:
+        cur = await conn.execute(
+            "SELECT 1 FROM checkpoint_blob_content WHERE hash = %s", content[:1]
+        )
+        return await cur.fetchone() is not None
+
+    async def count(table: str) -> int:
+        cur = await conn.execute(
+            f"SELECT count(*) AS n FROM {table} WHERE thread_id = %s",  # noqa: S608
+            (thread_id,),
+        )
+        return (await cur.fetchone())["n"]
+
+    await saver.aput(config, _checkpoint(1, instructions), {}, {"instructions": 1})
+    await saver.adelete_thread(thread_id)
+    await unreferenced_for_hours()
+
+    # A saver that does not know the hash writes the content, then the collection runs
+    # before its reference is counted: the revived content is kept
+    await conn.execute(INSERT_CONTENT_SQL, content)
+    await acollect_blob_content(conn, grace_seconds=3600, apply=True)
+    assert await stored()
+
+    # A saver that still remembers the hash does not send the content
+    await unreferenced_for_hours()
+    await acollect_blob_content(conn, grace_seconds=3600, apply=True)
+    assert not await stored()
+    saver.content_blobs.remember([content])
+    with pytest.raises(RuntimeError, match="Missing content"):
+        await saver.aput(config, _checkpoint(2, instructions), {}, {"instructions": 2})
+    assert await count("checkpoints") == await count("checkpoint_blobs") == 0
+
+    # The hash was forgotten: the retry sends the content again
+    await saver.aput(config, _checkpoint(2, instructions), {}, {"instructions": 2})
+    result = await saver.aget_tuple(config)
+    assert result.checkpoint["channel_values"]["instructions"] == instructions
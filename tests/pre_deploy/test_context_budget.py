@@ -0,0 +1,118 @@
+"""
+Context budget tests.
+
+Verifies engine/context_budget.py and its use by the Agent's pre-model hook, without
+a database or model:
+  1. Long-term memory is compacted, then cut, to CONTEXT_MEMORY_MAX_TOKENS
+  2. Tool results are sent cut to CONTEXT_TOOL_RESULT_MAX_TOKENS (the state keeps
+     the full result) and the window counts them at the cap
+  3. The history gets what CONTEXT_MAX_INPUT_TOKENS leaves after the system prompt,
+     tool schemas and memory, and the allocation per section is recorded
+  4. By default no section is capped: memory and tool results are sent whole
+
+Run:
+  uv run pytest tests/pre_deploy/test_context_budget.py -v
+"""
+
+import json
+import uuid
+from datetime import timedelta
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from engine.context_budget import MEMORY_PREFIX, ContextBudget
+from engine.token_count import TokenCounter
+from tests.pre_deploy.test_history_scan import NOW, _history, _stamp
+
+
+def test_memory_is_compacted_then_cut():
+    counter = TokenCounter()
+    memory = {"nome": "Maria", "bairro": "Botafogo", "interesses": ["IPTU", "saude"] * 40}
+
+    content = ContextBudget(memory_tokens=0).memory_content(memory, counter)
+    assert content.startswith(f"{MEMORY_PREFIX}\n{{\n  ")
+
+    compact = ContextBudget(memory_tokens=200).memory_content(memory, counter)
+    assert compact.startswith(f'{MEMORY_PREFIX}\n{{"nome":"Maria"')
+    assert "truncated" not in compact
+
+    cut = ContextBudget(memory_tokens=50).memory_content(memory, counter)
+    assert cut.startswith(f'{MEMORY_PREFIX}\n{{"nome":"Maria"')
+    assert cut.endswith("characters truncated]")
+    assert len(cut) < 50 * 3 + 40
+
+
+def test_hook_fits_sections_in_the_ceiling(monkeypatch):
+    from engine.agent import Agent
+
+    monkeypatch.setenv("SHORT_MEMORY_TIME_LIMIT", "1")
+    monkeypatch.setenv("SHORT_MEMORY_TOKEN_LIMIT", "100000")
+    monkeypatch.setenv("CONTEXT_MAX_INPUT_TOKENS", "1500")
+    monkeypatch.setenv("CONTEXT_MEMORY_MAX_TOKENS", "200")
+    monkeypatch.setenv("CONTEXT_TOOL_RESULT_MAX_TOKENS", "300")
+    thread_id = f"pytest-context-budget-{uuid.uuid4()}"
+    config = {"configurable": {"thread_id": thread_id}}
+    agent = Agent(otpl_service="pytest", system_prompt="Voce e o assistente da Prefeitura do Rio. " * 20)
+    agent._memory_cache[thread_id] = {
+        "data": {"nome": "Maria", "historico": ["consulta"] * 500},
+        "timestamp": NOW + timedelta(days=1),
+    }
+
+    history = _history(60)
+    # The current turn called a tool that returned a large result
+    history += [
+        _stamp(
+            AIMessage(content="", tool_calls=[{"name": "search", "args": {}, "id": "big"}], id=str(uuid.uuid4())),
+            minutes_ago=0,
+        ),
+        _stamp(ToolMessage(content="resultado " * 5000, tool_call_id="big", id=str(uuid.uuid4())), minutes_ago=0),
+    ]
+    window = agent._combined_pre_model_hook({"messages": history}, config)["llm_input_messages"]
+
+    assert window[0].content.startswith(MEMORY_PREFIX)
+    assert window[-1].tool_call_id == "big"
+    assert window[-1].content.endswith("characters truncated]")
+    assert len(history[-1].content) == len("resultado " * 5000)
+
+    allocation = agent._context_allocations[thread_id]
+    fixed = agent._get_fixed_context_tokens()
+    assert allocation["system_tokens"] == fixed["system"] > 200
+    assert 0 < allocation["memory_tokens"] <= 200
+    assert allocation["tool_results_tokens"] <= 300
+    assert allocation["history_budget"] == 1500 - sum(fixed.values()) - allocation["memory_tokens"]
+    assert allocation["history_tokens"] + allocation["tool_results_tokens"] <= allocation["history_budget"]
+    assert allocation["total_tokens"] <= 1500
+    assert allocation["dropped_messages"] > 0
+
+
+def test_default_budget_caps_nothing(monkeypatch):
+    from engine.agent import Agent
+
+    for name in (
+        "CONTEXT_MAX_INPUT_TOKENS",
+        "CONTEXT_MEMORY_MAX_TOKENS",
+        "CONTEXT_SUMMARY_MAX_TOKENS",
+        "CONTEXT_TOOL_RESULT_MAX_TOKENS",
+    ):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("SHORT_MEMORY_TIME_LIMIT", "1")
+    monkeypatch.setenv("SHORT_MEMORY_TOKEN_LIMIT", "100000")
+    assert ContextBudget.from_env() == ContextBudget(0, 0, 0, 0)
+
+    thread_id = f"pytest-context-budget-{uuid.uuid4()}"
+    agent = Agent(otpl_service="pytest")
+    memory = {"nome": "Maria", "historico": ["consulta"] * 5000}
+    agent._memory_cache[thread_id] = {"data": memory, "timestamp": NOW + timedelta(days=1)}
+    history = _history(4) + [
+        _stamp(
+            AIMessage(content="", tool_calls=[{"name": "search", "args": {}, "id": "big"}], id=str(uuid.uuid4())),
+            minutes_ago=0,
+        ),
+        _stamp(ToolMessage(content="resultado " * 50000, tool_call_id="big", id=str(uuid.uuid4())), minutes_ago=0),
+    ]
+    window = agent._combined_pre_model_hook(
+        {"messages": history}, {"configurable": {"thread_id": thread_id}}
+    )["llm_input_messages"]
+
+    assert window[0].content == f"{MEMORY_PREFIX}\n{json.dumps(memory, indent=2, ensure_ascii=False)}"
+    assert window[-1].content == "resultado " * 50000
@@ -0,0 +1,212 @@
+"""
+Pre-model hook watermark tests.
+
+Verifies engine/history_scan.py and the Agent's pre-model hook without a database:
+  1. Only messages appended after the watermark are scanned; a history that no
+     longer matches the watermark is scanned again from the start
+  2. The window selected from the scan is the one of a full pass (time limit with
+     ordered and unordered timestamps, token budget)
+  3. Over a ReAct turn, the hook returns the same model input with and without
+     watermarks
+  4. Tool call / result pairs cut by the window are repaired from the ToolCallIndex,
+     in history order, and the graph runs every tool call once
+
+Run:
+  uv run pytest tests/pre_deploy/test_history_scan.py -v
+"""
+
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from engine.history_scan import HistoryScan
+from engine.token_count import TokenCounter, trim_to_token_budget
+
+NOW = datetime.now(timezone.utc)
+
+
+def _stamp(message, minutes_ago: float):
+    message.additional_kwargs["timestamp"] = (NOW - timedelta(minutes=minutes_ago)).isoformat()
+    return message
+
+
+def _turn(i: int, minutes_ago: float) -> list:
+    call_id = f"call-{i}-{uuid.uuid4().hex[:6]}"
+    return [
+        _stamp(HumanMessage(content=f"pergunta {i} " * (i % 4 + 1), id=str(uuid.uuid4())), minutes_ago),
+        _stamp(
+            AIMessage(
+                content="",
+                tool_calls=[{"name": "search", "args": {"query": f"q{i}"}, "id": call_id}],
+                id=str(uuid.uuid4()),
+            ),
+            minutes_ago,
+        ),
+        _stamp(ToolMessage(content='{"r": "' + "x" * (i * 7 % 90) + '"}', tool_call_id=call_id, id=str(uuid.uuid4())), minutes_ago),
+        _stamp(AIMessage(content=f"resposta {i} " * (i % 3 + 1), id=str(uuid.uuid4())), minutes_ago),
+    ]
+
+
+def _history(turns: int) -> list:
+    messages = [SystemMessage(content="LONG-TERM MEMORY:\n{}")]
+    for i in range(turns):
+        messages += _turn(i, minutes_ago=(turns - i) * 10)
+    return messages
+
+
+def test_only_new_messages_are_scanned(monkeypatch):
+    import engine.history_scan
+
+    parsed = []
+    message_time = engine.history_scan.message_time
+    monkeypatch.setattr(engine.history_scan, "message_time", lambda m: parsed.append(m) or message_time(m))
+
+    counter = TokenCounter()
+    messages = _history(10)
+    scan = HistoryScan()
+    assert len(scan.pending(messages)) == 40
+    scan.advance(messages, counter)
+    assert len(parsed) == 40
+
+    messages += _turn(10, minutes_ago=0)
+    assert scan.pending(messages) == messages[-4:]
+    scan.advance(messages, counter)
+    assert len(parsed) == 44
+
+    # The memory message is inserted before the conversation: positions do not move
+    messages.insert(0, SystemMessage(content="prompt"))
+    assert scan.pending(messages) == []
+
+    # Removed messages invalidate the watermark
+    del messages[5]
+    assert len(scan.pending(messages)) == 43
+    assert scan.rescans == 1
+
+
+def test_window_matches_full_pass():
+    counter = TokenCounter()
+    messages = _history(30)
+    # One message with an older timestamp than its neighbours: no longer a prefix cut
+    unordered = [m.model_copy(deep=True) for m in messages]
+    _stamp(unordered[60], minutes_ago=10_000)
+
+    for history in (messages, unordered):
+        scan = HistoryScan()
+        scan.advance(history, counter)
+        for max_age_minutes in (15, 95, 200, 10**6):
+            min_time = (NOW - timedelta(minutes=max_age_minutes)).timestamp()
+            expected_time = [
+                m for m in history[1:]
+                if datetime.fromisoformat(m.additional_kwargs["timestamp"]).timestamp() >= min_time
+            ]
+            within = scan.within_time(history, min_time)
+            assert list(within) == expected_time
+            for max_tokens in (0, 10, 120, 500, 5000):
+                assert scan.trim(within, max_tokens, counter) == trim_to_token_budget(
+                    expected_time, max_tokens, counter
+                ), (max_age_minutes, max_tokens)
+
+
+def test_hook_output_matches_without_watermarks(monkeypatch):
+    from engine.agent import Agent
+
+    monkeypatch.setenv("SHORT_MEMORY_TIME_LIMIT", "1")
+    monkeypatch.setenv("SHORT_MEMORY_TOKEN_LIMIT", "400")
+    thread_id = f"pytest-history-scan-{uuid.uuid4()}"
+    config = {"configurable": {"thread_id": thread_id}}
+
+    agents = []
+    for max_threads in ("1024", "0"):
+        monkeypatch.setenv("HISTORY_SCAN_MAX_THREADS", max_threads)
+        agent = Agent(otpl_service="pytest")
+        agent._history_scan(config)
+        agent._memory_cache[thread_id] = {"data": {"nome": "Maria"}, "timestamp": NOW + timedelta(days=1)}
+        agents.append(agent)
+
+    histories = [_history(40), None]
+    histories[1] = [m.model_copy(deep=True) for m in histories[0]]
+    for step in range(6):
+        for history in histories:
+            turn = _turn(100 + step, minutes_ago=0)
+            if step % 2 == 0:
+                history += turn[:1]
+            else:
+                # ToolMessages arrive without a timestamp: the hook stamps them
+                turn[2].additional_kwargs.pop("timestamp")
+                history += turn[1:3]
+        outputs = [
+            agent._combined_pre_model_hook({"messages": history}, config)["llm_input_messages"]
+            for agent, history in zip(agents, histories)
+        ]
+        assert [m.content for m in outputs[0]] == [m.content for m in outputs[1]], step
+        assert all("timestamp" in m.additional_kwargs for m in histories[0][1:])
+
+    assert agents[0]._history_scan(config).rescans == 0
+
+
+def test_tool_pairs_are_repaired_in_history_order():
+    from engine.agent import Agent
+    from engine.log import logger
+
+    agent = Agent(otpl_service="pytest")
+    history = _history(5)
+    scan = HistoryScan()
+    scan.advance(history, TokenCounter())
+    # Window cut between a tool call and its result, and a result without its call
+    call, result, answer, question = history[6], history[7], history[8], history[9]
+    assert scan.tool_calls.results[call.tool_calls[0]["id"]] == [6]
+
+    repaired = agent._ensure_complete_tool_pairs([call, answer, question], history, logger, scan=scan)
+    assert repaired == [call, result, answer, question]
+    repaired = agent._ensure_complete_tool_pairs([result, answer], history, logger, scan=scan)
+    assert repaired == [call, result, answer]
+
+    # Without ids, messages are located by identity (equal copies are distinct messages)
+    anonymous = [history[0]] + [m.model_copy(update={"id": None}) for m in history[1:]]
+    assert agent._ensure_complete_tool_pairs(
+        [anonymous[7], anonymous[8]], anonymous, logger
+    ) == anonymous[6:9]
+
+
+def test_graph_runs_tool_calls_once():
+    from itertools import cycle
+
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.tools import tool
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    from engine.agent import Agent
+    from engine.custom_react_agent import _validate_chat_history
+
+    calls = []
+
+    @tool
+    def echo(text: str) -> str:
+        """Echo text."""
+        calls.append(text)
+        return text
+
+    class StubChatModel(GenericFakeChatModel):
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+    agent = Agent(otpl_service="pytest", tools=[echo])
+    agent._llm = StubChatModel(
+        messages=cycle(
+            [
+                AIMessage(content="", tool_calls=[{"name": "echo", "args": {"text": "a"}, "id": "call-a"}]),
+                AIMessage(content="pronto"),
+            ]
+        )
+    )
+    graph = agent._create_react_agent(checkpointer=InMemorySaver())
+    config = {"configurable": {"thread_id": f"pytest-history-scan-{uuid.uuid4()}"}}
+    result = graph.invoke({"messages": [HumanMessage(content="oi")]}, config)
+
+    assert calls == ["a"]
+    assert result["messages"][-1].content == "pronto"
+    _validate_chat_history(result["messages"])
+    with pytest.raises(ValueError, match="call-a"):
+        _validate_chat_history(result["messages"][:2])
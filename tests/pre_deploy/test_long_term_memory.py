@@ -0,0 +1,179 @@
+"""
+Long-term memory tests.
+
+Verifies the long-term memory stage of the pre-model hook on the async graph, with a
+stub get_user_memory tool and model:
+  1. Memory is fetched with the tool and injected as a SystemMessage
+  2. A fetch slower than LONG_TERM_MEMORY_TIMEOUT_SECONDS falls back to the cached
+     memory and completes in the background; concurrent calls share one fetch
+  3. async_query and async_stream_query start the fetch when the request arrives,
+     concurrently with the setup, and the hook consumes the same fetch
+  4. With CHECKPOINT_MESSAGE_STORE, refreshes replace the one stored memory message:
+     a thread reloaded by a fresh saver has a single, current memory message
+
+Run:
+  uv run pytest tests/pre_deploy/test_long_term_memory.py -v
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+from itertools import count
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+
+
+class SpyChatModel(GenericFakeChatModel):
+    inputs: list = []
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, *args, **kwargs):
+        self.inputs.append(messages)
+        return super()._generate(messages, *args, **kwargs)
+
+
+def _agent(memory_tool, checkpointer=None):
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    from engine.agent import Agent
+
+    agent = Agent(otpl_service="pytest", tools=[memory_tool])
+    # A new AIMessage per call: the model assigns each one its own id
+    agent._llm = SpyChatModel(messages=iter(lambda: AIMessage(content="ok"), None), inputs=[])
+    return agent, agent._create_react_agent(checkpointer=checkpointer or InMemorySaver())
+
+
+def _memory(messages) -> str:
+    return next(m.content for m in messages if m.content.startswith("LONG-TERM MEMORY:"))
+
+
+async def test_async_graph_injects_fetched_memory():
+    calls = []
+
+    @tool
+    async def get_user_memory(user_id: str) -> dict:
+        """Stub memory service."""
+        calls.append(user_id)
+        return {"nome": "Maria"}
+
+    agent, graph = _agent(get_user_memory)
+    thread_id = f"pytest-memory-{uuid.uuid4()}"
+    config = {"configurable": {"thread_id": thread_id}}
+    await graph.ainvoke({"messages": [HumanMessage(content="oi")]}, config)
+    await graph.ainvoke({"messages": [HumanMessage(content="tudo bem?")]}, config)
+
+    assert calls == [thread_id]  # the second turn reads the cache
+    assert all('"nome": "Maria"' in _memory(messages) for messages in agent._llm.inputs)
+
+
+async def test_slow_fetch_falls_back_to_cache(monkeypatch):
+    monkeypatch.setenv("LONG_TERM_MEMORY_TIMEOUT_SECONDS", "0.05")
+    release = asyncio.Event()
+    calls = []
+
+    @tool
+    async def get_user_memory(user_id: str) -> dict:
+        """Stub memory service."""
+        calls.append(user_id)
+        await release.wait()
+        return {"nome": "Maria Silva"}
+
+    agent, graph = _agent(get_user_memory)
+    thread_ids = [f"pytest-memory-{uuid.uuid4()}" for _ in range(2)]
+    stale = datetime.now(timezone.utc) - timedelta(hours=1)
+    agent._memory_cache[thread_ids[0]] = {"data": {"nome": "Maria"}, "timestamp": stale}
+
+    config = {"configurable": {"thread_id": thread_ids[0]}}
+    await asyncio.gather(
+        *(graph.ainvoke({"messages": [HumanMessage(content=f"oi {i}")]}, config) for i in range(3))
+    )
+    assert calls == [thread_ids[0]]
+    assert all('"nome": "Maria"' in _memory(messages) for messages in agent._llm.inputs)
+
+    # Without a cached copy the model is called without memory
+    await graph.ainvoke(
+        {"messages": [HumanMessage(content="oi")]}, {"configurable": {"thread_id": thread_ids[1]}}
+    )
+    assert not any(m.content.startswith("LONG-TERM MEMORY:") for m in agent._llm.inputs[-1])
+
+    release.set()
+    await asyncio.sleep(0.05)
+    assert agent._memory_cache[thread_ids[0]]["data"] == {"nome": "Maria Silva"}
+    assert agent._memory_cache[thread_ids[1]]["data"] == {"nome": "Maria Silva"}
+    assert agent._loop_resources().memory_fetches == {}
+
+
+async def test_query_prefetches_memory_during_setup():
+    from engine.agent import _LoopResources
+
+    fetch_started = asyncio.Event()
+    calls = []
+
+    @tool
+    async def get_user_memory(user_id: str) -> dict:
+        """Stub memory service."""
+        calls.append(user_id)
+        fetch_started.set()
+        return {"nome": "Maria"}
+
+    agent, graph = _agent(get_user_memory)
+
+    async def ensure_async_setup():
+        # The checkpoint read / pool setup of a real request: the fetch runs meanwhile
+        await asyncio.wait_for(fetch_started.wait(), timeout=1)
+        return _LoopResources(graph=graph, ready=True)
+
+    agent._ensure_async_setup = ensure_async_setup
+    thread_ids = [f"pytest-memory-{uuid.uuid4()}" for _ in range(2)]
+    await agent.async_query(
+        input={"messages": [{"role": "human", "content": "oi"}]},
+        config={"configurable": {"thread_id": thread_ids[0]}},
+    )
+    fetch_started.clear()
+    stream = await agent.async_stream_query(
+        input={"messages": [{"role": "human", "content": "oi"}]},
+        config={"configurable": {"thread_id": thread_ids[1]}},
+    )
+    assert [chunk async for chunk in stream]
+
+    assert calls == thread_ids
+    assert all('"nome": "Maria"' in _memory(messages) for messages in agent._llm.inputs)
+
+
+async def test_memory_refreshes_keep_one_stored_message(checkpoint_pool, new_thread_id):
+    from engine.agent import MEMORY_MESSAGE_ID
+    from engine.checkpointer import IntVersionPostgresSaver
+    from engine.message_store import HistoryWindow
+
+    versions = count(1)
+
+    @tool
+    async def get_user_memory(user_id: str) -> dict:
+        """Stub memory service."""
+        return {"nome": "Maria", "versao": next(versions)}
+
+    def saver():
+        window = HistoryWindow(max_messages=4)
+        return IntVersionPostgresSaver(conn=checkpoint_pool, message_store=True, history_window=window)
+
+    thread_id = new_thread_id("pytest-memory")
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    agent, graph = _agent(get_user_memory, checkpointer=saver())
+    for i in range(4):
+        agent._memory_needs_refresh = True
+        await graph.ainvoke({"messages": [HumanMessage(content=f"oi {i}")]}, config)
+
+    # A fresh saver (another replica, a restart) loads the thread from the table
+    loaded = (await saver().aget_tuple(config)).checkpoint["channel_values"]["messages"]
+    memory = [m for m in loaded if m.type == "system"]
+    assert [m.id for m in memory] == [MEMORY_MESSAGE_ID]
+    assert '"versao": 4' in memory[0].content
+
+    agent, graph = _agent(get_user_memory, checkpointer=saver())
+    await graph.ainvoke({"messages": [HumanMessage(content="oi de novo")]}, config)
+    assert '"versao": 5' in _memory(agent._llm.inputs[-1])
+    assert sum(m.content.startswith("LONG-TERM MEMORY:") for m in agent._llm.inputs[-1]) == 1
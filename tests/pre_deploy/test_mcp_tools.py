@@ -0,0 +1,137 @@
+"""
+MCP tool snapshot tests.
+
+Verifies the tool catalogue snapshot of engine/mcp_tools.py without an MCP server:
+  1. The catalogue version ignores tool order and changes with any schema
+  2. Snapshot files round-trip, and corrupt or tampered files are ignored
+  3. The Agent builds its tools from a snapshot without calling tools/list, and the
+     background refresh swaps the graph (and the memory tool) only when the catalogue
+     changed
+
+Run:
+  uv run pytest tests/pre_deploy/test_mcp_tools.py -v
+"""
+
+import json
+
+import pytest
+
+from engine.mcp_tools import (
+    load_tool_snapshot,
+    make_tool_snapshot,
+    save_tool_snapshot,
+    tool_catalogue_version,
+)
+
+
+def _spec(name: str, description: str = "") -> dict:
+    return {
+        "name": name,
+        "description": description or f"Tool {name}",
+        "inputSchema": {
+            "type": "object",
+            "properties": {"query": {"type": "string"}},
+            "required": ["query"],
+        },
+    }
+
+
+@pytest.fixture
+def mcp_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("MCP_SERVER_URL", "http://mcp.invalid/mcp")
+    monkeypatch.setenv("MCP_API_TOKEN", "token")
+    monkeypatch.setenv("MCP_EXCLUDED_TOOLS", "excluded")
+    monkeypatch.setenv("MCP_TOOL_SNAPSHOT_PATH", str(tmp_path / "tools.json"))
+    return tmp_path / "tools.json"
+
+
+def test_catalogue_version_is_order_independent():
+    specs = [_spec("a"), _spec("b")]
+    assert tool_catalogue_version(specs) == tool_catalogue_version(specs[::-1])
+    assert tool_catalogue_version(specs) != tool_catalogue_version([_spec("a"), _spec("b", "new")])
+
+
+def test_snapshot_file_round_trip(tmp_path):
+    path = str(tmp_path / "tools.json")
+    snapshot = make_tool_snapshot([_spec("a")])
+    save_tool_snapshot(snapshot, path)
+    assert load_tool_snapshot(path) == snapshot
+
+    snapshot["tools"].append(_spec("b"))
+    with open(path, "w") as f:
+        json.dump(snapshot, f)
+    assert load_tool_snapshot(path) is None
+
+    with open(path, "w") as f:
+        f.write("{not json")
+    assert load_tool_snapshot(path) is None
+    assert load_tool_snapshot(str(tmp_path / "missing.json")) is None
+
+
+async def test_agent_uses_snapshot_and_refreshes(monkeypatch, mcp_env):
+    import engine.mcp_tools
+    from engine.agent import Agent
+
+    deployed = make_tool_snapshot([_spec("search"), _spec("excluded"), _spec("get_user_memory")])
+    live = make_tool_snapshot(
+        [_spec("search"), _spec("excluded"), _spec("weather"), _spec("get_user_memory", "new")]
+    )
+
+    async def unreachable(url=None, token=None):
+        raise ConnectionError("tools/list must not be called")
+
+    monkeypatch.setattr(engine.mcp_tools, "fetch_tool_snapshot", unreachable)
+    agent = Agent(otpl_service="pytest", tool_snapshot=deployed)
+    tools = await agent._load_mcp_tools()
+    assert [t.name for t in tools] == ["search", "get_user_memory"]
+    assert tools[0].args_schema["required"] == ["query"]
+    agent._tools = tools
+    old_memory_tool = agent._get_user_memory_tool()
+
+    # Refresh failures keep the snapshot
+    assert await agent._refresh_tools() is False
+    assert agent.tool_catalogue_report()["version"] == deployed["version"]
+    assert agent.tool_catalogue_report()["errors"] == 1
+
+    async def fetch_live(url=None, token=None):
+        return live
+
+    built = []
+
+    def create_react_agent(checkpointer=None, tools=None, llm=None):
+        built.append([t.name for t in tools])
+        return object()
+
+    monkeypatch.setattr(engine.mcp_tools, "fetch_tool_snapshot", fetch_live)
+    monkeypatch.setattr(agent, "_create_react_agent", create_react_agent)
+    resources = agent._loop_resources()
+    old_graph = resources.graph = object()
+    assert await agent._refresh_tools() is True
+    assert built == [["search", "weather", "get_user_memory"]]
+    assert resources.graph is not old_graph
+    assert agent._get_user_memory_tool() is not old_memory_tool
+    assert agent._get_user_memory_tool().description == "new"
+    report = agent.tool_catalogue_report()
+    assert (report["version"], report["tools"], report["changes"]) == (live["version"], 3, 1)
+    assert report["last_refresh_ms"] is not None
+    assert load_tool_snapshot(str(mcp_env))["version"] == live["version"]
+
+    # Unchanged catalogue: no rebuild
+    assert await agent._refresh_tools() is False
+    assert len(built) == 1
+
+    # A new replica prefers the cached catalogue over the one pickled at deploy
+    assert [t.name for t in await Agent(tool_snapshot=deployed)._load_mcp_tools()] == [
+        "search",
+        "weather",
+        "get_user_memory",
+    ]
+
+
+def test_diff_tool_snapshots():
+    from engine.mcp_tools import diff_tool_snapshots
+
+    old = make_tool_snapshot([_spec("a"), _spec("b"), _spec("c")])
+    new = make_tool_snapshot([_spec("a"), _spec("b", "new"), _spec("d")])
+    assert diff_tool_snapshots(old, new) == {"added": ["d"], "removed": ["c"], "changed": ["b"]}
+    assert diff_tool_snapshots(None, new)["added"] == ["a", "b", "d"]
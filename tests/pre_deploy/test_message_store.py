@@ -0,0 +1,215 @@
+"""
+Message store tests.
+
+Verifies the optional thread_messages backend of IntVersionPostgresSaver:
+  1. Only the configured tail window is loaded by aget_tuple
+  2. ToolMessages at the head of the window keep the AIMessage that called them
+  3. The full history is still available through aget_full_history
+  4. Old messages are archived without changing the window and rehydrated on request
+  5. Writes only send new messages, and messages re-stamped or replaced in place
+     under the same id
+  6. Concurrent writers of a thread (replicas, double-sent messages) do not collide on seq
+
+Run:
+  uv run pytest tests/pre_deploy/test_message_store.py -v
+"""
+
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.base.id import uuid6
+
+
+def _conversation(turns: int) -> list:
+    messages = []
+    for i in range(turns):
+        call_id = f"call-{i}"
+        messages += [
+            HumanMessage(content=f"pergunta {i}", id=str(uuid.uuid4())),
+            AIMessage(
+                content="",
+                tool_calls=[{"name": "busca", "args": {}, "id": call_id}],
+                id=str(uuid.uuid4()),
+            ),
+            ToolMessage(content=f"resultado {i}", tool_call_id=call_id, id=str(uuid.uuid4())),
+            AIMessage(content=f"resposta {i}", id=str(uuid.uuid4())),
+        ]
+    return messages
+
+
+def _checkpoint(messages: list, version: int) -> dict:
+    return {
+        "v": 1,
+        "id": str(uuid6()),
+        "ts": "2024-01-01T00:00:00+00:00",
+        "pending_sends": [],
+        "versions_seen": {},
+        "channel_versions": {"messages": version},
+        "channel_values": {"messages": messages},
+    }
+
+
+def test_history_window_from_env(monkeypatch):
+    from engine.message_store import HistoryWindow
+
+    monkeypatch.setenv("CHECKPOINT_HISTORY_MAX_MESSAGES", "40")
+    monkeypatch.setenv("CHECKPOINT_HISTORY_MAX_AGE", "0.5")
+    monkeypatch.delenv("CHECKPOINT_HISTORY_MAX_TOKENS", raising=False)
+
+    window = HistoryWindow.from_env()
+
+    assert window.max_messages == 40
+    assert window.max_age_seconds == 43200
+    assert window.max_tokens is None
+    assert not window.is_unbounded
+    assert HistoryWindow().is_unbounded
+
+
+async def test_message_store_loads_tail_with_tool_partners(checkpoint_pool, new_thread_id):
+    from engine.checkpointer import IntVersionPostgresSaver
+    from engine.message_store import HistoryWindow
+
+    thread_id = new_thread_id("pytest-message-store")
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    messages = _conversation(5)
+    saver = IntVersionPostgresSaver(
+        conn=checkpoint_pool,
+        message_store=True,
+        history_window=HistoryWindow(max_messages=2),
+    )
+
+    # Two writes: the second one only appends the last turn
+    await saver.aput(config, _checkpoint(messages[:-4], 1), {}, {"messages": 1})
+    await saver.aput(config, _checkpoint(messages, 2), {}, {"messages": 2})
+
+    result = await saver.aget_tuple(config)
+    window = result.checkpoint["channel_values"]["messages"]
+
+    # Last two messages are ToolMessage + AIMessage; the window must be
+    # extended back to the AIMessage that issued the tool call.
+    assert [m.id for m in window] == [m.id for m in messages[-3:]]
+
+    full = await saver.aget_full_history(config)
+    assert [m.id for m in full] == [m.id for m in messages]
+
+
+async def test_message_store_is_append_only_and_filters_by_age(checkpoint_pool, new_thread_id):
+    from datetime import datetime, timedelta, timezone
+
+    from engine.checkpointer import IntVersionPostgresSaver
+    from engine.message_store import HistoryWindow
+
+    thread_id = new_thread_id("pytest-message-store")
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    messages = _conversation(3)
+    old = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+    for message in messages[:4]:
+        message.additional_kwargs["timestamp"] = old
+
+    saver = IntVersionPostgresSaver(
+        conn=checkpoint_pool,
+        message_store=True,
+        history_window=HistoryWindow(max_age_seconds=7 * 86400),
+    )
+    await saver.aput(config, _checkpoint(messages, 1), {}, {"messages": 1})
+
+    # Same messages again, one of them stamped in place by a hook
+    messages[-1].additional_kwargs["timestamp"] = datetime.now(timezone.utc).isoformat()
+    await saver.aput(config, _checkpoint(messages, 2), {}, {"messages": 2})
+
+    async with checkpoint_pool.connection() as conn:
+        cur = await conn.execute(
+            "SELECT count(*), max(seq), count(ts) FROM thread_messages WHERE thread_id = %s",
+            (thread_id,),
+        )
+        count, last_seq, stamped = await cur.fetchone()
+    assert (count, last_seq, stamped) == (len(messages), len(messages), 5)
+
+    result = await saver.aget_tuple(config)
+    window = result.checkpoint["channel_values"]["messages"]
+    assert [m.id for m in window] == [m.id for m in messages[4:]]
+
+    # A message replaced under the same id (same timestamp) is rewritten in place
+    messages[-1] = messages[-1].model_copy(update={"content": "resposta editada"})
+    await saver.aput(config, _checkpoint(messages, 3), {}, {"messages": 3})
+    full = await IntVersionPostgresSaver(conn=checkpoint_pool, message_store=True).aget_full_history(config)
+    assert [m.content for m in full[-2:]] == ["resultado 2", "resposta editada"]
+    assert len(full) == len(messages)
+
+
+async def test_concurrent_writers_of_a_thread_get_distinct_seqs(checkpoint_pool, new_thread_id):
+    import asyncio
+
+    from engine.checkpointer import IntVersionPostgresSaver
+
+    thread_id = new_thread_id("pytest-message-store")
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    # Two replicas, each appending its own turns to the same thread at once
+    savers = [IntVersionPostgresSaver(conn=checkpoint_pool, message_store=True) for _ in range(2)]
+    histories = [[], []]
+
+    for version in range(1, 6):
+        for history in histories:
+            history += _conversation(1)
+        await asyncio.gather(
+            *(
+                saver.aput(config, _checkpoint(history, version), {}, {"messages": version})
+                for saver, history in zip(savers, histories)
+            )
+        )
+
+    async with checkpoint_pool.connection() as conn:
+        cur = await conn.execute(
+            "SELECT count(*), count(DISTINCT message_id), max(seq) FROM thread_messages"
+            " WHERE thread_id = %s",
+            (thread_id,),
+        )
+        assert await cur.fetchone() == (40, 40, 40)
+
+
+async def test_archived_messages_are_rehydrated_on_request(
+    checkpoint_pool, checkpoint_conn, new_thread_id
+):
+    from datetime import datetime, timedelta, timezone
+
+    from engine.checkpointer import IntVersionPostgresSaver
+    from engine.message_archive import aarchive_thread
+    from engine.message_store import HistoryWindow
+
+    thread_id = new_thread_id("pytest-message-store")
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    messages = _conversation(3)
+    old = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+    for message in messages[:6]:
+        message.additional_kwargs["timestamp"] = old
+
+    saver = IntVersionPostgresSaver(
+        conn=checkpoint_pool,
+        message_store=True,
+        history_window=HistoryWindow(max_age_seconds=7 * 86400),
+    )
+    await saver.aput(config, _checkpoint(messages, 1), {}, {"messages": 1})
+    before = (await saver.aget_tuple(config)).checkpoint["channel_values"]["messages"]
+
+    stats = await aarchive_thread(
+        checkpoint_conn, thread_id, older_than_seconds=7 * 86400, batch_size=2
+    )
+    cur = await checkpoint_conn.execute(
+        "SELECT count(*) AS n FROM thread_messages WHERE thread_id = %s", (thread_id,)
+    )
+    remaining = (await cur.fetchone())["n"]
+
+    # The AIMessage whose tool call is answered after the cutoff stays hot
+    assert (stats.messages, stats.segments) == (5, 3)
+    assert remaining == len(messages) - 5
+
+    after = (await saver.aget_tuple(config)).checkpoint["channel_values"]["messages"]
+    assert [m.id for m in after] == [m.id for m in before]
+
+    hot = await saver.aget_full_history(config)
+    assert [m.id for m in hot] == [m.id for m in messages[5:]]
+    full = await saver.aget_full_history(config, include_archived=True)
+    assert [m.id for m in full] == [m.id for m in messages]
+
+    await saver.adelete_thread(thread_id)
+    assert await saver.aget_full_history(config, include_archived=True) == []
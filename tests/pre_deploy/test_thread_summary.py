@@ -0,0 +1,104 @@
+"""
+Rolling conversation summary tests.
+
+Verifies engine/thread_summary.py and its use by the Agent's pre-model hook:
+  1. The hook records the messages dropped before the window that the summary does
+     not cover yet (bounded by CONVERSATION_SUMMARY_MAX_INPUT_TOKENS) and adds the
+     summary after the SystemMessages of the model input
+  2. An update folds the pending messages into the previous summary with one model
+     call
+  3. A stored summary is only replaced by one covering later messages, and is
+     deleted with the thread
+
+Run:
+  uv run pytest tests/pre_deploy/test_thread_summary.py -v
+"""
+
+import uuid
+from datetime import timedelta
+
+from langchain_core.messages import AIMessage
+
+from engine.thread_summary import SUMMARY_PREFIX, PendingBatch, ThreadSummary
+from tests.pre_deploy.test_history_scan import NOW, _history
+
+
+def test_hook_records_dropped_messages_and_adds_summary(monkeypatch):
+    from engine.agent import Agent
+
+    monkeypatch.setenv("CONVERSATION_SUMMARY", "true")
+    monkeypatch.setenv("CONVERSATION_SUMMARY_MIN_MESSAGES", "4")
+    monkeypatch.setenv("SHORT_MEMORY_TIME_LIMIT", "1")
+    monkeypatch.setenv("SHORT_MEMORY_TOKEN_LIMIT", "200")
+    thread_id = f"pytest-thread-summary-{uuid.uuid4()}"
+    config = {"configurable": {"thread_id": thread_id}}
+    agent = Agent(otpl_service="pytest")
+    agent._memory_cache[thread_id] = {"data": {"nome": "Maria"}, "timestamp": NOW + timedelta(days=1)}
+    summaries = agent._get_thread_summaries()
+
+    history = _history(30)
+    window = agent._combined_pre_model_hook({"messages": history}, config)["llm_input_messages"]
+    assert not any(m.content.startswith(SUMMARY_PREFIX) for m in window)
+    conversation = window[1:]
+    first = history.index(conversation[0])
+    batch = summaries.take_pending(thread_id)
+    assert batch.messages == history[1:first]
+
+    # Only what the summary does not cover yet is pending; the summary is added
+    covered = history[40]
+    summaries.put(thread_id, ThreadSummary("- Maria pediu o IPTU", covered.id, NOW - timedelta(minutes=100)))
+    window = agent._combined_pre_model_hook({"messages": history}, config)["llm_input_messages"]
+    assert [m.content for m in window[:2]] == [history[0].content, f"{SUMMARY_PREFIX}\n- Maria pediu o IPTU"]
+    assert window[2:] == conversation
+    assert summaries.take_pending(thread_id).messages == history[41:first]
+
+    # At most CONVERSATION_SUMMARY_MAX_INPUT_TOKENS of the most recent dropped messages
+    agent._summary_options = None
+    monkeypatch.setenv("CONVERSATION_SUMMARY_MAX_INPUT_TOKENS", "60")
+    agent._combined_pre_model_hook({"messages": history}, config)
+    batch = summaries.take_pending(thread_id)
+    assert batch.messages and batch.messages[-1] is history[first - 1]
+    assert len(batch.messages) < first - 41
+
+
+async def test_update_folds_pending_messages():
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+
+    from engine.thread_summary import asummarize
+
+    prompts = []
+
+    class RecordingChatModel(GenericFakeChatModel):
+        async def ainvoke(self, input, *args, **kwargs):
+            prompts.append(input[0].content)
+            return await super().ainvoke(input, *args, **kwargs)
+
+    history = _history(3)
+    batch = PendingBatch(history[1:], NOW)
+    previous = ThreadSummary("- Maria mora em Botafogo", "older", NOW - timedelta(days=1))
+    llm = RecordingChatModel(messages=iter([AIMessage(content="  - Maria perguntou 3 vezes\n")]))
+
+    summary = await asummarize(llm, previous, batch, max_tokens=100)
+    assert summary == ThreadSummary("- Maria perguntou 3 vezes", history[-1].id, NOW)
+    assert "- Maria mora em Botafogo" in prompts[0]
+    assert "User: pergunta 2" in prompts[0]
+    assert "Assistant called search" in prompts[0]
+
+
+async def test_summary_only_moves_forward(checkpoint_conn, new_thread_id):
+    from engine.checkpointer import IntVersionPostgresSaver
+    from engine.thread_summary import aload_summary, asave_summary
+
+    conn = checkpoint_conn
+    thread_id = new_thread_id("pytest-thread-summary")
+    newer = ThreadSummary("newer", "m2", NOW)
+    await asave_summary(conn, thread_id, newer)
+    await asave_summary(conn, thread_id, ThreadSummary("older", "m1", NOW - timedelta(minutes=1)))
+    assert await aload_summary(conn, thread_id) == newer
+
+    latest = ThreadSummary("latest", "m3", NOW + timedelta(minutes=1))
+    await asave_summary(conn, thread_id, latest)
+    assert await aload_summary(conn, thread_id) == latest
+
+    await IntVersionPostgresSaver(conn=conn).adelete_thread(thread_id)
+    assert await aload_summary(conn, thread_id) is None
@@ -0,0 +1,97 @@
+"""
+Token accounting tests.
+
+Verifies engine/token_count.py without a database or model:
+  1. AI messages count the output tokens reported by the model, others are estimated
+     (JSON at its own ratio), and counts are cached in the message
+  2. Cached estimates are recounted when the ratios change, usage counts never are,
+     and the cache survives the checkpoint serializer
+  3. trim_to_token_budget keeps the same window as langchain's trim_messages
+
+Run:
+  uv run pytest tests/pre_deploy/test_token_count.py -v
+"""
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from engine.token_count import TOKEN_COUNT_KEY, TokenCounter, trim_to_token_budget
+
+
+def _conversation(turns: int) -> list:
+    messages = [SystemMessage(content="Voce e o assistente da Prefeitura do Rio.")]
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"Pergunta {i} " * (i % 5 + 1)))
+        if i % 2:
+            messages.append(
+                AIMessage(
+                    content="",
+                    tool_calls=[{"name": "search", "args": {"query": f"q{i}"}, "id": f"call-{i}"}],
+                )
+            )
+            messages.append(ToolMessage(content='{"results": ["a", "b"]}' * i, tool_call_id=f"call-{i}"))
+        messages.append(AIMessage(content=f"Resposta {i} " * (i % 3 + 1)))
+    return messages
+
+
+def test_usage_and_estimates_are_cached():
+    counter = TokenCounter(chars_per_token=4, json_chars_per_token=2)
+
+    answer = AIMessage(
+        content="x" * 400,
+        usage_metadata={
+            "input_tokens": 1000,
+            "output_tokens": 130,
+            "total_tokens": 1130,
+            "output_token_details": {"reasoning": 30},
+        },
+    )
+    assert counter.count(answer) == 100  # thoughts are not part of the history
+    assert answer.additional_kwargs[TOKEN_COUNT_KEY] == {"n": 100, "by": "usage"}
+
+    assert counter.count(HumanMessage(content="x" * 40)) == 10
+    assert counter.count(ToolMessage(content='{"a": "' + "x" * 31 + '"}', tool_call_id="1")) == 20
+
+    # A cached estimate is read back, not recomputed
+    question = HumanMessage(content="x" * 40)
+    question.additional_kwargs[TOKEN_COUNT_KEY] = {"n": 7, "by": counter.name}
+    assert counter.count(question) == 7
+
+
+def test_cache_follows_counter_and_serializer():
+    from engine.checkpoint_codec import CompressingSerializer
+
+    old, new = TokenCounter(chars_per_token=4), TokenCounter(chars_per_token=2)
+    question = HumanMessage(content="x" * 40)
+    answer = AIMessage(
+        content="x" * 40, usage_metadata={"input_tokens": 1, "output_tokens": 3, "total_tokens": 4}
+    )
+    assert (old.count(question), old.count(answer)) == (10, 3)
+    assert (new.count(question), new.count(answer)) == (20, 3)
+
+    serde = CompressingSerializer()
+    loaded = serde.loads_typed(serde.dumps_typed([question, answer]))
+    assert [m.additional_kwargs[TOKEN_COUNT_KEY]["n"] for m in loaded] == [20, 3]
+
+
+def test_trim_matches_trim_messages():
+    from langchain_core.messages import trim_messages
+
+    counter = TokenCounter()
+
+    def token_counter(messages):
+        return sum(counter.count(m) for m in messages)
+
+    messages = _conversation(40)
+    total = token_counter(messages)
+    for max_tokens in (0, 5, 37, 100, total // 3, total // 2, total - 1, total, total + 10):
+        expected = trim_messages(
+            messages,
+            max_tokens=max_tokens,
+            strategy="last",
+            token_counter=token_counter,
+            start_on="human",
+            end_on=["human", "tool"],
+            include_system=False,
+            allow_partial=False,
+        )
+        assert trim_to_token_budget(messages, max_tokens, counter) == expected, max_tokens